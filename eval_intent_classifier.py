@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+本機問題分類器的離線評估與訓練
+
+以 classify_and_extract 記錄的 LLM 分類結果（CLASSIFY_LOG_FILE）評估本機分類器：
+- 依時間順序切出最後一部分作為測試資料，其餘用來訓練字元 n-gram 模型
+- 回報各欄位與 LLM 的一致率（全部問題、以及信心達門檻而會直接採用的問題）
+- 回報本機分類可涵蓋的比例與延遲，並與記錄中的 LLM 延遲比較
+
+用法：
+    python eval_intent_classifier.py                      # 評估
+    python eval_intent_classifier.py --rules-only         # 只評估規則
+    python eval_intent_classifier.py --save               # 以全部記錄訓練並寫入 FAST_CLASSIFY_MODEL
+"""
+
+import argparse
+import sys
+import time
+from typing import Dict, List
+
+from langgraph_app.nodes.classify_and_extract import CLASSIFY_LOG_FILE
+from langgraph_app.nodes.fast_classifier import (
+    FAST_CLASSIFY_MODEL,
+    FAST_CLASSIFY_THRESHOLD,
+    LABEL_FIELDS,
+    FastIntentClassifier,
+    load_classify_log,
+    save_intent_model,
+    train_intent_model
+)
+
+# 比對一致率的欄位；清單欄位以集合比較
+EVAL_FIELDS = LABEL_FIELDS + ["stock_id", "company_name"]
+
+def _same(field: str, predicted, expected) -> bool:
+    if isinstance(expected, list) or isinstance(predicted, list):
+        return set(predicted or []) == set(expected or [])
+    return str(predicted or "").strip() == str(expected or "").strip()
+
+def _percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+def evaluate(classifier: FastIntentClassifier, records: List[Dict]) -> Dict:
+    """
+    以 LLM 的結果為標準答案評估本機分類器
+
+    Returns:
+        {"total", "confident", "agreement", "confident_agreement", "all_fields", "confident_all_fields",
+         "local_ms": {p50, p95}, "llm_ms": {p50, p95}}
+    """
+    agreement = {field: 0 for field in EVAL_FIELDS}
+    confident_agreement = {field: 0 for field in EVAL_FIELDS}
+    all_fields = confident_all_fields = confident = 0
+    local_ms = []
+    for record in records:
+        started = time.perf_counter()
+        predicted, confidence = classifier.classify(record["question"])
+        local_ms.append((time.perf_counter() - started) * 1000)
+        is_confident = confidence >= classifier.threshold
+        confident += is_confident
+        matches = [_same(field, predicted.get(field), record["result"].get(field)) for field in EVAL_FIELDS]
+        for field, matched in zip(EVAL_FIELDS, matches):
+            agreement[field] += matched
+            confident_agreement[field] += matched and is_confident
+        all_fields += all(matches)
+        confident_all_fields += all(matches) and is_confident
+    llm_ms = [record["latency_ms"] for record in records if record.get("latency_ms")]
+    return {
+        "total": len(records),
+        "confident": confident,
+        "agreement": agreement,
+        "confident_agreement": confident_agreement,
+        "all_fields": all_fields,
+        "confident_all_fields": confident_all_fields,
+        "local_ms": {"p50": _percentile(local_ms, 0.5), "p95": _percentile(local_ms, 0.95)},
+        "llm_ms": {"p50": _percentile(llm_ms, 0.5), "p95": _percentile(llm_ms, 0.95)},
+    }
+
+def print_report(report: Dict) -> None:
+    total = report["total"] or 1
+    confident = report["confident"] or 1
+    print(f"📊 測試問題: {report['total']} 則，信心達門檻（直接採用）: {report['confident']} 則 ({report['confident'] / total:.1%})")
+    print(f"{'欄位':<14}{'全部一致率':>12}{'採用時一致率':>14}")
+    for field in EVAL_FIELDS:
+        print(f"{field:<14}{report['agreement'][field] / total:>12.1%}{report['confident_agreement'][field] / confident:>14.1%}")
+    print(f"{'全部欄位':<14}{report['all_fields'] / total:>12.1%}{report['confident_all_fields'] / confident:>14.1%}")
+    print(f"⏱️ 本機分類延遲: p50 {report['local_ms']['p50']:.2f} ms，p95 {report['local_ms']['p95']:.2f} ms")
+    if report["llm_ms"]["p50"]:
+        print(f"⏱️ LLM 分類延遲（記錄）: p50 {report['llm_ms']['p50']:.0f} ms，p95 {report['llm_ms']['p95']:.0f} ms")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="評估與訓練本機問題分類器")
+    parser.add_argument("--log", default=CLASSIFY_LOG_FILE, help="LLM 分類記錄（JSON Lines）")
+    parser.add_argument("--test-ratio", type=float, default=0.2, help="最後多少比例的記錄作為測試資料")
+    parser.add_argument("--threshold", type=float, default=FAST_CLASSIFY_THRESHOLD, help="直接採用本機結果的信心門檻")
+    parser.add_argument("--rules-only", action="store_true", help="不訓練模型，只評估規則")
+    parser.add_argument("--save", action="store_true", help="以全部記錄訓練模型並寫入 --model")
+    parser.add_argument("--model", default=FAST_CLASSIFY_MODEL, help="模型輸出路徑")
+    args = parser.parse_args()
+
+    records = load_classify_log(args.log)
+    if not records:
+        print(f"❌ 找不到分類記錄: {args.log}（請先以 classify_and_extract 呼叫 LLM 累積記錄）")
+        return 1
+
+    split = max(1, int(len(records) * (1 - args.test_ratio)))
+    train, test = records[:split], records[split:] or records
+    models = {} if args.rules_only else train_intent_model(train)
+    print(f"🔧 訓練資料: {len(train)} 則，模型欄位: {sorted(models) or '無（只使用規則）'}")
+    print_report(evaluate(FastIntentClassifier(models, threshold=args.threshold), test))
+
+    if args.save:
+        models = train_intent_model(records)
+        save_intent_model(models, args.model)
+        print(f"💾 已以 {len(records)} 則記錄訓練模型並寫入 {args.model}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,13 @@
 資料庫查詢模組
 """
 
-import requests
 import json
 from typing import List, Dict, Any
 from .template_mapping import get_table_id, build_api_url, validate_template
 import os
 
+from utils.http_client import http_get
+
 API_BASE_URL = os.environ.get('API_BASE_URL', 'http://localhost:8000')
 
 class DatabaseQuery:
@@ -34,7 +35,7 @@ class DatabaseQuery:
             url = build_api_url(table_id, [stock_id], "MTPeriod=0;DTMode=0;DTRange=5;DTOrder=1;MajorTable=M173;")
             
             # 發送請求
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = http_get(url, headers=self.headers, timeout=10)
             
             if response.status_code == 200:
                 try:
@@ -114,7 +115,7 @@ class DatabaseQuery:
             url = build_api_url(table_id, stock_ids, "MTPeriod=0;DTMode=0;DTRange=5;DTOrder=1;MajorTable=M173;")
             
             # 發送請求
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = http_get(url, headers=self.headers, timeout=10)
             
             if response.status_code == 200:
                 try:
@@ -165,7 +166,7 @@ class DatabaseQuery:
             url = build_api_url(table_id, stock_ids, additional_params)
             
             # 發送請求
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = http_get(url, headers=self.headers, timeout=10)
             
             if response.status_code == 200:
                 try:
@@ -6,13 +6,18 @@ from langgraph_app.nodes.detect_chart import detect_chart
 from langgraph_app.data_tools.database_query import db_query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+import asyncio
+import functools
 import json
 from typing import List, Dict
 import time
 import os
 from dotenv import load_dotenv
-from langgraph_app.nodes.classify_and_extract import classify_and_extract
-from langgraph_app.nodes.search_news import search_news_smart
+from langgraph_app.nodes.classify_and_extract import aclassify_and_extract
+from langgraph_app.nodes.fast_classifier import fast_classifier
+from langgraph_app.nodes.search_news import search_cache, serper_limiter
+from langgraph_app.nodes.search_planner import run_search_rounds, news_index
+from langgraph_app.nodes.news_ranker import rank_news, NEWS_PROMPT_TOP_K
 from langgraph_app.nodes.generate_report_pipeline import generate_report_pipeline
 import openai
 from bs4 import BeautifulSoup
@@ -20,7 +25,13 @@ import requests
 import yfinance as yf
 import pandas as pd
 from routes.answer import router as answer_router
-import httpx
+from utils.concurrency import run_blocking, stream_blocking, shutdown_blocking_pool
+from utils.single_flight import SingleFlight
+from utils.report_cache import ReportCache, current_trading_date
+from utils.deadline import Deadline, bind_deadline, current_deadline, budget_timeout, FINLAB_TIMEOUT
+from utils.tracing import trace_request, current_trace, span
+from utils.http_client import http_get, async_http_post, startup_http_pool, shutdown_http_pool
+from utils.llm_gateway import llm_gateway, shutdown_llm_gateway
 
 # 載入環境變數
 load_dotenv()
@@ -39,6 +50,18 @@ app.add_middleware(
 # 包含 answer 路由
 app.include_router(answer_router, prefix="/api")
 
+@app.on_event("startup")
+async def startup_event():
+    # 建立外部 API 共用的 HTTP 連線池（OpenAI client 在第一次呼叫時建立）
+    await startup_http_pool()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 關閉阻塞型節點使用的共用執行緒池
+    shutdown_blocking_pool()
+    await shutdown_http_pool()
+    await shutdown_llm_gateway()
+
 # 追蹤所有活躍的 WebSocket 連線
 class ConnectionManager:
     def __init__(self):
@@ -56,6 +79,11 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# 合併相同股票/分類/時間的進行中分析
+analysis_flights = SingleFlight(trace_name="analysis_flight")
+# 完整報告快取（相同股票/分類/時間範圍/交易日）
+report_cache = ReportCache()
+
 class AskRequest(BaseModel):
     question: str
 
@@ -92,101 +120,78 @@ async def ask_logs_api(req: AskRequest):
         logs.append("❌ 未偵測到股票代號")
     return {"logs": logs}
 
-@app.get("/api/ask-sse")
-def ask_sse_api(question: str = Query(...)):
-    def event_stream():
-        try:
-            # 1. 問題理解與關鍵資訊提取
-            yield f"data: {json.dumps({'log': '🧠 問題理解與關鍵資訊提取中...'})}\n\n"
-            classify_result = classify_and_extract(question)
-            yield f"data: {json.dumps({'log': '🧠 問題理解結果: ' + json.dumps(classify_result, ensure_ascii=False)})}\n\n"
-            #time.sleep(0.5)
-
-            # 2. 多股號偵測
-            yield f"data: {json.dumps({'log': '🔍 股票代號偵測中...'})}\n\n"
-            stock_ids = detect_stocks(question)
-            yield f"data: {json.dumps({'log': '🔍 偵測到股票代號: ' + (', '.join(stock_ids) if stock_ids else '未偵測到股票')})}\n\n"
-            #time.sleep(0.5)
-
-            # 3. 時間偵測
-            yield f"data: {json.dumps({'log': '⏳ 時間偵測中...'})}\n\n"
-            time_info = detect_time(question)
-            yield f"data: {json.dumps({'log': '⏱️ 偵測到時間: ' + str(time_info)})}\n\n"
-            #time.sleep(0.5)
-
-            # 4. 問題分類（大分類/子分類/面向）
-            yield f"data: {json.dumps({'log': '🧠 問題分類中...'})}\n\n"
-            category_result = classify_result.get("category", "")
-            subcategory_result = classify_result.get("subcategory", [])
-            view_type_result = classify_result.get("view_type", [])
-            yield f"data: {json.dumps({'log': f'📊 問題分類結果: 大分類={category_result}, 子分類={subcategory_result}, 投資面向={view_type_result}'})}\n\n"
-            #time.sleep(0.5)
-
-            # 5. 整合所有偵測結果為完整 JSON
-            yield f"data: {json.dumps({'log': '🔗 整合所有偵測結果...'})}\n\n"
-            
-            # 整合後的完整參數
-            integrated_result = {
-                # 從 classify_and_extract 來的
-                "category": classify_result.get("category", ""),
-                "subcategory": classify_result.get("subcategory", []),
-                "view_type": classify_result.get("view_type", []),
-                "keywords": classify_result.get("keywords", []),
-                "company_name": classify_result.get("company_name", ""),
-                "event_type": classify_result.get("event_type", ""),
-                
-                # 從 detect_stocks 來的（優先使用）
-                "stock_id": stock_ids[0] if stock_ids else classify_result.get("stock_id", ""),
-                "stock_ids": stock_ids,
-                
-                # 從 detect_time 來的（優先使用）
-                "time_info": time_info if time_info else classify_result.get("time_info", ""),
-                
-                # 整合後的完整資訊
-                "question": question,
-                "detection_timestamp": time.time()
-            }
-            
-            yield f"data: {json.dumps({'log': '📋 完整整合結果: ' + json.dumps(integrated_result, ensure_ascii=False, indent=2)})}\n\n"
-            #time.sleep(0.5)
-
-            # 6. 圖表偵測
-            yield f"data: {json.dumps({'log': '📈 圖表偵測中...'})}\n\n"
-            chart_result = detect_chart(question)
-            if chart_result:
-                chart_type = chart_result.get("chart_type", "")
-                table_id = chart_result.get("table_id", "")
-                yield f"data: {json.dumps({'log': f'📊 偵測到圖表: {chart_type} (Table ID: {table_id})'})}\n\n"
-            else:
-                yield f"data: {json.dumps({'log': '❌ 未偵測到特定圖表類型'})}\n\n"
-            time.sleep(0.5)
-
-            # 7. 新聞搜尋
-            yield f"data: {json.dumps({'log': '🔎 開始搜尋相關新聞...'})}\n\n"
-            serper_api_key = os.getenv("SERPER_API_KEY")
-            if not serper_api_key:
-                yield f"data: {json.dumps({'log': '⚠️ 警告: 未設定 SERPER_API_KEY，跳過新聞搜尋'})}\n\n"
+def sse_event(payload: Dict) -> str:
+    """將 payload 包裝成一則 SSE data 事件"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def annotate_section_type(section: Dict) -> Dict:
+    """自動標註 section 的 type，方便前端渲染"""
+    if section.get("cards"):
+        section["type"] = "cards"
+    elif section.get("tabs"):
+        section["type"] = "tabs"
+    elif section.get("bullets"):
+        section["type"] = "bullets"
+    elif section.get("sources"):
+        section["type"] = "sources"
+    elif section.get("disclaimer"):
+        section["type"] = "disclaimer"
+    elif section.get("summary_table"):
+        section["type"] = "summary_table"
+    return section
+
+def with_timeline(report: Dict) -> Dict:
+    """在報告中附上目前請求的各階段耗時時間軸"""
+    trace = current_trace()
+    if trace is None:
+        return report
+    return dict(report, timeline=trace.timeline())
+
+async def analysis_stream(integrated_result: Dict):
+    """
+    新聞搜尋、財務資料與報告生成的事件流
+
+    只依賴整合後的偵測結果，因此相同股票/分類/時間的請求可以共用同一份事件流
+    """
+    search_result = None
+    financial_data = None
+    company_name = integrated_result.get("company_name", "")
+    stock_id = integrated_result.get("stock_id", "")
+    try:
+        # 7. 新聞搜尋
+        yield sse_event({'log': '🔎 開始搜尋相關新聞...'})
+        serper_api_key = os.getenv("SERPER_API_KEY")
+        if not serper_api_key:
+            yield sse_event({'log': '⚠️ 警告: 未設定 SERPER_API_KEY，跳過新聞搜尋'})
+        else:
+            # 從整合結果提取搜尋關鍵字
+            company_name = integrated_result.get("company_name", "")
+            stock_id = integrated_result.get("stock_id", "")
+            keywords = integrated_result.get("keywords", [])
+            category = integrated_result.get("category", "")
+            subcategory = integrated_result.get("subcategory", [])
+            view_type = integrated_result.get("view_type", [])
+            time_info = integrated_result.get("time_info", "")
+
+            # 添加詳細的 console log 來調試
+            print(f"🔍 DEBUG - integrated_result: {integrated_result}")
+            print(f"🔍 DEBUG - company_name: '{company_name}'")
+            print(f"🔍 DEBUG - stock_id: '{stock_id}'")
+            print(f"🔍 DEBUG - keywords: {keywords} (長度: {len(keywords)})")
+            print(f"🔍 DEBUG - category: '{category}'")
+            print(f"🔍 DEBUG - subcategory: {subcategory} (長度: {len(subcategory)})")
+            print(f"🔍 DEBUG - view_type: {view_type} (長度: {len(view_type)})")
+            print(f"🔍 DEBUG - time_info: '{time_info}'")
+
+            # 第一輪關鍵字在規劃器中產生，與備用關鍵字的搜尋同時進行；
+            # 問題理解已一併產生關鍵字時直接使用，省下一次 LLM 呼叫
+            fused_keywords = integrated_result.get("search_keywords") or []
+            if fused_keywords:
+                yield sse_event({'log': f'⚡ 問題理解已規劃 {len(fused_keywords)} 組第一輪搜尋關鍵字'})
+                first_keywords_fn = functools.partial(list, fused_keywords)
             else:
-                # 從整合結果提取搜尋關鍵字
-                company_name = integrated_result.get("company_name", "")
-                stock_id = integrated_result.get("stock_id", "")
-                keywords = integrated_result.get("keywords", [])
-                category = integrated_result.get("category", "")
-                subcategory = integrated_result.get("subcategory", [])
-                view_type = integrated_result.get("view_type", [])
-                time_info = integrated_result.get("time_info", "")
-                
-                # 添加詳細的 console log 來調試
-                print(f"🔍 DEBUG - integrated_result: {integrated_result}")
-                print(f"🔍 DEBUG - company_name: '{company_name}'")
-                print(f"🔍 DEBUG - stock_id: '{stock_id}'")
-                print(f"🔍 DEBUG - keywords: {keywords} (長度: {len(keywords)})")
-                print(f"🔍 DEBUG - category: '{category}'")
-                print(f"🔍 DEBUG - subcategory: {subcategory} (長度: {len(subcategory)})")
-                print(f"🔍 DEBUG - view_type: {view_type} (長度: {len(view_type)})")
-                print(f"🔍 DEBUG - time_info: '{time_info}'")
-                
-                search_keywords = generate_smart_search_keywords(
+                first_keywords_fn = functools.partial(
+                    generate_smart_search_keywords,
                     category=category,
                     subcategory=subcategory,
                     view_type=view_type,
@@ -195,261 +200,345 @@ def ask_sse_api(question: str = Query(...)):
                     keywords=keywords,
                     time_info=time_info
                 )
-                
-                print(f"🔍 DEBUG - 最終 search_keywords: {search_keywords} (長度: {len(search_keywords)})")
-                
-                search_keywords_str = ', '.join(search_keywords)
-                log_msg = f'🔍 搜尋關鍵字: {search_keywords_str}'
-                yield f"data: {json.dumps({'log': log_msg})}\n\n"
-                
-                try:
-                    # 第一次搜尋
-                    search_result_1 = search_news_smart(
-                        company_name=company_name,
-                        stock_id=stock_id,
-                        intent=integrated_result.get("category", ""),
-                        keywords=search_keywords,
-                        serper_api_key=serper_api_key,
-                        use_grouped=True
-                    )
-                    if search_result_1.get("success"):
-                        news_count_1 = len(search_result_1.get("results", []))
-                        yield f"data: {json.dumps({'log': f'📰 第一次搜尋找到 {news_count_1} 則相關新聞'})}\n\n"
-                        for i, news in enumerate(search_result_1.get("results", [])[:5]):
-                            title = news.get("title", "")
-                            yield f"data: {json.dumps({'log': f'📄 1-{i+1}. {title}'})}\n\n"
-                            time.sleep(0.3)
-                    else:
-                        yield f"data: {json.dumps({'log': '❌ 第一次新聞搜尋失敗: ' + search_result_1.get('error', '未知錯誤')})}\n\n"
-                        search_result_1["results"] = []
-
-                    # 第二次搜尋
-                    yield f"data: {json.dumps({'log': '🔄 開始第二次搜尋，根據第一次結果生成新關鍵字...'})}\n\n"
-                    new_keywords_2 = extract_keywords_from_results(search_result_1.get("results", []), company_name, stock_id)
-                    new_keywords_2_str = ', '.join(new_keywords_2)
-                    yield f"data: {json.dumps({'log': f'🔍 第二次搜尋關鍵字: {new_keywords_2_str}'})}\n\n"
-                    search_result_2 = search_news_smart(
-                        company_name=company_name,
-                        stock_id=stock_id,
-                        intent=integrated_result.get("category", ""),
-                        keywords=new_keywords_2,
-                        serper_api_key=serper_api_key,
-                        use_grouped=True
-                    )
-                    if search_result_2.get("success"):
-                        news_count_2 = len(search_result_2.get("results", []))
-                        yield f"data: {json.dumps({'log': f'📰 第二次搜尋找到 {news_count_2} 則相關新聞'})}\n\n"
-                        for i, news in enumerate(search_result_2.get("results", [])[:5]):
-                            title = news.get("title", "")
-                            yield f"data: {json.dumps({'log': f'📄 2-{i+1}. {title}'})}\n\n"
-                            time.sleep(0.3)
-                    else:
-                        yield f"data: {json.dumps({'log': '❌ 第二次新聞搜尋失敗: ' + search_result_2.get('error', '未知錯誤')})}\n\n"
-                        search_result_2["results"] = []
-
-                    # 第三次搜尋
-                    yield f"data: {json.dumps({'log': '🔄 開始第三次搜尋，根據前兩次結果生成新關鍵字...'})}\n\n"
-                    merged_1_2 = merge_search_results(search_result_1.get("results", []), search_result_2.get("results", []))
-                    new_keywords_3 = extract_keywords_from_results(merged_1_2, company_name, stock_id)
-                    new_keywords_3_str = ', '.join(new_keywords_3)
-                    yield f"data: {json.dumps({'log': f'🔍 第三次搜尋關鍵字: {new_keywords_3_str}'})}\n\n"
-                    search_result_3 = search_news_smart(
+
+            try:
+                # 四輪搜尋：獨立的輪次並行執行，相依的輪次在輸入就緒時立即開始
+                all_results = []
+                with span("search") as search_span:
+                    async for event in run_search_rounds(
                         company_name=company_name,
                         stock_id=stock_id,
                         intent=integrated_result.get("category", ""),
-                        keywords=new_keywords_3,
                         serper_api_key=serper_api_key,
-                        use_grouped=True
-                    )
-                    if search_result_3.get("success"):
-                        news_count_3 = len(search_result_3.get("results", []))
-                        yield f"data: {json.dumps({'log': f'📰 第三次搜尋找到 {news_count_3} 則相關新聞'})}\n\n"
-                        for i, news in enumerate(search_result_3.get("results", [])[:5]):
-                            title = news.get("title", "")
-                            yield f"data: {json.dumps({'log': f'📄 3-{i+1}. {title}'})}\n\n"
-                            time.sleep(0.3)
-                    else:
-                        yield f"data: {json.dumps({'log': '❌ 第三次新聞搜尋失敗: ' + search_result_3.get('error', '未知錯誤')})}\n\n"
-                        search_result_3["results"] = []
-
-                    # 第四次搜尋
-                    yield f"data: {json.dumps({'log': '🔄 開始第四次搜尋，使用備用關鍵字...'})}\n\n"
-                    new_keywords_4 = generate_fallback_second_keywords(company_name, stock_id)
-                    new_keywords_4_str = ', '.join(new_keywords_4)
-                    yield f"data: {json.dumps({'log': f'🔍 第四次搜尋關鍵字: {new_keywords_4_str}'})}\n\n"
-                    search_result_4 = search_news_smart(
+                        first_keywords_fn=first_keywords_fn,
+                        question=integrated_result.get("question", ""),
+                        event_type=integrated_result.get("event_type", ""),
+                        keywords=integrated_result.get("keywords", [])
+                    ):
+                        if "log" in event:
+                            yield sse_event(event)
+                        else:
+                            all_results = event["results"]
+                    if search_span:
+                        search_span.set_attribute("results", len(all_results))
+                yield sse_event({'log': f'📋 合併後總共 {len(all_results)} 則新聞'})
+                # 更新 search_result 為合併後的結果
+                search_result = {"success": True, "results": all_results}
+
+                # 檢查是否為個股分析類別，如果是則爬取財務數據
+                if "個股分析" in category:
+                    yield sse_event({'log': '📊 正在獲取 Yahoo 財經財務報表數據...'})
+                    try:
+                        # FinLab 沒有逾時設定，依剩餘時間決定最多等待多久
+                        with span("finlab.fetch", stock_id=stock_id):
+                            financial_data = await asyncio.wait_for(
+                                run_blocking(fetch_yahoo_financial_data, stock_id, company_name),
+                                timeout=budget_timeout(FINLAB_TIMEOUT)
+                            )
+                    except asyncio.TimeoutError:
+                        financial_data = None
+                        deadline = current_deadline()
+                        if deadline:
+                            deadline.skip("財務報表數據")
+                        yield sse_event({'log': '⏱️ 財務報表數據獲取逾時，略過'})
+                    if financial_data is not None and financial_data.get("success"):
+                        financial_data = financial_data.get("data", {})
+                        yield sse_event({'log': '📊 成功獲取財務報表數據'})
+                    elif financial_data is not None:
+                        yield sse_event({'log': '⚠️ 無法獲取 Yahoo 財經財務報表數據'})
+                else:
+                    yield sse_event({'log': '📝 非個股分析類別，跳過財務數據獲取'})
+            except Exception as e:
+                yield sse_event({'log': f'❌ 新聞搜尋錯誤: {str(e)}'})
+
+        # 8. 最終投資分析報告生成
+        yield sse_event({'log': '📝 正在生成投資分析報告...'})
+        try:
+            if search_result and search_result.get("success"):
+                # 依與問題的相關性、新聞時間與來源可信度排序，prompt 只放前 NEWS_PROMPT_TOP_K 則
+                with span("rank_news", results=len(search_result.get("results", []))):
+                    ranked_results = rank_news(
+                        search_result.get("results", []),
+                        question=integrated_result.get("question", ""),
                         company_name=company_name,
                         stock_id=stock_id,
-                        intent=integrated_result.get("category", ""),
-                        keywords=new_keywords_4,
-                        serper_api_key=serper_api_key,
-                        use_grouped=True
+                        event_type=integrated_result.get("event_type", ""),
+                        keywords=integrated_result.get("keywords", [])
                     )
-                    if search_result_4.get("success"):
-                        news_count_4 = len(search_result_4.get("results", []))
-                        yield f"data: {json.dumps({'log': f'📰 第四次搜尋找到 {news_count_4} 則相關新聞'})}\n\n"
-                        for i, news in enumerate(search_result_4.get("results", [])[:5]):
-                            title = news.get("title", "")
-                            yield f"data: {json.dumps({'log': f'📄 4-{i+1}. {title}'})}\n\n"
-                            time.sleep(0.3)
-                    else:
-                        yield f"data: {json.dumps({'log': '❌ 第四次新聞搜尋失敗: ' + search_result_4.get('error', '未知錯誤')})}\n\n"
-                        search_result_4["results"] = []
-
-                    # 合併所有搜尋結果
-                    all_results = merge_search_results(
-                        merge_search_results(
-                            merge_search_results(search_result_1.get("results", []), search_result_2.get("results", [])),
-                            search_result_3.get("results", [])
-                        ),
-                        search_result_4.get("results", [])
-                    )
-                    yield f"data: {json.dumps({'log': f'📋 合併後總共 {len(all_results)} 則新聞'})}\n\n"
-                    # 更新 search_result 為合併後的結果
-                    search_result = {"success": True, "results": all_results}
-
-                    # 檢查是否為個股分析類別，如果是則爬取財務數據
-                    if "個股分析" in category:
-                        yield f"data: {json.dumps({'log': '📊 正在獲取 Yahoo 財經財務報表數據...'})}\n\n"
-                        financial_data = fetch_yahoo_financial_data(stock_id, company_name)
-                        if financial_data.get("success"):
-                            data = financial_data.get("data", {})
-                            yield f"data: {json.dumps({'log': '📊 成功獲取財務報表數據'})}\n\n"
-                            financial_context = f"""
-Yahoo 財經財務報表數據：
-
-每股盈餘 (EPS)：
-{format_eps_data(data.get('eps', {}))}
-
-營收數據：
-{format_revenue_data(data.get('revenue', {}))}
-
-損益表數據：
-{format_income_statement_data(data.get('income_statement', {}))}
-
-資產負債表數據：
-{format_balance_sheet_data(data.get('balance_sheet', {}))}
-
-資料來源：
-{format_sources_data(data.get('sources', []))}
-"""
-                            news_sources = []
-                            for news in search_result.get("results", []):
-                                news_sources.append({
-                                    "title": news.get("title", "無標題"),
-                                    "link": news.get("link", "")
-                                })
-                            financial_sources = data.get('sources', [])
-                            news_summary = ""
-                            if search_result.get("results"):
-                                news_summary = "\n".join([
-                                    f"{i+1}. {news.get('title', '無標題')}: {news.get('snippet', '無摘要')}"
-                                    for i, news in enumerate(search_result.get("results", [])[:5])
-                                ])
-                            financial_data = data
-                        else:
-                            yield f"data: {json.dumps({'log': '⚠️ 無法獲取 Yahoo 財經財務報表數據'})}\n\n"
-                    else:
-                        yield f"data: {json.dumps({'log': '📝 非個股分析類別，跳過財務數據獲取'})}\n\n"
-                except Exception as e:
-                    yield f"data: {json.dumps({'log': f'❌ 新聞搜尋錯誤: {str(e)}'})}\n\n"
-            
-            time.sleep(0.5)
 
-            # 8. 最終投資分析報告生成
-            yield f"data: {json.dumps({'log': '📝 正在生成投資分析報告...'})}\n\n"
-            try:
-                if 'search_result' in locals() and search_result and search_result.get("success"):
-                    # 構建新聞摘要
-                    news_summary = ""
-                    if search_result.get("results"):
-                        news_summary = "\n".join([
-                            f"{i+1}. {news.get('title', '無標題')}: {news.get('snippet', '無摘要')}"
-                            for i, news in enumerate(search_result.get("results", [])[:5])
-                        ])
-                    
-                    # 準備新聞來源
-                    news_sources = []
-                    for news in search_result.get("results", []):
-                        news_sources.append({
-                            "title": news.get("title", "無標題"),
-                            "link": news.get("link", "")
-                        })
-                    
-                    # 準備財務來源
-                    financial_sources = []
-                    if 'financial_data' in locals() and financial_data:
-                        financial_sources.append({
-                            "name": "Yahoo Finance",
-                            "url": f"https://finance.yahoo.com/quote/{stock_id}.TW"
-                        })
-                    
-                    # 使用新的 pipeline 生成報告
-                    summary_result = generate_report_pipeline(
+                # 構建新聞摘要
+                news_summary = ""
+                if ranked_results:
+                    news_summary = "\n".join([
+                        f"{i+1}. {news.get('title', '無標題')}: {news.get('snippet', '無摘要')}"
+                        for i, news in enumerate(ranked_results[:NEWS_PROMPT_TOP_K])
+                    ])
+
+                # 準備新聞來源（與新聞摘要相同順序，section 引用的編號才會對應）
+                news_sources = []
+                for news in ranked_results:
+                    news_sources.append({
+                        "title": news.get("title", "無標題"),
+                        "link": news.get("link", "")
+                    })
+
+                # 準備財務來源
+                financial_sources = []
+                if financial_data:
+                    financial_sources.append({
+                        "name": "Yahoo Finance",
+                        "url": f"https://finance.yahoo.com/quote/{stock_id}.TW"
+                    })
+
+                # 使用新的 pipeline 生成報告，每個 section 完成就先推送給前端
+                summary_result = {}
+                delivered_indices = []
+                delivered_sections = []
+                with span("report"):
+                    async for kind, payload in stream_blocking(
+                        generate_report_pipeline,
+                        callback_name="on_section",
                         company_name=company_name,
                         stock_id=stock_id,
                         intent=integrated_result.get("category", ""),
                         time_info=integrated_result.get("time_info", ""),
                         news_summary=news_summary,
                         news_sources=news_sources,
-                        financial_data=financial_data if 'financial_data' in locals() else None,
+                        financial_data=financial_data,
                         financial_sources=financial_sources
-                    )
-                    
-                    if summary_result.get("success"):
-                        sections = summary_result.get("sections", [])
-                        yield f"data: {json.dumps({'log': f'📋 生成 {len(sections)} 個分析面向'})}\n\n"
-                        
-                        # 添加詳細的調試信息
-                        print(f"[DEBUG] Sections 類型: {type(sections)}")
-                        print(f"[DEBUG] Sections 內容: {sections}")
-                        
-                        # 顯示每個 section 的標題
-                        for section in sections:
-                            section_title = section.get("section", "未命名區塊")
-                            yield f"data: {json.dumps({'log': f'📊 {section_title}'})}\n\n"
-                            time.sleep(0.3)
-                        
-                        # 發送完整的投資分析報告
-                        print("[DEBUG] 處理 list 格式的 sections")
-                        report_sections = []
-                        for section in sections:
-                            # 可選：自動標註 type，方便前端渲染
-                            if section.get("cards"):
-                                section["type"] = "cards"
-                            elif section.get("tabs"):
-                                section["type"] = "tabs"
-                            elif section.get("bullets"):
-                                section["type"] = "bullets"
-                            elif section.get("sources"):
-                                section["type"] = "sources"
-                            elif section.get("disclaimer"):
-                                section["type"] = "disclaimer"
-                            elif section.get("summary_table"):
-                                section["type"] = "summary_table"
-                            report_sections.append(section)
-                            print(f"[DEBUG] Section: {section.get('section', '未命名區塊')}")
-                        report_data = {
-                            'report': {
-                                'stockName': company_name,
-                                'stockId': stock_id,
-                                'sections': report_sections,
-                                'paraphrased_prompt': summary_result.get('paraphrased_prompt'),
-                                'logs': summary_result.get('logs', [])
-                            }
+                    ):
+                        if kind == "result":
+                            summary_result = payload
+                            continue
+                        if "delta" in payload:
+                            # 串流中的 section 先送出目前的卡片內容；不放進報告快取，重播時只送完整 section
+                            yield sse_event({'section_delta': dict(payload['delta'], index=payload['index'], total=payload['total'], name=payload['name'])})
+                            continue
+                        section = annotate_section_type(payload["section"])
+                        delivered_indices.append(payload["index"])
+                        section_title = section.get("section") or section.get("title") or "未命名區塊"
+                        yield sse_event({'log': f'📊 {section_title}'})
+                        section_event = {'section': section, 'index': payload['index'], 'total': payload['total']}
+                        delivered_sections.append(section_event)
+                        yield sse_event(section_event)
+
+                if summary_result.get("success"):
+                    sections = summary_result.get("sections", [])
+                    yield sse_event({'log': f'📋 生成 {len(sections)} 個分析面向'})
+
+                    # 添加詳細的調試信息
+                    print(f"[DEBUG] Sections 類型: {type(sections)}")
+                    print(f"[DEBUG] Sections 內容: {sections}")
+
+                    # 發送完整的投資分析報告（保留給尚未支援逐段渲染的前端）
+                    print("[DEBUG] 處理 list 格式的 sections")
+                    report_sections = []
+                    for section in sections:
+                        report_sections.append(annotate_section_type(section))
+                        print(f"[DEBUG] Section: {section.get('section', '未命名區塊')}")
+                    report_data = {
+                        'report': {
+                            'stockName': company_name,
+                            'stockId': stock_id,
+                            'sections': report_sections,
+                            'paraphrased_prompt': summary_result.get('paraphrased_prompt'),
+                            'logs': summary_result.get('logs', [])
                         }
-                        yield f"data: {json.dumps(report_data)}\n\n"
-                    else:
-                        yield f"data: {json.dumps({'log': '❌ 投資分析報告生成失敗: ' + summary_result.get('error', '未知錯誤')})}\n\n"
+                    }
+                    complete_data = {
+                        'report_complete': {
+                            'stockName': company_name,
+                            'stockId': stock_id,
+                            'sections_count': len(report_sections),
+                            'indices': sorted(delivered_indices),
+                            'paraphrased_prompt': summary_result.get('paraphrased_prompt')
+                        }
+                    }
+                    # 本次請求的各階段耗時只附在送出的事件上，不寫入快取
+                    yield sse_event({'report': with_timeline(report_data['report'])})
+                    yield sse_event(complete_data)
+
+                    # 因時間不足而略過部分階段的報告不寫入快取
+                    deadline = current_deadline()
+                    skipped_stages = deadline.skipped if deadline else []
+                    if skipped_stages:
+                        yield sse_event({'log': '⏱️ 因剩餘時間不足略過: ' + '、'.join(skipped_stages)})
+                    cache_key = report_cache_key(integrated_result)
+                    if cache_key is not None and not skipped_stages:
+                        report_cache.put(cache_key, integrated_result.get("category", ""), {
+                            'sections': delivered_sections,
+                            'report': report_data['report'],
+                            'report_complete': complete_data['report_complete']
+                        })
                 else:
-                    yield f"data: {json.dumps({'log': '⚠️ 無法生成投資分析報告，缺少新聞資料'})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'log': f'❌ 投資分析報告生成錯誤: {str(e)}'})}\n\n"
+                    yield sse_event({'log': '❌ 投資分析報告生成失敗: ' + summary_result.get('error', '未知錯誤')})
+            else:
+                yield sse_event({'log': '⚠️ 無法生成投資分析報告，缺少新聞資料'})
+        except Exception as e:
+            yield sse_event({'log': f'❌ 投資分析報告生成錯誤: {str(e)}'})
 
-            yield f"data: {json.dumps({'log': '🎉 分析流程完成！'})}\n\n"
+        yield sse_event({'log': '🎉 分析流程完成！'})
 
-        except Exception as e:
-            yield f"data: {json.dumps({'log': f'❌ 系統錯誤: {str(e)}'})}\n\n"
+    except Exception as e:
+        yield sse_event({'log': f'❌ 系統錯誤: {str(e)}'})
+
+def analysis_flight_key(integrated_result: Dict):
+    """
+    產生合併進行中分析用的 key：(stock_id, category, time_info)
+
+    沒有偵測到股票時不合併，回傳 None
+    """
+    stock_id = str(integrated_result.get("stock_id") or "").strip()
+    if not stock_id:
+        return None
+    category = str(integrated_result.get("category") or "").strip()
+    time_info = str(integrated_result.get("time_info") or "").strip().lower()
+    return (stock_id, category, time_info)
+
+def report_cache_key(integrated_result: Dict):
+    """
+    產生報告快取用的 key：合併 key 再加上目前的交易日
+
+    沒有偵測到股票時不快取，回傳 None
+    """
+    flight_key = analysis_flight_key(integrated_result)
+    if flight_key is None:
+        return None
+    return flight_key + (current_trading_date().isoformat(),)
+
+async def replay_cached_report(entry: Dict):
+    """以與即時分析相同的 SSE 事件格式重播快取的報告"""
+    created_at = time.strftime("%H:%M:%S", time.localtime(entry["created_at"]))
+    yield sse_event({'log': f'⚡ 使用 {created_at} 產生的快取報告'})
+    for section_event in entry.get("sections", []):
+        section = section_event["section"]
+        section_title = section.get("section") or section.get("title") or "未命名區塊"
+        yield sse_event({'log': f'📊 {section_title}'})
+        yield sse_event(section_event)
+    yield sse_event({'log': f'📋 生成 {len(entry["report"].get("sections", []))} 個分析面向'})
+    yield sse_event({'report': with_timeline(entry["report"])})
+    yield sse_event({'report_complete': entry["report_complete"]})
+    yield sse_event({'log': '🎉 分析流程完成！'})
+
+@app.get("/api/report-cache/stats")
+async def report_cache_stats_api():
+    """
+    報告快取命中率統計
+    """
+    return {
+        "success": True,
+        "report_cache": report_cache.get_stats()
+    }
+
+
+@app.get("/api/stats")
+async def stats_api():
+    """
+    搜尋快取、LLM 回應快取與新聞索引命中率統計，Serper 限流的排隊等待時間，
+    OpenAI 呼叫次數（含 prompt 超過 token 預算的次數），本機問題分類的採用率，以及合併請求的統計
+    """
+    return {
+        "success": True,
+        "search_cache": search_cache.get_stats(),
+        "news_index": news_index.get_stats(),
+        "serper_rate_limit": serper_limiter.get_stats(),
+        "llm_gateway": llm_gateway.get_stats(),
+        "fast_classifier": fast_classifier.get_stats(),
+        "in_flight": analysis_flights.stats
+    }
+
+@app.get("/api/ask-sse")
+async def ask_sse_api(question: str = Query(...)):
+    # 整個請求共用的時間預算，各階段依剩餘時間決定逾時與是否略過可選階段
+    deadline = Deadline()
+
+    async def event_stream():
+        bind_deadline(deadline)
+        with trace_request("ask_sse", question=question):
+            try:
+                # 1. 問題理解與關鍵資訊提取
+                yield sse_event({'log': '🧠 問題理解與關鍵資訊提取中...'})
+                with span("classify_and_extract"):
+                    classify_result = await aclassify_and_extract(question)
+                yield sse_event({'log': '🧠 問題理解結果: ' + json.dumps(classify_result, ensure_ascii=False)})
+
+                # 2. 多股號偵測
+                yield sse_event({'log': '🔍 股票代號偵測中...'})
+                with span("detect_stocks"):
+                    stock_ids = detect_stocks(question)
+                yield sse_event({'log': '🔍 偵測到股票代號: ' + (', '.join(stock_ids) if stock_ids else '未偵測到股票')})
+
+                # 3. 時間偵測
+                yield sse_event({'log': '⏳ 時間偵測中...'})
+                with span("detect_time"):
+                    time_info = detect_time(question)
+                yield sse_event({'log': '⏱️ 偵測到時間: ' + str(time_info)})
+
+                # 4. 問題分類（大分類/子分類/面向）
+                yield sse_event({'log': '🧠 問題分類中...'})
+                category_result = classify_result.get("category", "")
+                subcategory_result = classify_result.get("subcategory", [])
+                view_type_result = classify_result.get("view_type", [])
+                yield sse_event({'log': f'📊 問題分類結果: 大分類={category_result}, 子分類={subcategory_result}, 投資面向={view_type_result}'})
+
+                # 5. 整合所有偵測結果為完整 JSON
+                yield sse_event({'log': '🔗 整合所有偵測結果...'})
+            
+                # 整合後的完整參數
+                integrated_result = {
+                    # 從 classify_and_extract 來的
+                    "category": classify_result.get("category", ""),
+                    "subcategory": classify_result.get("subcategory", []),
+                    "view_type": classify_result.get("view_type", []),
+                    "keywords": classify_result.get("keywords", []),
+                    "company_name": classify_result.get("company_name", ""),
+                    "event_type": classify_result.get("event_type", ""),
+                    # 合併模式時問題理解一併產生的第一輪搜尋關鍵字
+                    "search_keywords": classify_result.get("search_keywords", []),
+                
+                    # 從 detect_stocks 來的（優先使用）
+                    "stock_id": stock_ids[0] if stock_ids else classify_result.get("stock_id", ""),
+                    "stock_ids": stock_ids,
+                
+                    # 從 detect_time 來的（優先使用）
+                    "time_info": time_info if time_info else classify_result.get("time_info", ""),
+                
+                    # 整合後的完整資訊
+                    "question": question,
+                    "detection_timestamp": time.time()
+                }
+            
+                yield sse_event({'log': '📋 完整整合結果: ' + json.dumps(integrated_result, ensure_ascii=False, indent=2)})
+
+                # 6. 圖表偵測
+                yield sse_event({'log': '📈 圖表偵測中...'})
+                with span("detect_chart"):
+                    chart_result = detect_chart(question)
+                if chart_result:
+                    chart_type = chart_result.get("chart_type", "")
+                    table_id = chart_result.get("table_id", "")
+                    yield sse_event({'log': f'📊 偵測到圖表: {chart_type} (Table ID: {table_id})'})
+                else:
+                    yield sse_event({'log': '❌ 未偵測到特定圖表類型'})
+
+                # 7~8. 新聞搜尋與報告生成：有快取時直接重播，相同的分析正在進行時直接訂閱它的事件
+                cache_key = report_cache_key(integrated_result)
+                cached_report = report_cache.get(cache_key) if cache_key is not None else None
+                flight_key = analysis_flight_key(integrated_result)
+                if cached_report is not None:
+                    async for event in replay_cached_report(cached_report):
+                        yield event
+                elif flight_key is None:
+                    async for event in analysis_stream(integrated_result):
+                        yield event
+                else:
+                    if analysis_flights.is_in_flight(flight_key):
+                        yield sse_event({'log': '🤝 相同的分析正在進行中，直接共用其結果...'})
+                    async for event in analysis_flights.subscribe(flight_key, lambda: analysis_stream(integrated_result)):
+                        yield event
+
+            except Exception as e:
+                yield sse_event({'log': f'❌ 系統錯誤: {str(e)}'})
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
@@ -465,11 +554,11 @@ async def investment_analysis_api(req: InvestmentAnalysisRequest):
     }
 
 @app.get("/api/investment-analysis-sse")
-def investment_analysis_sse_api(question: str = Query(...), serper_api_key: str = Query(None)):
+async def investment_analysis_sse_api(question: str = Query(...), serper_api_key: str = Query(None)):
     """
     使用 Server-Sent Events 的投資分析流程
     """
-    return ask_sse_api(question)
+    return await ask_sse_api(question)
 
 @app.post("/api/test-table-ids")
 async def test_table_ids_api(req: DatabaseTestRequest):
@@ -516,7 +605,6 @@ async def query_chart_api(req: ChartQueryRequest):
     url = build_api_url(config["table_id"], req.stock_ids, "MTPeriod=0;DTMode=0;DTRange=5;DTOrder=1;MajorTable=M173;")
     
     # 發送請求
-    import requests
     headers = {
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
         "Referer": "https://www.cmoney.tw/",
@@ -524,7 +612,7 @@ async def query_chart_api(req: ChartQueryRequest):
     }
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = await run_blocking(http_get, url, headers=headers, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -619,27 +707,7 @@ def generate_fallback_smart_keywords(category: str, subcategory: List[str], view
     """
     search_keywords = []
     
-    # 定義允許的網站
-    allowed_sites = [
-        "tw.finance.yahoo.com",  # Yahoo奇摩股市
-        "cnyes.com",  # 鉅亨網
-        "moneydj.com",  # MoneyDJ 理財網
-        "cmoney.tw",  # CMoney
-        "money.udn.com",  # 經濟日報
-        "ctee.com.tw",  # 工商時報
-        "finance.ettoday.net",  # ETtoday 財經
-        "goodinfo.tw",  # Goodinfo
-        "macromicro.me",  # 財經M平方
-        "smart.businessweekly.com.tw",  # Smart智富
-        "technews.tw",  # 科技新報
-        "nownews.com",  # Nownews
-        "moneylink.com.tw",  # MoneyLink 富聯網
-        "stockfeel.com.tw",  # 股感 StockFeel
-        "businessweekly.com.tw",  # 商業周刊
-        "businesstoday.com.tw",  # 今周刊
-        "pchome.com.tw",  # PChome 股市頻道
-    ]
-    
+    # 允許的網站定義在 utils/news_sites.py，搜尋時由 domains 參數限制
     # 基礎關鍵字組合 - 充分利用所有主要網站
     if company_name and stock_id:
         search_keywords.extend([
@@ -782,115 +850,6 @@ def generate_fallback_smart_keywords(category: str, subcategory: List[str], view
     unique_keywords = list(dict.fromkeys(search_keywords))
     return unique_keywords[:12]  # 增加到最多12個關鍵字
 
-def extract_keywords_from_results(search_results: List[Dict], company_name: str, stock_id: str) -> List[str]:
-    """
-    從第一次搜尋結果中提取新的關鍵字，包含網站限制
-    """
-    try:
-        # 收集所有標題和摘要
-        all_text = ""
-        for result in search_results:
-            title = result.get("title", "")
-            snippet = result.get("snippet", "")
-            all_text += f"{title} {snippet} "
-        
-        # 使用 OpenAI 從搜尋結果中提取新的關鍵字
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        prompt = f"""
-根據以下搜尋結果，為 {company_name}({stock_id}) 生成 3-5 個新的搜尋關鍵字。
-這些關鍵字應該能夠找到更深入、更具體的相關資訊，特別是財務數據、財報、損益表等。
-
-⚠️限制來源：請僅從下列網站中抓取內容：
-Yahoo奇摩股市、鉅亨網 (cnyes)、MoneyDJ 理財網、CMoney、經濟日報、工商時報、ETtoday 財經、Goodinfo、財經M平方（MacroMicro）、Smart智富、科技新報、Nownews、MoneyLink 富聯網、股感 StockFeel、商業周刊、今周刊、PChome 股市頻道。
-
-搜尋結果：
-{all_text}
-
-請生成新的搜尋關鍵字，格式為 JSON 陣列，並包含 site: 限制：
-["{{ company_name }} 2025 財報 site:tw.finance.yahoo.com", "{{ stock_id }} 法人動向 site:cnyes.com", "{{ company_name }} EPS 分析 site:moneydj.com"]
-
-注意：請包含年份(2025/2024)和具體的網站限制。
-"""
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
-        
-        # 解析回應
-        content = response.choices[0].message.content.strip()
-        try:
-            import json
-            keywords = json.loads(content)
-            if isinstance(keywords, list):
-                return keywords[:5]  # 限制最多5個關鍵字
-        except:
-            pass
-        
-        # 如果 AI 解析失敗，使用預設關鍵字
-        return generate_fallback_second_keywords(company_name, stock_id)
-        
-    except Exception as e:
-        print(f"[extract_keywords_from_results ERROR] {e}")
-        # 返回預設關鍵字（包含年份和財務關鍵字）
-        return generate_fallback_second_keywords(company_name, stock_id)
-
-def generate_fallback_second_keywords(company_name: str, stock_id: str) -> List[str]:
-    """生成第二次搜尋的備用關鍵字，充分利用所有允許的網站"""
-    current_year = "2025"
-    last_year = "2024"
-    
-    fallback_keywords = [
-        f"{company_name} {current_year} 財報 site:tw.finance.yahoo.com",
-        f"{stock_id} {last_year} 損益表 site:cnyes.com", 
-        f"{company_name} 法人動向 site:moneydj.com",
-        f"{stock_id} EPS 分析 site:cmoney.tw",
-        f"{company_name} 營業收入 site:goodinfo.tw",
-        f"{company_name} 財經新聞 site:money.udn.com",
-        f"{stock_id} 工商時報 site:ctee.com.tw",
-        f"{company_name} 財經報導 site:finance.ettoday.net",
-        f"{company_name} 基本面分析 site:macromicro.me",
-        f"{company_name} 投資理財 site:smart.businessweekly.com.tw",
-        f"{company_name} 科技新聞 site:technews.tw",
-        f"{company_name} 即時新聞 site:nownews.com"
-    ]
-    
-    return fallback_keywords[:12]  # 增加到最多12個關鍵字
-
-def merge_search_results(first_results: List[Dict], second_results: List[Dict]) -> List[Dict]:
-    """
-    合併兩次搜尋結果，去除重複
-    """
-    try:
-        # 使用 URL 作為去重依據
-        seen_urls = set()
-        merged_results = []
-        
-        # 先加入第一次搜尋結果
-        for result in first_results:
-            url = result.get("link", "")
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                merged_results.append(result)
-        
-        # 再加入第二次搜尋結果（去重）
-        for result in second_results:
-            url = result.get("link", "")
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                merged_results.append(result)
-        
-        return merged_results
-        
-    except Exception as e:
-        print(f"[merge_search_results ERROR] {e}")
-        # 如果合併失敗，返回第一次搜尋結果
-        return first_results
-
 def fetch_yahoo_financial_data(stock_id: str, company_name: str) -> Dict:
     """
     從 FinLab API 取得財務報表數據，失敗則 fallback 用模擬資料
@@ -922,7 +881,8 @@ def fetch_yahoo_financial_data(stock_id: str, company_name: str) -> Dict:
         
         for name, data_type in finlab_data.items():
             try:
-                df = data.get(data_type)
+                with span("finlab.data.get", dataset=data_type):
+                    df = data.get(data_type)
                 if stock_id in df.columns:
                     series = df[stock_id].dropna()
                     
@@ -1111,9 +1071,8 @@ async def proxy_login(request: Request):
         # 轉發到 CMoney API
         url = "https://www.cmoney.tw/identity/token"
         
-        # 使用 httpx 進行異步請求
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, data=dict(form))
+        # 使用共用的 httpx 連線池進行異步請求；維持原本 httpx 的預設（5 秒逾時、不跟隨轉址）
+        resp = await async_http_post(url, data=dict(form), timeout=5.0, follow_redirects=False)
             
         # 返回響應
         return Response(
@@ -1150,8 +1109,7 @@ async def proxy_custom_group(request: Request):
         if auth_header:
             headers['Authorization'] = auth_header
             
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, data=body, headers=headers, timeout=30.0)
+        resp = await async_http_post(url, content=body, headers=headers, timeout=30.0, follow_redirects=False)
         
         return Response(
             content=resp.content, 
@@ -1,10 +1,23 @@
-import openai
 import json
 import re
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import os
 from utils.token_tracker import track_openai_call
+from utils.concurrency import run_blocking
+from utils.llm_gateway import achat_completion, chat_completion
+from utils.tracing import current_trace
+
+# 問題理解時一併規劃第一輪搜尋關鍵字，省下 generate_search_keywords 這一次相依的 LLM 呼叫；
+# 設為 0 時使用原本的兩次呼叫（方便比較延遲與關鍵字品質）
+CLASSIFY_FUSED_KEYWORDS = os.getenv("CLASSIFY_FUSED_KEYWORDS", "1") == "1"
+# 合併模式最多保留的搜尋關鍵字數（與 generate_search_keywords 相同）
+MAX_SEARCH_KEYWORDS = 12
+# LLM 的分類結果以 JSON Lines 記錄在此檔案，作為本機分類器的訓練與評估資料；留空則不記錄
+CLASSIFY_LOG_FILE = os.getenv("CLASSIFY_LOG_FILE", "classify_log.jsonl")
+_classify_log_lock = threading.Lock()
 
 # 載入 stock alias dict
 DATA_PATH = os.path.join(os.path.dirname(__file__), '../../data/stock_alias_dict.json')
@@ -91,6 +104,29 @@ PROMPT = '''你是一個投資問題理解模組。
 {{ user_input }}
 '''
 
+# 合併模式：在同一個 JSON 回應中加入第一輪搜尋關鍵字（規則與 generate_search_keywords 的 prompt 相同）
+FUSED_KEYWORDS_PROMPT = '''🔎 另外請同時規劃第一輪新聞搜尋，在同一個 JSON 中加入 "search_keywords" 欄位：
+- 8-12 組具代表性的繁體中文搜尋關鍵字組合，結合公司名稱、股票代號、問題類型與時間資訊
+- 涵蓋財報、營收、EPS、法人動向、產業新聞、分析師預估與目標價等面向
+- 優先產生『近一週』、『近一月』、『最新』等時間相關的查詢組合，讓結果聚焦於近期新聞
+- 無需加 site:xxx，API 會自動過濾
+- 問題沒有明確的公司或投資主題時回傳空陣列 []
+- 例如："search_keywords": ["台積電 2330 財報", "台積電 外資買賣", "2330 法人動向", "台積電 EPS 分析", "台積電 最新 財經新聞"]
+
+'''
+
+FUSED_PROMPT = PROMPT.replace("使用者問題：", FUSED_KEYWORDS_PROMPT + "使用者問題：")
+
+def parse_search_keywords(value) -> List[str]:
+    """整理合併模式回傳的搜尋關鍵字：只保留非空字串、去除重複，最多 MAX_SEARCH_KEYWORDS 個"""
+    if not isinstance(value, list):
+        return []
+    search_keywords = []
+    for keyword in value:
+        if isinstance(keyword, str) and keyword.strip() and keyword.strip() not in search_keywords:
+            search_keywords.append(keyword.strip())
+    return search_keywords[:MAX_SEARCH_KEYWORDS]
+
 def detect_stocks(text: str) -> List[str]:
     """偵測股票代號"""
     detected_stocks = []
@@ -145,10 +181,133 @@ def detect_time(question: str) -> str:
     
     return "recent_5_days"
 
-def classify_and_extract(user_input: str, model: str = "gpt-3.5-turbo") -> Dict:
+def log_classification(user_input: str, result: Dict, model: str, latency_ms: float) -> None:
+    """記錄一筆 LLM 分類結果（本機分類器的訓練資料）"""
+    if not CLASSIFY_LOG_FILE:
+        return
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "question": user_input,
+        "model": model,
+        "latency_ms": round(latency_ms, 1),
+        "result": {key: value for key, value in result.items() if key != "search_keywords"}
+    }
+    try:
+        with _classify_log_lock:
+            with open(CLASSIFY_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[classify_and_extract ERROR] 記錄分類結果失敗: {e}")
+
+def _classify_locally(user_input: str, fused: bool, local: bool) -> Optional[Dict]:
+    """先以本機分類器分類，信心足夠時回傳結果；否則在 trace 記錄接下來使用的 LLM 模式並回傳 None"""
+    # 避免循環匯入：本機分類器使用本模組的 detect_stocks / detect_time
+    from langgraph_app.nodes.fast_classifier import fast_classifier
+
+    trace = current_trace()
+    if local:
+        result = fast_classifier.try_classify(user_input)
+        if result is not None:
+            if trace is not None:
+                trace.root.set_attribute("classify.mode", "local")
+            if fused:
+                # 本機分類不產生搜尋關鍵字，第一輪由 generate_search_keywords 產生
+                result["search_keywords"] = []
+            return result
+    if trace is not None:
+        trace.root.set_attribute("classify.mode", "fused" if fused else "two_call")
+    return None
+
+def _resolve_options(fused: Optional[bool], local: Optional[bool]):
+    from langgraph_app.nodes.fast_classifier import FAST_CLASSIFY_ENABLED
+
+    return (CLASSIFY_FUSED_KEYWORDS if fused is None else fused), (FAST_CLASSIFY_ENABLED if local is None else local)
+
+def _classify_messages(user_input: str, fused: bool) -> List[Dict]:
+    prompt = (FUSED_PROMPT if fused else PROMPT).replace("{{ user_input }}", user_input)
+    return [{"role": "user", "content": prompt}]
+
+def _parse_classification(response, user_input: str, model: str, stock_id: str, time_info: str, fused: bool, started: float) -> Dict:
+    """解析 LLM 的分類結果（token 用量已由 LLM 閘道記錄）"""
+    # 解析 JSON 回應
+    try:
+        result = json.loads(response.choices[0].message.content.strip())
+        
+        # 添加調試信息
+        print(f"🔍 DEBUG - OpenAI 原始回應: {response.choices[0].message.content.strip()}")
+        print(f"🔍 DEBUG - 解析後的 result: {result}")
+        print(f"🔍 DEBUG - keywords 長度: {len(result.get('keywords', []))}")
+        
+        # 補充股票代號資訊
+        if stock_id and not result.get("stock_id"):
+            result["stock_id"] = stock_id
+        
+        # 補充時間資訊
+        if time_info and not result.get("time_info"):
+            result["time_info"] = time_info
+
+        # 合併模式的搜尋關鍵字；沒有可用的關鍵字時由 generate_search_keywords 另外產生
+        if fused:
+            result["search_keywords"] = parse_search_keywords(result.get("search_keywords"))
+        else:
+            result.pop("search_keywords", None)
+
+        if not getattr(response, "cache_hit", False):
+            log_classification(user_input, result, model, (time.perf_counter() - started) * 1000)
+        
+        return result
+        
+    except json.JSONDecodeError:
+        # 如果 JSON 解析失敗，返回基本資訊
+        return {
+            "category": "個股分析",
+            "subcategory": ["綜合分析"],
+            "view_type": ["沒有特別"],
+            "keywords": [],
+            "company_name": "",
+            "stock_id": stock_id,
+            "time_info": time_info,
+            "event_type": "其他"
+        }
+
+def _classification_error(user_input: str, stock_id: str, e: Exception) -> Dict:
+    print(f"[classify_and_extract ERROR] {e}")
+    # 🔢 記錄錯誤的 API 調用
+    track_openai_call(
+        node_name="classify_and_extract",
+        response=None,
+        user_input=user_input,
+        stock_id=stock_id,
+        success=False,
+        error_message=str(e)
+    )
+    return {
+        "category": "個股分析",
+        "subcategory": ["綜合分析"],
+        "view_type": ["沒有特別"],
+        "keywords": [],
+        "company_name": "",
+        "stock_id": "",
+        "time_info": "recent_5_days",
+        "event_type": "其他",
+        "error": str(e)
+    }
+
+def classify_and_extract(user_input: str, model: str = "gpt-3.5-turbo", fused: Optional[bool] = None, local: Optional[bool] = None) -> Dict:
     """
     整合的股票偵測、時間偵測和意圖分類
+
+    Args:
+        user_input: 使用者問題
+        model: 模型名稱
+        fused: 是否一併產生第一輪搜尋關鍵字（回傳的 search_keywords），預設依 CLASSIFY_FUSED_KEYWORDS
+        local: 是否先以本機分類器分類（信心足夠時不呼叫 LLM），預設依 FAST_CLASSIFY_ENABLED
     """
+    fused, local = _resolve_options(fused, local)
+    result = _classify_locally(user_input, fused, local)
+    if result is not None:
+        return result
+    stock_id = ""
     try:
         # 1. 偵測股票代號
         stock_ids = detect_stocks(user_input)
@@ -158,79 +317,47 @@ def classify_and_extract(user_input: str, model: str = "gpt-3.5-turbo") -> Dict:
         time_info = detect_time(user_input)
         
         # 3. 使用 OpenAI 進行意圖分類和關鍵字提取
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        prompt = PROMPT.replace("{{ user_input }}", user_input)
-        response = client.chat.completions.create(
+        started = time.perf_counter()
+        response = chat_completion(
+            "classify_and_extract",
             model=model,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        
-        # 🔢 追蹤 token 使用量
-        track_openai_call(
-            node_name="classify_and_extract",
-            response=response,
+            messages=_classify_messages(user_input, fused),
+            temperature=0,
             user_input=user_input,
             stock_id=stock_id
         )
-        
-        # 解析 JSON 回應
-        try:
-            result = json.loads(response.choices[0].message.content.strip())
-            
-            # 添加調試信息
-            print(f"🔍 DEBUG - OpenAI 原始回應: {response.choices[0].message.content.strip()}")
-            print(f"🔍 DEBUG - 解析後的 result: {result}")
-            print(f"🔍 DEBUG - keywords 長度: {len(result.get('keywords', []))}")
-            
-            # 補充股票代號資訊
-            if stock_id and not result.get("stock_id"):
-                result["stock_id"] = stock_id
-            
-            # 補充時間資訊
-            if time_info and not result.get("time_info"):
-                result["time_info"] = time_info
-            
-            return result
-            
-        except json.JSONDecodeError:
-            # 如果 JSON 解析失敗，返回基本資訊
-            return {
-                "category": "個股分析",
-                "subcategory": ["綜合分析"],
-                "view_type": ["沒有特別"],
-                "keywords": [],
-                "company_name": "",
-                "stock_id": stock_id,
-                "time_info": time_info,
-                "event_type": "其他"
-            }
-            
+        return _parse_classification(response, user_input, model, stock_id, time_info, fused, started)
     except Exception as e:
-        print(f"[classify_and_extract ERROR] {e}")
-        # 🔢 記錄錯誤的 API 調用
-        track_openai_call(
-            node_name="classify_and_extract",
-            response=None,
+        return _classification_error(user_input, stock_id, e)
+
+async def aclassify_and_extract(user_input: str, model: str = "gpt-3.5-turbo", fused: Optional[bool] = None, local: Optional[bool] = None) -> Dict:
+    """
+    classify_and_extract 的 async 版本：以 async client 呼叫 LLM，等待回應時不佔用執行緒池
+
+    參數與回傳值與 classify_and_extract 相同
+    """
+    fused, local = _resolve_options(fused, local)
+    result = _classify_locally(user_input, fused, local)
+    if result is not None:
+        return result
+    stock_id = ""
+    try:
+        stock_ids = detect_stocks(user_input)
+        stock_id = stock_ids[0] if stock_ids else ""
+        time_info = detect_time(user_input)
+        started = time.perf_counter()
+        response = await achat_completion(
+            "classify_and_extract",
+            model=model,
+            messages=_classify_messages(user_input, fused),
+            temperature=0,
             user_input=user_input,
-            stock_id=stock_id,
-            success=False,
-            error_message=str(e)
+            stock_id=stock_id
         )
-        return {
-            "category": "個股分析",
-            "subcategory": ["綜合分析"],
-            "view_type": ["沒有特別"],
-            "keywords": [],
-            "company_name": "",
-            "stock_id": "",
-            "time_info": "recent_5_days",
-            "event_type": "其他",
-            "error": str(e)
-        }
+        # 寫入分類記錄檔是檔案 I/O，交給執行緒池
+        return await run_blocking(_parse_classification, response, user_input, model, stock_id, time_info, fused, started)
+    except Exception as e:
+        return await run_blocking(_classification_error, user_input, stock_id, e)
 
 # 測試用
 if __name__ == "__main__":
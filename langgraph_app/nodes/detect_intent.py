@@ -1,4 +1,4 @@
-import openai
+from utils.llm_gateway import chat_completion
 import os
 
 PROMPT = '''你是一位金融語意分類專家。請針對使用者的提問，標註出以下三項資訊：
@@ -47,9 +47,9 @@ PROMPT = '''你是一位金融語意分類專家。請針對使用者的提問
 
 def detect_intent(question: str, model: str = "gpt-3.5-turbo"):
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         user_prompt = PROMPT.replace("（這裡填入使用者問題）", question)
-        response = client.chat.completions.create(
+        response = chat_completion(
+            "detect_intent",
             model=model,
             messages=[
                 {"role": "user", "content": user_prompt}
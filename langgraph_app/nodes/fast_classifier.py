@@ -0,0 +1,350 @@
+"""
+本機快速問題理解
+
+大部分的問題都很單純（「台積電最近怎麼樣」、「2330 EPS 多少」、「聯電法人買賣超」），
+不需要等一次 LLM 呼叫才知道分類。這裡在 classify_and_extract 呼叫 LLM 之前先在本機分類，
+輸出與 LLM 相同的 JSON 欄位：
+- 規則：股票別名字典（detect_stocks）、時間（detect_time）、圖表關鍵字（CHART_MAPPING）
+  與事件 / 查詢句型，直接決定股票、時間、關鍵字，並在句型明確時決定分類
+- 模型：以 classify_and_extract 記錄的 LLM 輸出（CLASSIFY_LOG_FILE）訓練的字元 n-gram
+  邏輯迴歸，預測 category / subcategory / view_type / event_type
+每個欄位取規則與模型中較有把握的一方（兩者不一致時信心取較低者），整體信心為各欄位的最小值；
+信心低於 FAST_CLASSIFY_THRESHOLD 時仍呼叫 LLM。規則單獨判斷的信心（RULE_CONFIDENCE）低於預設門檻，
+沒有模型（或模型不同意）時規則的結果不會直接採用。
+
+離線評估（與 LLM 的一致率、延遲）與訓練模型請使用 eval_intent_classifier.py。
+"""
+
+import json
+import math
+import os
+import random
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langgraph_app.nodes.classify_and_extract import detect_stocks, detect_time, stock_dict
+from langgraph_app.nodes.detect_chart import CHART_MAPPING
+
+FAST_CLASSIFY_ENABLED = os.getenv("FAST_CLASSIFY_ENABLED", "1") == "1"
+# 信心不低於此值時直接使用本機分類結果
+FAST_CLASSIFY_THRESHOLD = float(os.getenv("FAST_CLASSIFY_THRESHOLD", "0.85"))
+# 訓練好的模型（JSON），不存在時只使用規則
+FAST_CLASSIFY_MODEL = os.getenv(
+    "FAST_CLASSIFY_MODEL", os.path.join(os.path.dirname(__file__), "../../data/intent_model.json")
+)
+
+# 模型預測的欄位；清單欄位以第一個值為標籤
+LABEL_FIELDS = ["category", "subcategory", "view_type", "event_type"]
+# 規則判斷明確時的信心；低於預設的 FAST_CLASSIFY_THRESHOLD，須有模型同意才會直接採用
+RULE_CONFIDENCE = 0.8
+# 問題中的股票以同一個字元取代，模型學到的是句型而不是個別股票
+STOCK_PLACEHOLDER = "Ⓢ"
+
+# 圖表類型對應的投資面向與子分類
+CHART_ASPECTS = {
+    "技術分析": ("技術面", "技術面分析"),
+    "籌碼分析": ("籌碼面", "籌碼面分析"),
+    "基本面": ("基本面", "基本面分析"),
+}
+# 依序比對，第一個符合的為事件類型
+EVENT_PATTERNS = [
+    (re.compile(r"漲停"), "漲停"),
+    (re.compile(r"跌停"), "跌停"),
+    (re.compile(r"法說會?"), "法說會"),
+    (re.compile(r"財報|季報|年報"), "財報"),
+    (re.compile(r"大漲|上漲|走高|飆|噴|漲(?!跌)"), "上漲"),
+    (re.compile(r"大跌|下跌|重挫|走低|(?<!漲)跌"), "下跌"),
+    (re.compile(r"新聞|消息|公告"), "新聞"),
+]
+# 否定或同時提到漲與跌（不漲反跌、先漲後跌、漲多拉回）時規則無法判斷上漲 / 下跌
+NEGATED_DIRECTION_PATTERN = re.compile(r"[不沒未][大上下]?[漲跌]")
+UP_PATTERN = re.compile(r"漲|走高|飆|噴|反彈")
+DOWN_PATTERN = re.compile(r"跌|重挫|走低|拉回|回檔")
+# 單一指標查詢（個股資訊查找）
+INFO_LOOKUP_PATTERN = re.compile(r"多少|幾元|幾塊|幾%|是幾|查詢|給我")
+# 漲跌原因、買賣建議（價格評論）
+PRICE_COMMENT_PATTERN = re.compile(r"為什麼|為何|原因|可以買|能買|該買|該賣|要賣|進場|出場")
+# 沒有特定面向的綜合性問題
+OVERVIEW_PATTERN = re.compile(r"怎麼樣|怎樣|如何|表現|近況|最近")
+# 預測性問題在 LLM 的分類中屬於無效問題，交給 LLM 判斷
+PREDICTIVE_PATTERN = re.compile(r"會漲嗎|會跌嗎|會不會|明天.*[漲跌]|預測|猜")
+COMPARE_PATTERN = re.compile(r"比較|對比|哪個好|哪一檔|優劣|差別|vs", re.IGNORECASE)
+
+def _stock_aliases(stock_id: str) -> List[str]:
+    return stock_dict.get(stock_id, [stock_id])
+
+def _company_name(question: str, stock_id: str) -> str:
+    """
+    問題中出現的最長別名；問題只有代號時用最短的中文別名
+    （別名字典沒有標示正式名稱，最短的中文別名通常是簡稱，例如 台積電、聯電、鴻海）
+    """
+    names = [alias for alias in _stock_aliases(stock_id) if not alias.isdigit()]
+    present = [alias for alias in names if alias in question]
+    if present:
+        return max(present, key=len)
+    chinese = [alias for alias in names if len(alias) >= 2 and not alias.isascii() and not re.search(r"[a-z]", alias, re.IGNORECASE)]
+    return min(chinese or names, key=len) if names else ""
+
+def normalize_question(question: str, stock_ids: List[str] = None) -> str:
+    """模型輸入：小寫、去除空白，股票別名與代號以 STOCK_PLACEHOLDER 取代"""
+    text = question.lower()
+    stock_ids = detect_stocks(question) if stock_ids is None else stock_ids
+    aliases = sorted({alias.lower() for stock_id in stock_ids for alias in _stock_aliases(stock_id)}, key=len, reverse=True)
+    for alias in aliases:
+        text = text.replace(alias, STOCK_PLACEHOLDER)
+    return "".join(text.split())
+
+def _mixed_direction(question: str) -> bool:
+    """問題中的漲跌方向是否否定或相反（「漲跌」、「漲跌幅」是中性的用詞，不算）"""
+    text = question.replace("漲跌", "")
+    return bool(NEGATED_DIRECTION_PATTERN.search(text) or (UP_PATTERN.search(text) and DOWN_PATTERN.search(text)))
+
+def rule_classify(question: str) -> Tuple[Dict, Dict[str, float]]:
+    """
+    以規則分類
+
+    Returns:
+        (結果, 各欄位的信心)；規則無法判斷的欄位不會出現在信心中
+    """
+    stock_ids = detect_stocks(question)
+    stock_id = stock_ids[0] if stock_ids else ""
+    company_name = _company_name(question, stock_id) if stock_id else ""
+    lowered = question.lower()
+
+    aspects = []
+    matched_keywords = []
+    for chart_type, config in CHART_MAPPING.items():
+        hits = [keyword for keyword in config["keywords"] if keyword.lower() in lowered]
+        if hits:
+            matched_keywords.extend(hits)
+            if chart_type in CHART_ASPECTS:
+                aspects.append(CHART_ASPECTS[chart_type])
+
+    event_type = "其他"
+    for pattern, name in EVENT_PATTERNS:
+        match = pattern.search(question)
+        if match:
+            event_type = name
+            matched_keywords.append(match.group(0))
+            break
+
+    keywords = []
+    for keyword in [company_name, stock_id] + matched_keywords:
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+
+    result = {
+        "category": "",
+        "subcategory": [],
+        "view_type": [aspect for aspect, _ in aspects] or ["沒有特別"],
+        "keywords": keywords[:5],
+        "company_name": company_name,
+        "stock_id": stock_id,
+        "time_info": detect_time(question),
+        "event_type": event_type,
+    }
+    confidence = {}
+    if not stock_ids or PREDICTIVE_PATTERN.search(question):
+        return result, confidence
+
+    if len(stock_ids) > 1 and COMPARE_PATTERN.search(question):
+        result["category"] = "比較分析"
+        result["subcategory"] = ["個股比較"]
+    elif len(stock_ids) == 1:
+        result["category"] = "個股分析"
+        if INFO_LOOKUP_PATTERN.search(question):
+            result["subcategory"] = ["個股資訊查找"]
+        elif aspects:
+            result["subcategory"] = [subcategory for _, subcategory in aspects]
+        elif PRICE_COMMENT_PATTERN.search(question) or event_type in ("漲停", "跌停", "上漲", "下跌"):
+            result["subcategory"] = ["價格評論"]
+        elif OVERVIEW_PATTERN.search(question):
+            result["subcategory"] = ["綜合分析"]
+    if result["category"] and result["subcategory"]:
+        confidence = {field: RULE_CONFIDENCE for field in LABEL_FIELDS}
+        if event_type in ("上漲", "下跌") and _mixed_direction(question):
+            # 事件類型由模型或 LLM 判斷
+            result["event_type"] = "其他"
+            del confidence["event_type"]
+    return result, confidence
+
+class CharNgramClassifier:
+    """
+    字元 n-gram 的多類別邏輯迴歸（純 Python，以 SGD 訓練）
+
+    特徵為問題中出現的 1~3 字元片段（二元值，依特徵數正規化），權重以稀疏字典保存。
+    """
+
+    def __init__(self, labels: List[str], weights: Dict[str, Dict[str, float]] = None, bias: Dict[str, float] = None, max_n: int = 3):
+        self.labels = labels
+        self.weights = weights or {}
+        self.bias = bias or {label: 0.0 for label in labels}
+        self.max_n = max_n
+
+    def features(self, text: str) -> List[str]:
+        grams = {text[i:i + n] for n in range(1, self.max_n + 1) for i in range(len(text) - n + 1)}
+        return sorted(grams)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """各標籤的機率"""
+        features = self.features(text)
+        scale = 1 / math.sqrt(len(features)) if features else 0.0
+        scores = dict(self.bias)
+        for feature in features:
+            for label, weight in self.weights.get(feature, {}).items():
+                scores[label] += weight * scale
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """機率最高的標籤與機率"""
+        probs = self.predict_proba(text)
+        label = max(probs, key=probs.get)
+        return label, probs[label]
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str], epochs: int = 30, learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 0) -> "CharNgramClassifier":
+        """以 SGD 訓練；相同的資料與 seed 得到相同的模型"""
+        model = cls(sorted(set(labels)))
+        samples = list(zip(texts, labels))
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for text, label in samples:
+                features = model.features(text)
+                if not features:
+                    continue
+                scale = 1 / math.sqrt(len(features))
+                probs = model.predict_proba(text)
+                for candidate, prob in probs.items():
+                    gradient = prob - (1.0 if candidate == label else 0.0)
+                    model.bias[candidate] -= rate * gradient
+                    for feature in features:
+                        row = model.weights.setdefault(feature, {})
+                        weight = row.get(candidate, 0.0)
+                        row[candidate] = weight - rate * (gradient * scale + l2 * weight)
+        return model
+
+    def to_dict(self) -> Dict:
+        weights = {
+            feature: {label: round(weight, 5) for label, weight in row.items() if abs(weight) >= 1e-4}
+            for feature, row in self.weights.items()
+        }
+        return {
+            "labels": self.labels,
+            "bias": self.bias,
+            "max_n": self.max_n,
+            "weights": {feature: row for feature, row in weights.items() if row}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CharNgramClassifier":
+        return cls(data["labels"], data["weights"], data["bias"], data.get("max_n", 3))
+
+def _label(value) -> str:
+    if isinstance(value, list):
+        return str(value[0]) if value else ""
+    return str(value or "")
+
+def load_classify_log(path: str) -> List[Dict]:
+    """讀取 classify_and_extract 記錄的 LLM 輸出（JSON Lines），略過格式錯誤的行"""
+    records = []
+    if not path or not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("question") and isinstance(record.get("result"), dict):
+                records.append(record)
+    return records
+
+def train_intent_model(records: List[Dict], **kwargs) -> Dict[str, CharNgramClassifier]:
+    """以記錄的 LLM 輸出為每個標籤欄位訓練一個分類器"""
+    texts = [normalize_question(record["question"]) for record in records]
+    models = {}
+    for field in LABEL_FIELDS:
+        labels = [_label(record["result"].get(field)) for record in records]
+        pairs = [(text, label) for text, label in zip(texts, labels) if label]
+        if not pairs:
+            continue
+        models[field] = CharNgramClassifier.train([text for text, _ in pairs], [label for _, label in pairs], **kwargs)
+    return models
+
+def save_intent_model(models: Dict[str, CharNgramClassifier], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({field: model.to_dict() for field, model in models.items()}, f, ensure_ascii=False)
+
+def load_intent_model(path: str) -> Dict[str, CharNgramClassifier]:
+    """載入模型，檔案不存在或格式錯誤時回傳空字典（只使用規則）"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {field: CharNgramClassifier.from_dict(values) for field, values in data.items() if field in LABEL_FIELDS}
+    except Exception as e:
+        print(f"[FastIntentClassifier ERROR] 載入模型失敗: {e}")
+        return {}
+
+class FastIntentClassifier:
+    """規則 + 字元 n-gram 模型的本機分類器"""
+
+    def __init__(self, models: Dict[str, CharNgramClassifier] = None, threshold: float = None):
+        self.models = models or {}
+        self.threshold = FAST_CLASSIFY_THRESHOLD if threshold is None else threshold
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "fallback": 0}
+
+    def classify(self, question: str) -> Tuple[Dict, float]:
+        """
+        本機分類
+
+        Returns:
+            (與 classify_and_extract 相同欄位的結果, 信心)
+        """
+        result, rule_confidence = rule_classify(question)
+        text = normalize_question(question, [result["stock_id"]] if result["stock_id"] else [])
+        confidences = []
+        for field in LABEL_FIELDS:
+            rule_value = _label(result[field]) if field in rule_confidence else ""
+            model = self.models.get(field)
+            if model is None:
+                confidences.append(rule_confidence.get(field, 0.0))
+                continue
+            label, prob = model.predict(text)
+            if not rule_value:
+                result[field] = [label] if isinstance(result[field], list) else label
+                confidences.append(prob)
+            elif label == rule_value:
+                confidences.append(max(prob, rule_confidence[field]))
+            else:
+                # 規則與模型不一致：採用較有把握的一方，但信心取較低者，通常會交給 LLM
+                if prob > rule_confidence[field]:
+                    result[field] = [label] if isinstance(result[field], list) else label
+                confidences.append(min(prob, rule_confidence[field]))
+        return result, min(confidences)
+
+    def try_classify(self, question: str) -> Optional[Dict]:
+        """信心足夠時回傳結果，否則回傳 None（由 LLM 分類）"""
+        result, confidence = self.classify(question)
+        accepted = confidence >= self.threshold
+        with self._lock:
+            self.stats["local" if accepted else "fallback"] += 1
+        return result if accepted else None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats["local"] + stats["fallback"]
+        stats["local_rate"] = stats["local"] / total if total else 0.0
+        stats["models"] = sorted(self.models)
+        return stats
+
+fast_classifier = FastIntentClassifier(load_intent_model(FAST_CLASSIFY_MODEL))
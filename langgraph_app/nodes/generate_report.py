@@ -1,4 +1,3 @@
-import openai
 import json
 from typing import List, Dict
 import os
@@ -1,8 +1,10 @@
+import functools
 import json
+import re
 import sys
 import os
-from typing import List, Dict
-import openai
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional
 
 # 添加父目錄到 path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,6 +17,219 @@ from langgraph_app.nodes.generate_section_notice import generate_notice_section
 from langgraph_app.nodes.generate_section_sources import generate_sources_section
 from langgraph_app.nodes.generate_section_disclaimer import generate_disclaimer_section
 from langgraph_app.nodes.generate_section_institutional_trend import generate_institutional_trend_section
+from langgraph_app.nodes.section_executor import run_sections
+from utils.concurrency import submit_with_context
+from utils.deadline import has_budget
+from utils.llm_gateway import chat_completion
+
+# 可略過的階段所需的最少剩餘秒數（請求時間不足時略過）
+SOCIAL_SENTIMENT_MIN_BUDGET = 20
+PARAPHRASE_MIN_BUDGET = 15
+
+def build_price_movement(company_name: str, stock_id: str, news_summary: str, news_sources: List[Dict]) -> Dict:
+    """產生股價異動總結，並只保留卡片中實際引用到的來源"""
+    price_result = generate_price_movement_section(company_name, stock_id, news_summary, news_sources)
+    if price_result.get("success"):
+        print(f"[DEBUG] append 股價異動總結 section: {json.dumps(price_result['section'], ensure_ascii=False)}")
+        # 只萃取實際用到的來源
+        used_indices = set()
+        for card in price_result["section"].get("cards", []):
+            # 找出所有 [來源X]
+            matches = re.findall(r"\[來源(\d+)\]", card.get("content", ""))
+            for m in matches:
+                try:
+                    idx = int(m) - 1
+                    if news_sources and 0 <= idx < len(news_sources):
+                        used_indices.add(idx)
+                except Exception:
+                    pass
+        # 按照出現順序組成 sources 陣列
+        sources = [news_sources[i] for i in sorted(used_indices)] if news_sources else []
+        price_result["section"]["sources"] = sources
+        print(f"[DEBUG] ✅ 股價異動總結產生成功")
+        return {"section": price_result["section"], "result": price_result, "logs": ["✅ 股價異動總結產生成功"]}
+
+    print(f"[DEBUG] ❌ 股價異動總結產生失敗: {price_result.get('error', '未知錯誤')}")
+    # 確保預設內容也有 sources
+    if "section" not in price_result:
+        price_result["section"] = {
+            "section": "股價異動總結",
+            "cards": [
+                {
+                    "title": "近期漲跌主因",
+                    "content": f"根據新聞分析，{company_name}({stock_id})近期股價變動主要受到市場因素影響。"
+                },
+                {
+                    "title": "法人動向",
+                    "content": f"法人買賣超分析：需關注外資和投信動向。"
+                },
+                {
+                    "title": "技術面觀察",
+                    "content": f"技術指標分析：建議關注支撐壓力位。"
+                }
+            ],
+            "sources": news_sources if news_sources else []
+        }
+    else:
+        # 確保 section 有 sources
+        if "sources" not in price_result["section"]:
+            price_result["section"]["sources"] = news_sources if news_sources else []
+    return {"section": price_result["section"], "result": None, "logs": ["❌ 股價異動總結產生失敗，使用預設內容"]}
+
+def build_institutional_trend(stock_id: str) -> Dict:
+    """產生法人動向分析"""
+    try:
+        institutional_result = generate_institutional_trend_section(stock_id)
+        print(f"[DEBUG] ✅ 法人動向分析產生成功")
+        return {"section": institutional_result, "result": None, "logs": ["✅ 法人動向分析產生成功"]}
+    except Exception as e:
+        print(f"[DEBUG] ❌ 法人動向分析產生失敗: {e}")
+        return {"section": None, "result": None, "logs": [f"❌ 法人動向分析產生失敗: {e}"]}
+
+def build_financial(company_name: str, stock_id: str, financial_data: Dict, news_summary: str, news_sources: List[Dict]) -> Dict:
+    """產生財務狀況分析"""
+    financial_result = generate_financial_section(company_name, stock_id, financial_data, news_summary)
+    # 添加 sources 資訊到 section
+    financial_result["section"]["sources"] = news_sources
+    if financial_result.get("success"):
+        print(f"[DEBUG] append 財務狀況分析 section: {json.dumps(financial_result['section'], ensure_ascii=False)}")
+        print(f"[DEBUG] ✅ 財務狀況分析產生成功")
+        return {"section": financial_result["section"], "result": financial_result, "logs": ["✅ 財務狀況分析產生成功"]}
+    print(f"[DEBUG] ❌ 財務狀況分析產生失敗: {financial_result.get('error', '未知錯誤')}")
+    return {"section": financial_result["section"], "result": None, "logs": ["❌ 財務狀況分析產生失敗，使用預設內容"]}
+
+def build_strategy(company_name: str, stock_id: str, news_summary: str, financial_data: Dict, news_sources: List[Dict], section_delta: Optional[Callable] = None) -> Dict:
+    """產生投資策略建議；有 section_delta 時串流產生，卡片邊產生邊送出"""
+    on_delta = functools.partial(section_delta, "投資策略建議") if section_delta else None
+    strategy_result = generate_strategy_section(company_name, stock_id, news_summary, financial_data, news_sources, on_delta=on_delta)
+    # 添加 sources 資訊到 section
+    strategy_result["section"]["sources"] = news_sources
+    if strategy_result.get("success"):
+        print(f"[DEBUG] append 投資策略建議 section: {json.dumps(strategy_result['section'], ensure_ascii=False)}")
+        print(f"[DEBUG] ✅ 投資策略建議產生成功")
+        return {"section": strategy_result["section"], "result": strategy_result, "logs": ["✅ 投資策略建議產生成功"]}
+    print(f"[DEBUG] ❌ 投資策略建議產生失敗: {strategy_result.get('error', '未知錯誤')}")
+    return {"section": strategy_result["section"], "result": None, "logs": ["❌ 投資策略建議產生失敗，使用預設內容"]}
+
+def build_social_sentiment(company_name: str, stock_id: str) -> Dict:
+    """產生爆料同學會輿情分析"""
+    sentiment_result = generate_social_sentiment_section(company_name, stock_id)
+    # 添加 sources 資訊到 section
+    sentiment_result["section"]["sources"] = []
+    if sentiment_result.get("success"):
+        print(f"[DEBUG] append 爆料同學會輿情分析 section: {json.dumps(sentiment_result['section'], ensure_ascii=False)}")
+        print(f"[DEBUG] ✅ 爆料同學會輿情分析產生成功")
+        return {"section": sentiment_result["section"], "result": sentiment_result, "logs": ["✅ 爆料同學會輿情分析產生成功"]}
+    print(f"[DEBUG] ❌ 爆料同學會輿情分析產生失敗: {sentiment_result.get('error', '未知錯誤')}")
+    return {"section": sentiment_result["section"], "result": None, "logs": ["❌ 爆料同學會輿情分析產生失敗，使用預設內容"]}
+
+def build_notice(company_name: str, stock_id: str, news_summary: str, news_sources: List[Dict]) -> Dict:
+    """產生操作注意事項"""
+    notice_result = generate_notice_section(company_name, stock_id, news_summary)
+    # 添加 sources 資訊到 section
+    notice_result["section"]["sources"] = news_sources
+    if notice_result.get("success"):
+        print(f"[DEBUG] append 操作注意事項 section: {json.dumps(notice_result['section'], ensure_ascii=False)}")
+        print(f"[DEBUG] ✅ 操作注意事項產生成功")
+        return {"section": notice_result["section"], "result": notice_result, "logs": ["✅ 操作注意事項產生成功"]}
+    print(f"[DEBUG] ❌ 操作注意事項產生失敗: {notice_result.get('error', '未知錯誤')}")
+    return {"section": notice_result["section"], "result": None, "logs": ["❌ 操作注意事項產生失敗，使用預設內容"]}
+
+def build_sources(news_sources: List[Dict], financial_sources: List[Dict]) -> Dict:
+    """產生資料來源"""
+    sources_result = generate_sources_section(news_sources, financial_sources)
+    if sources_result.get("success"):
+        print(f"[DEBUG] append 資料來源 section: {json.dumps(sources_result['section'], ensure_ascii=False)}")
+        print(f"[DEBUG] ✅ 資料來源產生成功")
+        return {"section": sources_result["section"], "result": sources_result, "logs": ["✅ 資料來源產生成功"]}
+    print(f"[DEBUG] ❌ 資料來源產生失敗: {sources_result.get('error', '未知錯誤')}")
+    return {"section": sources_result["section"], "result": None, "logs": ["❌ 資料來源產生失敗，使用預設內容"]}
+
+def build_disclaimer() -> Dict:
+    """產生免責聲明"""
+    disclaimer_result = generate_disclaimer_section()
+    if disclaimer_result.get("success"):
+        print(f"[DEBUG] append 免責聲明 section: {json.dumps(disclaimer_result['section'], ensure_ascii=False)}")
+        print(f"[DEBUG] ✅ 免責聲明產生成功")
+        return {"section": disclaimer_result["section"], "result": disclaimer_result, "logs": ["✅ 免責聲明產生成功"]}
+    print(f"[DEBUG] ❌ 免責聲明產生失敗: {disclaimer_result.get('error', '未知錯誤')}")
+    return {"section": disclaimer_result["section"], "result": None, "logs": ["❌ 免責聲明產生失敗，使用預設內容"]}
+
+# 報告 section 定義，順序即 UI 順序
+REPORT_SECTIONS = [
+    {
+        "name": "股價異動總結",
+        "step": "步驟 1: 產生股價異動總結",
+        "inputs": ["company_name", "stock_id", "news_summary", "news_sources"],
+        "build": build_price_movement
+    },
+    {
+        "name": "法人動向分析",
+        "step": "步驟 1.5: 產生法人動向分析",
+        "inputs": ["stock_id"],
+        "build": build_institutional_trend
+    },
+    {
+        "name": "財務狀況分析",
+        "step": "步驟 2: 產生財務狀況分析",
+        "inputs": ["company_name", "stock_id", "financial_data", "news_summary", "news_sources"],
+        "build": build_financial
+    },
+    {
+        "name": "投資策略建議",
+        "step": "步驟 3: 產生投資策略建議",
+        "inputs": ["company_name", "stock_id", "news_summary", "financial_data", "news_sources", "section_delta"],
+        "build": build_strategy
+    },
+    {
+        "name": "爆料同學會輿情分析",
+        "step": "步驟 4: 產生爆料同學會輿情分析",
+        "inputs": ["company_name", "stock_id"],
+        "build": build_social_sentiment,
+        "min_budget": SOCIAL_SENTIMENT_MIN_BUDGET
+    },
+    {
+        "name": "操作注意事項",
+        "step": "步驟 5: 產生操作注意事項",
+        "inputs": ["company_name", "stock_id", "news_summary", "news_sources"],
+        "build": build_notice
+    },
+    {
+        "name": "資料來源",
+        "step": "步驟 6: 產生資料來源",
+        "inputs": ["news_sources", "financial_sources"],
+        "build": build_sources
+    },
+    {
+        "name": "免責聲明",
+        "step": "步驟 7: 產生免責聲明",
+        "inputs": [],
+        "build": build_disclaimer
+    },
+]
+
+def paraphrase_prompt(user_prompt: str) -> str:
+    """用 LLM 將使用者問題改寫成適合放在報告開頭的句子"""
+    if not user_prompt:
+        return None
+    if not has_budget(PARAPHRASE_MIN_BUDGET, stage="改寫問題"):
+        return user_prompt
+    try:
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if openai_api_key:
+            prompt = f"請用更自然、口語化的方式改寫這句投資問題，保持原意但更適合放在報告開頭：\n{user_prompt}"
+            response = chat_completion(
+                "paraphrase_prompt",
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.5
+            )
+            paraphrased = response.choices[0].message.content.strip()
+            return f"{user_prompt} - {paraphrased}"
+        return user_prompt
+    except Exception as e:
+        print(f"[DEBUG] OpenAI paraphrase 失敗: {str(e)}")
+        return user_prompt
 
 def generate_report_pipeline(
     company_name: str,
@@ -24,11 +239,14 @@ def generate_report_pipeline(
     news_summary: str = "",
     news_sources: List[Dict] = None,
     financial_data: Dict = None,
-    financial_sources: List[Dict] = None
+    financial_sources: List[Dict] = None,
+    on_section: Optional[Callable[[Dict], None]] = None
 ) -> Dict:
     """
     主 pipeline：整合所有 section 節點，產生完整的投資分析報告
     
+    互不相依的 section 會並行產生，回傳時仍維持 REPORT_SECTIONS 的 UI 順序
+    
     Args:
         company_name: 公司名稱
         stock_id: 股票代號
@@ -38,10 +256,14 @@ def generate_report_pipeline(
         news_sources: 新聞來源列表
         financial_data: 財務資料
         financial_sources: 財務資料來源列表
+        on_section: （可選）每個 section 完成時立即呼叫，參數包含 index（UI 順序）、total、name、section；
+            串流產生的 section 在完成前另以 delta（card_index、card）呼叫
     
     Returns:
         完整的投資分析報告
     """
+    # 初始化 logs
+    logs = []
     try:
         print(f"[DEBUG] ===== 開始執行投資分析報告 pipeline =====")
         print(f"[DEBUG] 公司名稱: {company_name}")
@@ -51,181 +273,63 @@ def generate_report_pipeline(
         print(f"[DEBUG] 新聞來源數量: {len(news_sources) if news_sources else 0}")
         print(f"[DEBUG] 財務資料: {financial_data is not None}")
         
-        # 初始化 logs
-        logs = []
         logs.append(f"[{time_info}] 開始產生 {company_name}({stock_id}) 投資分析報告")
         
-        all_sections = []
-        section_results = {}
-        
-        # 1. 產生股價異動總結
-        print(f"\n[DEBUG] ===== 步驟 1: 產生股價異動總結 =====")
-        logs.append("步驟 1: 產生股價異動總結")
-        price_result = generate_price_movement_section(company_name, stock_id, news_summary, news_sources)
-        if price_result.get("success"):
-            print(f"[DEBUG] append 股價異動總結 section: {json.dumps(price_result['section'], ensure_ascii=False)}")
-            # 只萃取實際用到的來源
-            used_indices = set()
-            for card in price_result["section"].get("cards", []):
-                # 找出所有 [來源X]
-                import re
-                matches = re.findall(r"\[來源(\d+)\]", card.get("content", ""))
-                for m in matches:
-                    try:
-                        idx = int(m) - 1
-                        if news_sources and 0 <= idx < len(news_sources):
-                            used_indices.add(idx)
-                    except Exception:
-                        pass
-            # 按照出現順序組成 sources 陣列
-            sources = [news_sources[i] for i in sorted(used_indices)] if news_sources else []
-            price_result["section"]["sources"] = sources
-            all_sections.append(price_result["section"])
-            section_results["股價異動總結"] = price_result
-            logs.append("✅ 股價異動總結產生成功")
-            print(f"[DEBUG] ✅ 股價異動總結產生成功")
-        else:
-            print(f"[DEBUG] ❌ 股價異動總結產生失敗: {price_result.get('error', '未知錯誤')}")
-            # 確保預設內容也有 sources
-            if "section" not in price_result:
-                price_result["section"] = {
-                    "section": "股價異動總結",
-                    "cards": [
-                        {
-                            "title": "近期漲跌主因",
-                            "content": f"根據新聞分析，{company_name}({stock_id})近期股價變動主要受到市場因素影響。"
-                        },
-                        {
-                            "title": "法人動向",
-                            "content": f"法人買賣超分析：需關注外資和投信動向。"
-                        },
-                        {
-                            "title": "技術面觀察",
-                            "content": f"技術指標分析：建議關注支撐壓力位。"
-                        }
-                    ],
-                    "sources": news_sources if news_sources else []
-                }
-            else:
-                # 確保 section 有 sources
-                if "sources" not in price_result["section"]:
-                    price_result["section"]["sources"] = news_sources if news_sources else []
-            all_sections.append(price_result["section"])  # 使用預設內容
-            logs.append("❌ 股價異動總結產生失敗，使用預設內容")
-        
-        # 1.5 產生法人動向分析
-        print(f"\n[DEBUG] ===== 步驟 1.5: 產生法人動向分析 =====")
-        logs.append("步驟 1.5: 產生法人動向分析")
-        try:
-            institutional_result = generate_institutional_trend_section(stock_id)
-            all_sections.append(institutional_result)
-            logs.append("✅ 法人動向分析產生成功")
-            print(f"[DEBUG] ✅ 法人動向分析產生成功")
-        except Exception as e:
-            logs.append(f"❌ 法人動向分析產生失敗: {e}")
-            print(f"[DEBUG] ❌ 法人動向分析產生失敗: {e}")
+        section_indices = {spec["name"]: index for index, spec in enumerate(REPORT_SECTIONS)}
         
-        # 2. 產生財務狀況分析
-        print(f"\n[DEBUG] ===== 步驟 2: 產生財務狀況分析 =====")
-        logs.append("步驟 2: 產生財務狀況分析")
-        financial_result = generate_financial_section(company_name, stock_id, financial_data, news_summary)
-        if financial_result.get("success"):
-            print(f"[DEBUG] append 財務狀況分析 section: {json.dumps(financial_result['section'], ensure_ascii=False)}")
-            # 添加 sources 資訊到 section
-            financial_result["section"]["sources"] = news_sources
-            all_sections.append(financial_result["section"])
-            section_results["財務狀況分析"] = financial_result
-            logs.append("✅ 財務狀況分析產生成功")
-            print(f"[DEBUG] ✅ 財務狀況分析產生成功")
-        else:
-            print(f"[DEBUG] ❌ 財務狀況分析產生失敗: {financial_result.get('error', '未知錯誤')}")
-            financial_result["section"]["sources"] = news_sources
-            all_sections.append(financial_result["section"])  # 使用預設內容
-            logs.append("❌ 財務狀況分析產生失敗，使用預設內容")
+        def emit_delta(name: str, card_index: int, card: Dict):
+            # 串流中的 section 每有卡片更新就先送出，完整 section 仍由 emit_section 送出
+            on_section({
+                "index": section_indices[name],
+                "total": len(REPORT_SECTIONS),
+                "name": name,
+                "delta": {"card_index": card_index, "card": card}
+            })
         
-        # 3. 產生投資策略建議
-        print(f"\n[DEBUG] ===== 步驟 3: 產生投資策略建議 =====")
-        logs.append("步驟 3: 產生投資策略建議")
-        strategy_result = generate_strategy_section(company_name, stock_id, news_summary, financial_data, news_sources)
-        if strategy_result.get("success"):
-            print(f"[DEBUG] append 投資策略建議 section: {json.dumps(strategy_result['section'], ensure_ascii=False)}")
-            # 添加 sources 資訊到 section
-            strategy_result["section"]["sources"] = news_sources
-            all_sections.append(strategy_result["section"])
-            section_results["投資策略建議"] = strategy_result
-            logs.append("✅ 投資策略建議產生成功")
-            print(f"[DEBUG] ✅ 投資策略建議產生成功")
-        else:
-            print(f"[DEBUG] ❌ 投資策略建議產生失敗: {strategy_result.get('error', '未知錯誤')}")
-            strategy_result["section"]["sources"] = news_sources
-            all_sections.append(strategy_result["section"])  # 使用預設內容
-            logs.append("❌ 投資策略建議產生失敗，使用預設內容")
-        
-        # 4. 產生爆料同學會輿情分析
-        print(f"\n[DEBUG] ===== 步驟 4: 產生爆料同學會輿情分析 =====")
-        logs.append("步驟 4: 產生爆料同學會輿情分析")
-        sentiment_result = generate_social_sentiment_section(company_name, stock_id)
-        if sentiment_result.get("success"):
-            print(f"[DEBUG] append 爆料同學會輿情分析 section: {json.dumps(sentiment_result['section'], ensure_ascii=False)}")
-            # 添加 sources 資訊到 section
-            sentiment_result["section"]["sources"] = []
-            all_sections.append(sentiment_result["section"])
-            section_results["爆料同學會輿情分析"] = sentiment_result
-            logs.append("✅ 爆料同學會輿情分析產生成功")
-            print(f"[DEBUG] ✅ 爆料同學會輿情分析產生成功")
-        else:
-            print(f"[DEBUG] ❌ 爆料同學會輿情分析產生失敗: {sentiment_result.get('error', '未知錯誤')}")
-            sentiment_result["section"]["sources"] = []
-            all_sections.append(sentiment_result["section"])  # 使用預設內容
-            logs.append("❌ 爆料同學會輿情分析產生失敗，使用預設內容")
+        context = {
+            "company_name": company_name,
+            "stock_id": stock_id,
+            "news_summary": news_summary,
+            "news_sources": news_sources,
+            "financial_data": financial_data,
+            "financial_sources": financial_sources,
+            "section_delta": emit_delta if on_section else None,
+        }
         
-        # 5. 產生操作注意事項
-        print(f"\n[DEBUG] ===== 步驟 5: 產生操作注意事項 =====")
-        logs.append("步驟 5: 產生操作注意事項")
-        notice_result = generate_notice_section(company_name, stock_id, news_summary)
-        if notice_result.get("success"):
-            print(f"[DEBUG] append 操作注意事項 section: {json.dumps(notice_result['section'], ensure_ascii=False)}")
-            # 添加 sources 資訊到 section
-            notice_result["section"]["sources"] = news_sources
-            all_sections.append(notice_result["section"])
-            section_results["操作注意事項"] = notice_result
-            logs.append("✅ 操作注意事項產生成功")
-            print(f"[DEBUG] ✅ 操作注意事項產生成功")
-        else:
-            print(f"[DEBUG] ❌ 操作注意事項產生失敗: {notice_result.get('error', '未知錯誤')}")
-            notice_result["section"]["sources"] = news_sources
-            all_sections.append(notice_result["section"])  # 使用預設內容
-            logs.append("❌ 操作注意事項產生失敗，使用預設內容")
+        def emit_section(index: int, run: Dict):
+            # section 一完成就往外送，不必等待整份報告
+            outcome = run.get("outcome")
+            if on_section and outcome and outcome.get("section") is not None:
+                on_section({
+                    "index": index,
+                    "total": len(REPORT_SECTIONS),
+                    "name": run["name"],
+                    "section": outcome["section"]
+                })
         
-        # 6. 產生資料來源
-        print(f"\n[DEBUG] ===== 步驟 6: 產生資料來源 =====")
-        logs.append("步驟 6: 產生資料來源")
-        sources_result = generate_sources_section(news_sources, financial_sources)
-        if sources_result.get("success"):
-            print(f"[DEBUG] append 資料來源 section: {json.dumps(sources_result['section'], ensure_ascii=False)}")
-            all_sections.append(sources_result["section"])
-            section_results["資料來源"] = sources_result
-            logs.append("✅ 資料來源產生成功")
-            print(f"[DEBUG] ✅ 資料來源產生成功")
-        else:
-            print(f"[DEBUG] ❌ 資料來源產生失敗: {sources_result.get('error', '未知錯誤')}")
-            all_sections.append(sources_result["section"])  # 使用預設內容
-            logs.append("❌ 資料來源產生失敗，使用預設內容")
+        # 1~7. 並行產生所有 section，改寫問題的 LLM 呼叫也同時進行
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-paraphrase") as paraphrase_executor:
+            paraphrase_future = submit_with_context(paraphrase_executor, paraphrase_prompt, intent or "")
+            section_runs = run_sections(REPORT_SECTIONS, context, on_section=emit_section)
+            paraphrased_prompt = paraphrase_future.result()
         
-        # 7. 產生免責聲明
-        print(f"\n[DEBUG] ===== 步驟 7: 產生免責聲明 =====")
-        logs.append("步驟 7: 產生免責聲明")
-        disclaimer_result = generate_disclaimer_section()
-        if disclaimer_result.get("success"):
-            print(f"[DEBUG] append 免責聲明 section: {json.dumps(disclaimer_result['section'], ensure_ascii=False)}")
-            all_sections.append(disclaimer_result["section"])
-            section_results["免責聲明"] = disclaimer_result
-            logs.append("✅ 免責聲明產生成功")
-            print(f"[DEBUG] ✅ 免責聲明產生成功")
-        else:
-            print(f"[DEBUG] ❌ 免責聲明產生失敗: {disclaimer_result.get('error', '未知錯誤')}")
-            all_sections.append(disclaimer_result["section"])  # 使用預設內容
-            logs.append("❌ 免責聲明產生失敗，使用預設內容")
+        all_sections = []
+        section_results = {}
+        for spec, run in zip(REPORT_SECTIONS, section_runs):
+            logs.append(spec["step"])
+            outcome = run["outcome"]
+            if run.get("skipped"):
+                logs.append(f"⏱️ {spec['name']}因剩餘時間不足而略過")
+                continue
+            if outcome is None:
+                logs.append(f"❌ {spec['name']}產生失敗: {run['error']}")
+                continue
+            logs.extend(outcome.get("logs", []))
+            print(f"[DEBUG] {spec['name']} 耗時 {run['elapsed']} 秒")
+            if outcome.get("section") is not None:
+                all_sections.append(outcome["section"])
+            if outcome.get("result") is not None:
+                section_results[spec["name"]] = outcome["result"]
         
         # 8. 合併所有 section
         print(f"\n[DEBUG] ===== 步驟 8: 合併所有 section =====")
@@ -235,28 +339,6 @@ def generate_report_pipeline(
         print(f"[DEBUG] ===== 投資分析報告 pipeline 完成 =====")
         print(f"[DEBUG] 最終 sections 數量: {len(all_sections)}")
         
-        # 新增 paraphrased_prompt
-        paraphrased_prompt = None
-        user_prompt = intent or ""
-        if user_prompt:
-            try:
-                openai_api_key = os.getenv("OPENAI_API_KEY")
-                if openai_api_key:
-                    client = openai.OpenAI(api_key=openai_api_key)
-                    prompt = f"請用更自然、口語化的方式改寫這句投資問題，保持原意但更適合放在報告開頭：\n{user_prompt}"
-                    response = client.chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=0.5
-                    )
-                    paraphrased = response.choices[0].message.content.strip()
-                    paraphrased_prompt = f"{user_prompt} - {paraphrased}"
-                else:
-                    paraphrased_prompt = user_prompt
-            except Exception as e:
-                print(f"[DEBUG] OpenAI paraphrase 失敗: {str(e)}")
-                paraphrased_prompt = user_prompt
-        
         # 回傳結果
         return {
             "success": True,
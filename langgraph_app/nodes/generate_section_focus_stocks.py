@@ -3,6 +3,7 @@ import os
 import requests
 from typing import Dict, Any, List
 from .search_news import search_news, generate_search_keywords
+from utils.news_dates import is_recent
 
 def generate_focus_stocks_section(stock_list: List[int], price_data: List[Dict] = None) -> Dict[str, Any]:
     """
@@ -64,17 +65,9 @@ def generate_focus_stocks_section(stock_list: List[int], price_data: List[Dict]
                 # 聚合新聞摘要
                 if search_result and search_result.get("results") and len(search_result["results"]) > 0:
                     search_results = search_result["results"]
-                    # 取近一週、近一月新聞
-                    from datetime import datetime, timedelta
-                    now = datetime.now()
-                    def parse_date(result):
-                        date_str = result.get("date") or result.get("publishedDate") or ""
-                        try:
-                            return datetime.strptime(date_str[:10], "%Y-%m-%d")
-                        except Exception:
-                            return None
-                    recent_news = [r for r in search_results if parse_date(r) and (now - parse_date(r)).days <= 7]
-                    month_news = [r for r in search_results if parse_date(r) and (now - parse_date(r)).days <= 31]
+                    # 取近一週、近一月新聞（發布時間只解析一次並快取在結果上）
+                    recent_news = [r for r in search_results if is_recent(r, 7)]
+                    month_news = [r for r in search_results if is_recent(r, 31)]
                     # 主題分類
                     themes = set()
                     for result in search_results:
@@ -1,8 +1,9 @@
-import openai
 import json
 from typing import List, Dict
 import os
 
+from utils.llm_gateway import chat_completion
+
 def generate_notice_section(company_name: str, stock_id: str, news_summary: str, financial_data: Dict = None, news_sources: List[Dict] = None) -> Dict:
     """
     產生操作注意事項 section
@@ -68,9 +69,8 @@ def generate_notice_section(company_name: str, stock_id: str, news_summary: str,
 **注意事項要具體、可執行，並包含實際操作建議！**
 """
         
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        response = client.chat.completions.create(
+        response = chat_completion(
+            "generate_notice_section",
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
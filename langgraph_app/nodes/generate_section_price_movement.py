@@ -1,8 +1,9 @@
-import openai
 import json
 from typing import List, Dict
 import os
 
+from utils.llm_gateway import chat_completion
+
 def generate_price_movement_section(company_name: str, stock_id: str, news_summary: str, news_sources: List[Dict] = None) -> Dict:
     """
     產生個股分析的股價異動總結 section
@@ -56,9 +57,8 @@ def generate_price_movement_section(company_name: str, stock_id: str, news_summa
 **內容要具體、有根據，並包含實際的新聞來源！**
 """
         
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        response = client.chat.completions.create(
+        response = chat_completion(
+            "generate_price_movement_section",
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
@@ -1,13 +1,15 @@
-import requests
 import json
 import re
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import os
 from bs4 import BeautifulSoup
-import openai
 import time
 
+from utils.deadline import budget_timeout
+from utils.tracing import span
+from utils.http_client import http_get
+
 def crawl_cmoney_forum(stock_id: str, company_name: str = "台積電") -> Dict:
     """
     爬取 CMoney 同學會討論區的貼文
@@ -35,7 +37,8 @@ def crawl_cmoney_forum(stock_id: str, company_name: str = "台積電") -> Dict:
         }
         
         print(f"[DEBUG] 📡 發送請求到: {url}")
-        response = requests.get(url, headers=headers, timeout=10)
+        with span("cmoney.forum", stock_id=stock_id):
+            response = http_get(url, headers=headers, timeout=budget_timeout(10))
         
         if response.status_code != 200:
             print(f"[DEBUG] ❌ 請求失敗，狀態碼: {response.status_code}")
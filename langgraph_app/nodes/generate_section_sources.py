@@ -1,5 +1,6 @@
 import json
 from typing import List, Dict
+from utils.news_sites import classify_site
 
 def generate_sources_section(news_sources: List[Dict] = None, financial_sources: List[Dict] = None) -> Dict:
     """
@@ -110,39 +111,16 @@ def extract_site_name(url: str) -> str:
         return '未知網站'
     
     try:
-        # 簡單的網站名稱提取
-        if 'yahoo.com' in url:
-            return 'Yahoo奇摩股市'
-        elif 'cmoney.tw' in url:
-            return 'CMoney'
-        elif 'cnyes.com' in url:
-            return '鉅亨網'
-        elif 'moneydj.com' in url:
-            return 'MoneyDJ'
-        elif 'money.udn.com' in url:
-            return '經濟日報'
-        elif 'ctee.com.tw' in url:
-            return '工商時報'
-        elif 'ettoday.net' in url:
-            return 'ETtoday'
-        elif 'goodinfo.tw' in url:
-            return 'Goodinfo'
-        elif 'macromicro.me' in url:
-            return '財經M平方'
-        elif 'businessweekly.com.tw' in url:
-            return '商業周刊'
-        elif 'technews.tw' in url:
-            return '科技新報'
-        elif 'nownews.com' in url:
-            return 'Nownews'
-        else:
-            # 嘗試從 URL 提取域名
-            from urllib.parse import urlparse
-            parsed = urlparse(url)
-            domain = parsed.netloc
-            if domain.startswith('www.'):
-                domain = domain[4:]
-            return domain
+        site = classify_site(url)
+        if site is not None:
+            return site.name
+        # 不在白名單中，嘗試從 URL 提取域名
+        from urllib.parse import urlparse
+        parsed = urlparse(url)
+        domain = parsed.netloc
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        return domain
     except:
         return '未知網站'
 
@@ -1,10 +1,20 @@
-import openai
 import json
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 import os
+
+from langgraph_app.nodes.section_stream import REPORT_STREAM_ENABLED, SectionDeltaStream
+from utils.llm_gateway import chat_completion, stream_chat_completion
+from utils.partial_json import parse_partial_json
 import re
 
-def generate_strategy_section(company_name: str, stock_id: str, news_summary: str, financial_data: Dict = None, news_sources: List[Dict] = None) -> Dict:
+def parse_partial_cards(text: str) -> Optional[List[Dict]]:
+    """從串流到一半的 JSON 取出目前已產生的 cards"""
+    result = parse_partial_json(text)
+    if isinstance(result, dict) and isinstance(result.get("cards"), list):
+        return result["cards"]
+    return None
+
+def generate_strategy_section(company_name: str, stock_id: str, news_summary: str, financial_data: Dict = None, news_sources: List[Dict] = None, on_delta: Optional[Callable[[int, Dict], None]] = None) -> Dict:
     """
     產生投資策略建議 section
     
@@ -14,6 +24,7 @@ def generate_strategy_section(company_name: str, stock_id: str, news_summary: st
         news_summary: 新聞摘要
         financial_data: 財務資料
         news_sources: 新聞來源列表
+        on_delta: （可選）串流產生時，卡片內容有變化就以 (card_index, card) 呼叫
     
     Returns:
         投資策略建議 section 的 JSON 格式
@@ -144,13 +155,24 @@ def generate_strategy_section(company_name: str, stock_id: str, news_summary: st
 請根據實際的新聞來源和財務資料，為每個句子分配適當的來源。如果沒有對應的來源，可以省略 sources 欄位。
 """
         
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
+        messages = [{"role": "user", "content": prompt}]
+        if on_delta and REPORT_STREAM_ENABLED:
+            stream = SectionDeltaStream(parse_partial_cards, on_delta)
+            response = stream_chat_completion(
+                "generate_strategy_section",
+                model="gpt-3.5-turbo",
+                messages=messages,
+                on_text=stream.feed,
+                temperature=0.3
+            )
+            print(f"[DEBUG] 投資策略建議串流完成，送出 {stream.deltas} 次卡片增量")
+        else:
+            response = chat_completion(
+                "generate_strategy_section",
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=0.3
+            )
         
         raw_content = response.choices[0].message.content.strip()
         print(f"[DEBUG] LLM 原始回傳內容：\n{raw_content}")
@@ -0,0 +1,149 @@
+"""
+新聞相關性排序
+
+四輪搜尋合併後的結果原本依輪次順序直接取前幾則放進 prompt，與問題的相關性是隨機的。
+這裡在本機以 BM25（標題 + 摘要 對 問題、公司別名、事件類型、關鍵字）計算相關性，
+再結合新聞時間與來源可信度，挑出最好的 top-k 則放進 prompt。
+
+中文沒有空白斷詞，以字元 bigram 作為詞彙；英數字以整個單字為詞彙。
+"""
+
+import math
+import os
+import re
+import unicodedata
+from datetime import datetime
+from typing import Dict, List
+
+from langgraph_app.nodes.detect_stock import stock_dict
+from utils.news_dates import result_age_days
+from utils.news_sites import classify_site
+
+# 放進報告 prompt 的新聞數
+NEWS_PROMPT_TOP_K = int(os.getenv("NEWS_PROMPT_TOP_K", "5"))
+
+# 綜合分數的權重
+RELEVANCE_WEIGHT = 0.6
+RECENCY_WEIGHT = 0.25
+SOURCE_WEIGHT = 0.15
+# 新聞時間的半衰期（天）
+RECENCY_HALF_LIFE_DAYS = 7
+# 沒有時間資訊或不在白名單中的預設分數
+UNKNOWN_RECENCY = 0.3
+UNKNOWN_SOURCE_WEIGHT = 0.5
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 標題比摘要重要，計算詞頻時重複計入
+TITLE_REPEAT = 2
+
+_TOKEN = re.compile(r"[a-z0-9]+|[㐀-鿿]+")
+def tokenize(text: str) -> List[str]:
+    """英數字取整個單字，中文取字元 bigram（單一字元則取該字）"""
+    tokens = []
+    for run in _TOKEN.findall(unicodedata.normalize("NFKC", text or "").lower()):
+        if run[0].isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def build_query_terms(question: str = "", company_name: str = "", stock_id: str = "", event_type: str = "", keywords: List[str] = None) -> List[str]:
+    """問題、公司名稱與別名、股票代號、事件類型與關鍵字的詞彙（去重）"""
+    texts = [question, company_name, stock_id, event_type] + list(keywords or [])
+    texts.extend(stock_dict.get(str(stock_id), []))
+    return list(dict.fromkeys(token for text in texts for token in tokenize(text)))
+
+def recency_score(result: Dict, now: datetime = None) -> float:
+    """以半衰期計算新聞時間分數（0~1），沒有時間資訊時為 UNKNOWN_RECENCY"""
+    age = result_age_days(result, now)
+    if age is None:
+        return UNKNOWN_RECENCY
+    return 0.5 ** (age / RECENCY_HALF_LIFE_DAYS)
+
+def source_score(result: Dict) -> float:
+    """來源可信度權重"""
+    site = classify_site(result.get("link", ""))
+    return site.weight if site is not None else UNKNOWN_SOURCE_WEIGHT
+
+def bm25_scores(documents: List[List[str]], query_terms: List[str]) -> List[float]:
+    """以結果集合本身計算 IDF 的 BM25 分數"""
+    if not documents:
+        return []
+    doc_count = len(documents)
+    avg_len = sum(len(doc) for doc in documents) / doc_count or 1
+    term_freqs = []
+    doc_freq: Dict[str, int] = {}
+    for doc in documents:
+        freqs: Dict[str, int] = {}
+        for token in doc:
+            freqs[token] = freqs.get(token, 0) + 1
+        term_freqs.append(freqs)
+        for token in freqs:
+            doc_freq[token] = doc_freq.get(token, 0) + 1
+
+    scores = []
+    for doc, freqs in zip(documents, term_freqs):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+        score = 0.0
+        for term in query_terms:
+            tf = freqs.get(term)
+            if not tf:
+                continue
+            df = doc_freq[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+def relevance_scores(results: List[Dict], query_terms: List[str]) -> List[float]:
+    """每則新聞（標題 + 摘要）對查詢詞彙的 BM25 分數"""
+    documents = [
+        tokenize(result.get("title", "")) * TITLE_REPEAT + tokenize(result.get("snippet", ""))
+        for result in results
+    ]
+    return bm25_scores(documents, query_terms)
+
+def score_news(results: List[Dict], query_terms: List[str], now: datetime = None) -> List[float]:
+    """
+    每則新聞的綜合分數（0~1）：相關性、新聞時間與來源可信度的加權和
+
+    相關性為 BM25 分數除以這批結果中的最高分
+    """
+    now = now or datetime.now()
+    relevance = relevance_scores(results, query_terms)
+    top = max(relevance, default=0) or 1
+    return [
+        RELEVANCE_WEIGHT * rel / top + RECENCY_WEIGHT * recency_score(result, now) + SOURCE_WEIGHT * source_score(result)
+        for rel, result in zip(relevance, results)
+    ]
+
+def rank_news(results: List[Dict], question: str = "", company_name: str = "", stock_id: str = "", event_type: str = "", keywords: List[str] = None, top_k: int = None, now: datetime = None) -> List[Dict]:
+    """
+    依綜合分數排序新聞（分數相同時維持原順序）
+
+    Args:
+        results: 搜尋結果
+        question: 使用者問題
+        company_name: 公司名稱
+        stock_id: 股票代號（用來取得公司別名）
+        event_type: 事件類型
+        keywords: 問題關鍵字
+        top_k: 只回傳前幾則，None 表示全部
+
+    Returns:
+        排序後的搜尋結果
+    """
+    query_terms = build_query_terms(question, company_name, stock_id, event_type, keywords)
+    return rank_by_terms(results, query_terms, top_k, now)
+
+def rank_by_terms(results: List[Dict], query_terms: List[str], top_k: int = None, now: datetime = None) -> List[Dict]:
+    """以已建立的查詢詞彙排序新聞（rank_news 的內部實作，也供搜尋輪次評估使用）"""
+    if not results:
+        return []
+    scores = score_news(results, query_terms, now)
+    order = sorted(range(len(results)), key=lambda i: -scores[i])
+    ranked = [results[i] for i in order]
+    return ranked if top_k is None else ranked[:top_k]
@@ -1,31 +1,215 @@
-import requests
 import json
-import openai
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 import re
 from datetime import datetime
 import os
 
-# 定義允許的來源網站
-ALLOWED_SITES = [
-    "tw.finance.yahoo.com",  # Yahoo奇摩股市
-    "cnyes.com",  # 鉅亨網
-    "moneydj.com",  # MoneyDJ 理財網
-    "cmoney.tw",  # CMoney
-    "money.udn.com",  # 經濟日報
-    "ctee.com.tw",  # 工商時報
-    "finance.ettoday.net",  # ETtoday 財經
-    "goodinfo.tw",  # Goodinfo
-    "macromicro.me",  # 財經M平方
-    "smart.businessweekly.com.tw",  # Smart智富
-    "technews.tw",  # 科技新報
-    "nownews.com",  # Nownews
-    "moneylink.com.tw",  # MoneyLink 富聯網
-    "stockfeel.com.tw",  # 股感 StockFeel
-    "businessweekly.com.tw",  # 商業周刊
-    "businesstoday.com.tw",  # 今周刊
-    "pchome.com.tw",  # PChome 股市頻道
-]
+from utils.concurrency import submit_with_context
+from utils.deadline import budget_timeout
+from utils.llm_gateway import chat_completion
+from utils.prompt_budget import PROMPT_BLOCKS, PromptBuilder
+from utils.tracing import span
+from utils.http_client import http_post
+from utils.search_cache import SearchCache, make_search_key
+from utils.query_planner import QueryPlanner, current_query_planner
+from utils.news_dedup import NewsDeduplicator
+from utils.news_sites import classify_site, site_registry
+from utils.news_dates import result_timestamp
+from utils.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_NAMES,
+    RateLimitTimeout,
+    TokenBucket,
+    current_priority
+)
+
+# 允許的來源網站（定義在 utils/news_sites.py）
+ALLOWED_SITES = site_registry.domains
+
+SERPER_SEARCH_URL = "https://google.serper.dev/search"
+# Serper 支援一次送出多個查詢（JSON 陣列），關閉時改為並行逐一搜尋
+SERPER_BATCH_ENABLED = os.getenv("SERPER_BATCH_ENABLED", "1") == "1"
+# 單一批次請求最多的查詢數
+SERPER_BATCH_SIZE = int(os.getenv("SERPER_BATCH_SIZE", "100"))
+# 逐一搜尋時的並行數
+SERPER_FANOUT_WORKERS = int(os.getenv("SERPER_FANOUT_WORKERS", "8"))
+
+# Serper 速率限制：每秒請求數（0 表示不限）、可累積的突發請求數
+SERPER_RATE_LIMIT = float(os.getenv("SERPER_RATE_LIMIT", "5"))
+SERPER_RATE_BURST = int(os.getenv("SERPER_RATE_BURST", "10"))
+# 多個 worker 共用限流狀態的 SQLite 檔案，留空則每個 worker 各自限流
+SERPER_RATE_LIMIT_DB = os.getenv("SERPER_RATE_LIMIT_DB", "")
+# 收到 429 時最多重試次數
+SERPER_MAX_RETRIES = int(os.getenv("SERPER_MAX_RETRIES", "2"))
+# 429 回應沒有 Retry-After 時的退讓秒數
+SERPER_RETRY_AFTER_DEFAULT = 1.0
+
+# Serper 搜尋結果快取（記憶體 LRU + 多個 worker 共用的 SQLite）
+search_cache = SearchCache()
+
+# 所有 Serper 請求共用的限流器（依優先順序排隊）
+serper_limiter = TokenBucket("serper", SERPER_RATE_LIMIT, SERPER_RATE_BURST, db_path=SERPER_RATE_LIMIT_DB)
+
+def _serper_payload(query: str, num: int, time_range: Optional[str] = None) -> Dict:
+    payload = {
+        "q": query,
+        "num": num,
+        "domains": ALLOWED_SITES  # 傳遞 domains 為 list
+    }
+    if time_range:
+        payload["tbs"] = time_range
+    return payload
+
+def _retry_after(response) -> float:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", SERPER_RETRY_AFTER_DEFAULT)))
+    except (TypeError, ValueError):
+        return SERPER_RETRY_AFTER_DEFAULT
+
+def _post_serper(payload, serper_api_key: str, timeout: float, priority: int = None):
+    """
+    經過限流器送出 Serper 請求；收到 429 時暫停限流器並重試
+
+    Raises:
+        RateLimitTimeout: 請求剩餘時間內排不到配額
+    """
+    priority = current_priority() if priority is None else priority
+    headers = {"X-API-KEY": serper_api_key, "Content-Type": "application/json"}
+    for attempt in range(SERPER_MAX_RETRIES + 1):
+        with span("serper.queue", priority=PRIORITY_NAMES.get(priority, priority)) as current:
+            waited = serper_limiter.acquire(priority, timeout=budget_timeout(timeout))
+            if current is not None:
+                current.set_attribute("wait_ms", round(waited * 1000, 1))
+        response = http_post(SERPER_SEARCH_URL, headers=headers, json=payload, timeout=budget_timeout(timeout))
+        if response.status_code != 429 or attempt == SERPER_MAX_RETRIES:
+            return response
+        retry_after = _retry_after(response)
+        print(f"⏳ Serper 速率限制（429），暫停 {retry_after:.1f} 秒後重試")
+        serper_limiter.penalize(retry_after)
+    return response
+
+def serper_search_uncached(query: str, serper_api_key: str, num: int = 10, timeout: float = 30, time_range: Optional[str] = None) -> Optional[Dict]:
+    """直接查詢 Serper（不經快取），失敗時回傳 None；供快取背景更新使用（最低優先順序）"""
+    response = _post_serper(_serper_payload(query, num, time_range), serper_api_key, timeout, priority=PRIORITY_BACKGROUND)
+    return response.json() if response.status_code == 200 else None
+
+def _search_and_cache(query: str, cache_key: str, serper_api_key: str, num: int, timeout: float, time_range: Optional[str] = None) -> Tuple[int, Optional[Dict]]:
+    with span("serper.search", query=query):
+        response = _post_serper(_serper_payload(query, num, time_range), serper_api_key, timeout)
+    if response.status_code != 200:
+        return response.status_code, None
+    data = response.json()
+    search_cache.put(cache_key, data)
+    return 200, data
+
+def _serper_batch_request(queries: List[str], serper_api_key: str, num: int, timeout: float, time_range: Optional[str] = None) -> Optional[List[Dict]]:
+    """一次送出多個查詢；回應格式不符時回傳 None，由呼叫端改為逐一搜尋"""
+    with span("serper.batch_request", queries=len(queries)):
+        response = _post_serper([_serper_payload(query, num, time_range) for query in queries], serper_api_key, timeout)
+    if response.status_code != 200:
+        print(f"Serper 批次請求失敗: {response.status_code}，改為逐一搜尋")
+        return None
+    data = response.json()
+    if not isinstance(data, list) or len(data) != len(queries):
+        print("Serper 批次回應格式不符，改為逐一搜尋")
+        return None
+    return data
+
+def serper_search_many(queries: List[str], serper_api_key: str, num: int = 10, timeout: float = 30) -> Dict[str, Tuple[Optional[int], Optional[Dict]]]:
+    """
+    一次搜尋多個關鍵字（經過搜尋結果快取）
+
+    關鍵字先經過請求的 QueryPlanner，正規化後已送出過的關鍵字直接略過（不列入回傳）；
+    快取未命中的關鍵字在 SERPER_BATCH_ENABLED 時以批次請求送出，
+    批次失敗或關閉時改為並行逐一搜尋。規劃器設有 time_range 時只搜尋該時間範圍。
+
+    Returns:
+        {關鍵字: (HTTP 狀態碼, 回應資料)}；發生例外的關鍵字狀態碼為 None
+    """
+    queries = [query for query in queries if query]
+    planner = current_query_planner() or QueryPlanner()
+    planned = planner.plan(queries, ALLOWED_SITES)
+    time_range = planner.time_range
+    cache_keys = {query: make_search_key(canonical, num, ALLOWED_SITES, time_range) for query, canonical in planned}
+    responses: Dict[str, Tuple[Optional[int], Optional[Dict]]] = {}
+    missing = []
+
+    with span("serper.search_many", queries=len(queries)) as current:
+        if len(planned) < len(queries):
+            print(f"♻️ 略過 {len(queries) - len(planned)} 個重複的搜尋關鍵字")
+        for query, cache_key in cache_keys.items():
+            data, cache_state = search_cache.peek(
+                cache_key,
+                refresh=lambda query=query: serper_search_uncached(query, serper_api_key, num, timeout, time_range)
+            )
+            if cache_state == "miss":
+                missing.append(query)
+            else:
+                responses[query] = (200, data)
+        if responses:
+            print(f"💾 搜尋快取命中 {len(responses)}/{len(planned)} 個關鍵字")
+
+        fanout = missing
+        if SERPER_BATCH_ENABLED and len(missing) > 1:
+            fanout = []
+            for i in range(0, len(missing), SERPER_BATCH_SIZE):
+                chunk = missing[i:i + SERPER_BATCH_SIZE]
+                try:
+                    batch = _serper_batch_request(chunk, serper_api_key, num, timeout, time_range)
+                except RateLimitTimeout as e:
+                    # 排不到配額時逐一搜尋也一樣排不到，直接視為失敗
+                    print(f"[serper_search_many ERROR] {e}")
+                    for query in chunk:
+                        responses[query] = (None, None)
+                    continue
+                except Exception as e:
+                    print(f"[serper_search_many ERROR] 批次請求失敗，改為逐一搜尋: {e}")
+                    batch = None
+                if batch is None:
+                    fanout.extend(chunk)
+                    continue
+                for query, data in zip(chunk, batch):
+                    search_cache.put(cache_keys[query], data)
+                    responses[query] = (200, data)
+
+        if fanout:
+            with ThreadPoolExecutor(max_workers=min(len(fanout), SERPER_FANOUT_WORKERS), thread_name_prefix="serper-fanout") as executor:
+                futures = {
+                    query: submit_with_context(executor, _search_and_cache, query, cache_keys[query], serper_api_key, num, timeout, time_range)
+                    for query in fanout
+                }
+                for query, future in futures.items():
+                    try:
+                        responses[query] = future.result()
+                    except Exception as e:
+                        print(f"[serper_search_many ERROR] {query}: {e}")
+                        responses[query] = (None, None)
+
+        if current is not None:
+            current.set_attribute("deduped", len(queries) - len(planned))
+            current.set_attribute("cached", len(planned) - len(missing))
+            current.set_attribute("fanout", len(fanout))
+    return responses
+
+def collect_keyword_results(keywords: List[str], responses: Dict[str, Tuple[Optional[int], Optional[Dict]]]) -> Dict[str, List[Dict]]:
+    """
+    依關鍵字整理搜尋結果，只保留允許的網站，並在每筆結果標記來源關鍵字（search_keyword）
+
+    Returns:
+        {關鍵字: 過濾後結果}，搜尋失敗或重複而略過的關鍵字不列入
+    """
+    keyword_results = {}
+    for keyword in keywords:
+        if keyword not in responses:
+            continue
+        status_code, data = responses[keyword]
+        if status_code != 200 or data is None:
+            print(f"Serper API 請求失敗: {status_code}，關鍵字: {keyword}")
+            continue
+        filtered_results = filter_results_by_site(data.get("organic", []))
+        keyword_results[keyword] = [{**result, "search_keyword": keyword} for result in filtered_results]
+    return keyword_results
 
 PROMPT = '''你是一個專業投資分析助理，請根據使用者輸入的問題，自動生成一組精準的搜尋關鍵字，幫助查找最新且與台股相關的財經新聞或數據資訊。
 
@@ -73,8 +257,6 @@ def generate_search_keywords(company_name: str, stock_id: str, intent: str, keyw
     """生成搜尋關鍵詞，納入事件類型、時間、意圖，去除重複，財報等詞優先"""
     try:
         # 使用 OpenAI 生成更精準的搜尋關鍵字
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
         # 準備 prompt
         prompt = PROMPT.replace("{{ company_name }}", company_name or "")
         prompt = prompt.replace("{{ stock_id }}", stock_id or "")
@@ -82,7 +264,8 @@ def generate_search_keywords(company_name: str, stock_id: str, intent: str, keyw
         prompt = prompt.replace("{{ keywords }}", ", ".join(keywords) if keywords else "")
         prompt = prompt.replace("{{ time_info }}", time_info or "")
         
-        response = client.chat.completions.create(
+        response = chat_completion(
+            "generate_search_keywords",
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "user", "content": prompt}
@@ -175,56 +358,26 @@ def generate_fallback_keywords(company_name: str, stock_id: str, intent: str, ke
     return unique_keywords[:12]  # 增加到最多12個關鍵字
 
 def filter_results_by_site(results: List[Dict]) -> List[Dict]:
-    """過濾結果，只保留允許的網站"""
+    """
+    過濾結果，只保留允許的網站
+
+    Returns:
+        加上 site_name（網域）與 filtered 的新結果列表，不修改原本的結果
+    """
     filtered_results = []
-    
     for result in results:
-        link = result.get("link", "").lower()
-        title = result.get("title", "").lower()
-        
-        # 檢查是否來自允許的網站
-        is_allowed = False
-        site_name = ""
-        
-        for site in ALLOWED_SITES:
-            if site in link or site.replace(".", "") in link:
-                is_allowed = True
-                site_name = site
-                break
-        
-        if is_allowed:
-            # 添加網站資訊到結果中
-            result["site_name"] = site_name
-            result["filtered"] = True
-            filtered_results.append(result)
-        else:
-            # 標記為被過濾的結果
-            result["filtered"] = False
-    
+        site = classify_site(result.get("link", ""))
+        if site is not None:
+            filtered_results.append({**result, "site_name": site.domain, "filtered": True})
     return filtered_results
 
 def extract_date_from_result(result: Dict) -> str:
-    """從搜尋結果中提取日期資訊"""
+    """從搜尋結果中提取日期資訊（顯示用）"""
     try:
-        # 從標題或摘要中尋找日期模式
-        text = f"{result.get('title', '')} {result.get('snippet', '')}"
-        
-        # 常見的日期模式
-        date_patterns = [
-            r'(\d{4}年\d{1,2}月\d{1,2}日)',  # 2024年1月1日
-            r'(\d{4}/\d{1,2}/\d{1,2})',      # 2024/1/1
-            r'(\d{4}-\d{1,2}-\d{1,2})',      # 2024-1-1
-            r'(\d{1,2}/\d{1,2})',            # 1/1
-            r'(今天|昨天|前天|明天)',         # 相對日期
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                return match.group(1)
-        
-        return "無日期資訊"
-        
+        timestamp = result_timestamp(result)
+        if timestamp is None:
+            return "無日期資訊"
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
     except Exception as e:
         print(f"[extract_date_from_result ERROR] {e}")
         return "無日期資訊"
@@ -285,6 +438,20 @@ def group_search_keywords(keywords: List[str], group_count: int = 4) -> List[Lis
     # 限制組數
     return groups[:group_count]
 
+def interleave_keyword_groups(keyword_groups: List[List[str]]) -> List[str]:
+    """
+    依各組中的排序交錯排列關鍵字：先是每組的第一個，再是每組的第二個…
+
+    Returns:
+        去重後的關鍵字列表
+    """
+    keywords = []
+    for rank in range(max((len(group) for group in keyword_groups), default=0)):
+        for group in keyword_groups:
+            if rank < len(group) and group[rank] not in keywords:
+                keywords.append(group[rank])
+    return keywords
+
 def search_news_grouped(company_name: str, stock_id: str, intent: str, keywords: List[str], serper_api_key: str = None, event_type: str = '', time_info: str = '', group_count: int = 4) -> Dict:
     """
     使用分組搜尋的方式執行新聞搜尋
@@ -319,29 +486,41 @@ def search_news_grouped(company_name: str, stock_id: str, intent: str, keywords:
             print(f"   第{i}組 ({len(group)}個): {group}")
         print()
         
-        # 執行分組搜尋
-        all_results = []
-        all_search_keywords = []
-        
+        # 整輪的關鍵字一次送出（批次請求或並行搜尋），結果依關鍵字歸屬
+        round_keywords = interleave_keyword_groups(keyword_groups)
+        if serper_api_key:
+            responses = serper_search_many(round_keywords, serper_api_key, timeout=30)
+        else:
+            print("❌ 缺少 SERPER_API_KEY")
+            responses = {}
+        keyword_results = collect_keyword_results(round_keywords, responses)
+
         for i, keyword_group in enumerate(keyword_groups, 1):
             if not keyword_group:
                 continue
-                
-            print(f"🔍 執行第{i}組搜尋...")
-            
-            # 執行單組搜尋
-            group_result = search_news_single_group(
-                company_name, stock_id, intent, keyword_group, serper_api_key, event_type, time_info
-            )
-            
-            if group_result.get("success"):
-                group_results = group_result.get("results", [])
-                all_results.extend(group_results)
-                all_search_keywords.extend(keyword_group)
-                
+            group_results = [result for keyword in keyword_group for result in keyword_results.get(keyword, [])]
+            if any(keyword in keyword_results for keyword in keyword_group):
+                log_search_results(keyword_group, group_results)
                 print(f"✅ 第{i}組搜尋成功，獲得 {len(group_results)} 個結果")
+            elif not any(keyword in responses for keyword in keyword_group):
+                print(f"♻️ 第{i}組關鍵字皆已搜尋過，略過")
             else:
-                print(f"❌ 第{i}組搜尋失敗: {group_result.get('error', '未知錯誤')}")
+                statuses = sorted({str(responses[keyword][0]) for keyword in keyword_group if keyword in responses})
+                print(f"❌ 第{i}組搜尋失敗: API 請求失敗（狀態碼: {', '.join(statuses)}）")
+
+        # 每個送出的關鍵字都失敗時（例如被限流），回報失敗而不是當作沒有新聞
+        if responses and not keyword_results:
+            statuses = sorted({str(status) for status, _ in responses.values()})
+            return {
+                "success": False,
+                "error": f"Serper 請求全部失敗（狀態碼: {', '.join(statuses)}）",
+                "results": [],
+                "search_keywords": []
+            }
+
+        # 依關鍵字在各組中的排序交錯合併，各組的第一個關鍵字排在最前面
+        all_search_keywords = [keyword for keyword in round_keywords if keyword in keyword_results]
+        all_results = [result for keyword in all_search_keywords for result in keyword_results[keyword]]
         
         # 去重結果
         unique_results = remove_duplicate_results(all_results)
@@ -377,23 +556,16 @@ def search_news_single_group(company_name: str, stock_id: str, intent: str, keyw
         if not serper_api_key:
             return {"success": False, "error": "缺少 SERPER_API_KEY", "results": []}
         if keywords:
-            search_query = keywords[0]
-            url = "https://google.serper.dev/search"
-            headers = {"X-API-KEY": serper_api_key, "Content-Type": "application/json"}
-            payload = {
-                "q": search_query,
-                "num": 10,
-                "domains": ALLOWED_SITES  # 傳遞 domains 為 list
-            }
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                organic_results = data.get("organic", [])
-                filtered_results = filter_results_by_site(organic_results)
+            responses = serper_search_many(keywords, serper_api_key, timeout=30)
+            keyword_results = collect_keyword_results(keywords, responses)
+            if not responses:
+                return {"success": True, "results": [], "search_keywords": [], "message": "關鍵字皆已搜尋過，略過"}
+            if keyword_results:
+                filtered_results = [result for keyword in keywords for result in keyword_results.get(keyword, [])]
                 log_search_results(keywords, filtered_results)
-                return {"success": True, "results": filtered_results, "search_keywords": keywords, "message": f"單組搜尋成功，關鍵字: {search_query}"}
+                return {"success": True, "results": filtered_results, "search_keywords": list(keyword_results), "message": f"單組搜尋成功，關鍵字: {', '.join(keyword_results)}"}
             else:
-                return {"success": False, "error": f"API 請求失敗: {response.status_code}", "results": []}
+                return {"success": False, "error": "API 請求失敗", "results": []}
         else:
             return {"success": False, "error": "沒有搜尋關鍵字", "results": []}
     except Exception as e:
@@ -402,18 +574,13 @@ def search_news_single_group(company_name: str, stock_id: str, intent: str, keyw
 
 def remove_duplicate_results(results: List[Dict]) -> List[Dict]:
     """
-    去除重複的搜尋結果
+    去除重複的搜尋結果（正規化網址相同或標題摘要近似的新聞只保留來源最好的一筆）
     """
-    seen_urls = set()
-    unique_results = []
-    
-    for result in results:
-        url = result.get("link", "")
-        if url and url not in seen_urls:
-            seen_urls.add(url)
-            unique_results.append(result)
-    
-    return unique_results
+    dedup = NewsDeduplicator(source_priority=site_registry.priority())
+    for position, result in enumerate(results):
+        if result.get("link", ""):
+            dedup.add(result, order=position)
+    return dedup.results()
 
 def search_news(company_name: str, stock_id: str, intent: str, keywords: List[str], serper_api_key: str = None, event_type: str = '', time_info: str = '') -> Dict:
     """
@@ -444,24 +611,8 @@ def search_news(company_name: str, stock_id: str, intent: str, keywords: List[st
             
             return {"success": True, "search_keywords": search_keywords, "results": mock_results, "message": "使用模擬資料（請設定 Serper API key 以獲取真實搜尋結果）"}
         
-        all_results = []
-        for keyword in search_keywords:
-            url = "https://google.serper.dev/search"
-            headers = {"X-API-KEY": serper_api_key, "Content-Type": "application/json"}
-            payload = {
-                "q": keyword,
-                "num": 10,
-                "domains": ALLOWED_SITES  # 傳遞 domains 為 list
-            }
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if "organic" in data:
-                    all_results.extend(data["organic"])
-            else:
-                print(f"Serper API 請求失敗: {response.status_code}")
-        
-        filtered_results = filter_results_by_site(all_results)
+        keyword_results = collect_keyword_results(search_keywords, serper_search_many(search_keywords, serper_api_key, timeout=10))
+        filtered_results = [result for keyword in search_keywords for result in keyword_results.get(keyword, [])]
         log_search_results(search_keywords, filtered_results)
         
         return {"success": True, "search_keywords": search_keywords, "results": filtered_results[:15], "message": f"成功搜尋到 {len(filtered_results)} 個符合條件的結果"}
@@ -469,6 +620,93 @@ def search_news(company_name: str, stock_id: str, intent: str, keywords: List[st
         print(f"[search_news ERROR] {e}")
         return {"success": False, "error": str(e), "search_keywords": [], "results": []}
 
+def extract_keywords_from_results(search_results: List[Dict], company_name: str, stock_id: str) -> List[str]:
+    """
+    從第一次搜尋結果中提取新的關鍵字，包含網站限制
+    """
+    try:
+        # 收集所有標題和摘要（依搜尋結果順序，超過 token 預算的部分不放入）
+        result_blocks = [f"{result.get('title', '')} {result.get('snippet', '')}".strip() for result in search_results]
+        
+        # 使用 OpenAI 從搜尋結果中提取新的關鍵字
+        prompt = f"""
+根據以下搜尋結果，為 {company_name}({stock_id}) 生成 3-5 個新的搜尋關鍵字。
+這些關鍵字應該能夠找到更深入、更具體的相關資訊，特別是財務數據、財報、損益表等。
+
+⚠️限制來源：請僅從下列網站中抓取內容：
+Yahoo奇摩股市、鉅亨網 (cnyes)、MoneyDJ 理財網、CMoney、經濟日報、工商時報、ETtoday 財經、Goodinfo、財經M平方（MacroMicro）、Smart智富、科技新報、Nownews、MoneyLink 富聯網、股感 StockFeel、商業周刊、今周刊、PChome 股市頻道。
+
+搜尋結果：
+{PROMPT_BLOCKS}
+
+請生成新的搜尋關鍵字，格式為 JSON 陣列，並包含 site: 限制：
+["{{ company_name }} 2025 財報 site:tw.finance.yahoo.com", "{{ stock_id }} 法人動向 site:cnyes.com", "{{ company_name }} EPS 分析 site:moneydj.com"]
+
+注意：請包含年份(2025/2024)和具體的網站限制。
+"""
+        
+        prompt = PromptBuilder("extract_keywords_from_results", model="gpt-3.5-turbo").fill(prompt, result_blocks, separator=" ")
+        
+        response = chat_completion(
+            "extract_keywords_from_results",
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3
+        )
+        
+        # 解析回應
+        content = response.choices[0].message.content.strip()
+        try:
+            keywords = json.loads(content)
+            if isinstance(keywords, list):
+                return keywords[:5]  # 限制最多5個關鍵字
+        except:
+            pass
+        
+        # 如果 AI 解析失敗，使用預設關鍵字
+        return generate_fallback_second_keywords(company_name, stock_id)
+        
+    except Exception as e:
+        print(f"[extract_keywords_from_results ERROR] {e}")
+        # 返回預設關鍵字（包含年份和財務關鍵字）
+        return generate_fallback_second_keywords(company_name, stock_id)
+
+def generate_fallback_second_keywords(company_name: str, stock_id: str) -> List[str]:
+    """生成第二次搜尋的備用關鍵字，充分利用所有允許的網站"""
+    current_year = "2025"
+    last_year = "2024"
+    
+    fallback_keywords = [
+        f"{company_name} {current_year} 財報 site:tw.finance.yahoo.com",
+        f"{stock_id} {last_year} 損益表 site:cnyes.com", 
+        f"{company_name} 法人動向 site:moneydj.com",
+        f"{stock_id} EPS 分析 site:cmoney.tw",
+        f"{company_name} 營業收入 site:goodinfo.tw",
+        f"{company_name} 財經新聞 site:money.udn.com",
+        f"{stock_id} 工商時報 site:ctee.com.tw",
+        f"{company_name} 財經報導 site:finance.ettoday.net",
+        f"{company_name} 基本面分析 site:macromicro.me",
+        f"{company_name} 投資理財 site:smart.businessweekly.com.tw",
+        f"{company_name} 科技新聞 site:technews.tw",
+        f"{company_name} 即時新聞 site:nownews.com"
+    ]
+    
+    return fallback_keywords[:12]  # 增加到最多12個關鍵字
+
+def merge_search_results(first_results: List[Dict], second_results: List[Dict]) -> List[Dict]:
+    """
+    合併兩次搜尋結果，去除重複
+    """
+    try:
+        # 第一次搜尋結果排在前面，重複的新聞只保留來源最好的一筆
+        return remove_duplicate_results(first_results + second_results)
+    except Exception as e:
+        print(f"[merge_search_results ERROR] {e}")
+        # 如果合併失敗，返回第一次搜尋結果
+        return first_results
+
 def search_news_smart(company_name: str, stock_id: str, intent: str, keywords: List[str], serper_api_key: str = None, event_type: str = '', time_info: str = '', use_grouped: bool = True) -> Dict:
     """
     智能選擇搜尋方式
@@ -0,0 +1,356 @@
+"""
+新聞搜尋規劃器
+
+把原本串行的四輪搜尋改成相依關係圖：
+- 第一輪（主關鍵字）與第四輪（備用關鍵字）互不相依，一開始就同時執行
+- 第二輪只等第一輪的結果來萃取新關鍵字
+- 第三輪與原本相同，以第一、二輪的結果萃取關鍵字，第二輪完成即開始
+所有輪次的結果都流經同一個去重合併器，最終仍依輪次順序輸出。
+所有輪次共用一個 QueryPlanner，正規化後重複的關鍵字只送出一次。
+標記為 adaptive 的額外輪次由 SearchRoundController 依前面輪次的邊際效益決定是否執行。
+個股新聞索引中已有足夠的近期新聞時，以索引新聞為基礎，Serper 只搜尋上次同步後的增量時間窗。
+"""
+
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from langgraph_app.nodes.search_news import (
+    search_news_smart,
+    extract_keywords_from_results,
+    generate_fallback_second_keywords
+)
+from langgraph_app.nodes.news_ranker import (
+    NEWS_PROMPT_TOP_K,
+    build_query_terms,
+    rank_by_terms,
+    relevance_scores
+)
+from utils.concurrency import run_blocking
+from utils.deadline import has_budget
+from utils.news_dedup import NewsDeduplicator
+from utils.news_dates import is_recent
+from utils.news_index import NEWS_INDEX_WINDOW_DAYS, NewsIndex
+from utils.news_sites import classify_site, site_registry
+from utils.query_planner import QueryPlanner, bind_query_planner, reset_query_planner
+from utils.rate_limiter import PRIORITY_INTERACTIVE, PRIORITY_SPECULATIVE, request_priority
+from utils.tracing import current_trace, span
+
+# 額外搜尋輪次所需的最少剩餘秒數（請求時間不足時略過）
+EXTRA_ROUND_MIN_BUDGET = 30
+
+# 提前結束額外搜尋輪次的條件
+SEARCH_ADAPTIVE_ENABLED = os.getenv("SEARCH_ADAPTIVE_ENABLED", "1") == "1"
+# 已有這麼多則近期且相關的新聞時，不再執行額外輪次
+SEARCH_SUFFICIENT_RESULTS = int(os.getenv("SEARCH_SUFFICIENT_RESULTS", "30"))
+SEARCH_FRESH_DAYS = int(os.getenv("SEARCH_FRESH_DAYS", "14"))
+# 一輪新增的新聞少於此數、沒有新來源、且前 k 名沒有變化時，視為效益不足
+SEARCH_MIN_NEW_RESULTS = int(os.getenv("SEARCH_MIN_NEW_RESULTS", "5"))
+
+# 個股新聞索引（多個 worker 共用的 SQLite）
+news_index = NewsIndex()
+
+class SearchResultMerger:
+    """
+    串流式的搜尋結果去重合併器
+
+    每輪結果一到就合併，以正規化後的網址與標題 + 摘要的 SimHash 去重；
+    同一則新聞在多輪出現時，保留輪次較前面的位置，因此輸出順序與串行合併一致，
+    內容則保留來源最好的一筆。
+    """
+
+    def __init__(self):
+        self._dedup = NewsDeduplicator(source_priority=site_registry.priority())
+
+    def add(self, round_no: int, results: List[Dict]) -> int:
+        """
+        合併一輪的結果
+
+        Returns:
+            這輪新增的不重複結果數
+        """
+        added = 0
+        for position, result in enumerate(results):
+            if not result.get("link", ""):
+                continue
+            if self._dedup.add(result, order=(round_no, position)):
+                added += 1
+        return added
+
+    def results(self) -> List[Dict]:
+        """依輪次與原始位置排序後的去重結果"""
+        return self._dedup.results()
+
+    @property
+    def stats(self) -> Dict:
+        """網址重複與近似重複的筆數"""
+        return self._dedup.stats
+
+    def __len__(self) -> int:
+        return len(self._dedup)
+
+class SearchRoundController:
+    """
+    依已完成輪次的邊際效益，決定是否繼續執行額外的搜尋輪次
+
+    每輪結束時計算：新增的不重複新聞數、新增的來源網站數、前 k 名（排序後放進
+    prompt 的新聞）中有幾則是這輪帶來的。以下情況會停止尚未開始的 adaptive 輪次：
+    - 已有 SEARCH_SUFFICIENT_RESULTS 則近 SEARCH_FRESH_DAYS 天且與問題相關的新聞
+    - 第一輪之後完成的輪次效益不足（新增新聞少於 SEARCH_MIN_NEW_RESULTS、沒有新來源、前 k 名沒有變化）
+    """
+
+    def __init__(self, merger: SearchResultMerger, query_terms: List[str], enabled: bool = None):
+        self.merger = merger
+        self.query_terms = query_terms
+        self.enabled = SEARCH_ADAPTIVE_ENABLED if enabled is None else enabled
+        self.sites = set()
+        self.top_links: List[str] = []
+        self.completed = 0
+        self.stop_reason: Optional[str] = None
+
+    def record(self, round_no: int, label: str, results: List[Dict]) -> Dict:
+        """
+        合併一輪的結果並評估邊際效益
+
+        Returns:
+            {"new_results", "new_sites", "top_k_gain"}
+        """
+        added = self.merger.add(round_no, results)
+        sites = {site.domain for site in map(lambda r: classify_site(r.get("link", "")), results) if site}
+        new_sites = sites - self.sites
+        self.sites |= sites
+        merged = self.merger.results()
+        top_links = [r.get("link", "") for r in rank_by_terms(merged, self.query_terms, top_k=NEWS_PROMPT_TOP_K)]
+        top_k_gain = len(set(top_links) - set(self.top_links))
+        self.top_links = top_links
+        self.completed += 1
+        gain = {"new_results": added, "new_sites": len(new_sites), "top_k_gain": top_k_gain}
+
+        if self.enabled and self.stop_reason is None:
+            relevance = relevance_scores(merged, self.query_terms)
+            sufficient = sum(
+                1 for result, score in zip(merged, relevance)
+                if score > 0 and is_recent(result, SEARCH_FRESH_DAYS)
+            )
+            if sufficient >= SEARCH_SUFFICIENT_RESULTS:
+                self.stop_reason = f"已有 {sufficient} 則近 {SEARCH_FRESH_DAYS} 天的相關新聞"
+            elif self.completed > 1 and added < SEARCH_MIN_NEW_RESULTS and not new_sites and top_k_gain == 0:
+                self.stop_reason = f"{label}搜尋只新增 {added} 則新聞、沒有新來源，前 {NEWS_PROMPT_TOP_K} 則也沒有變化"
+        return gain
+
+def _first_round_keywords(ctx: Dict, dep_results: List[Dict]) -> List[str]:
+    return ctx["first_keywords_fn"]()
+
+def _fallback_round_keywords(ctx: Dict, dep_results: List[Dict]) -> List[str]:
+    return generate_fallback_second_keywords(ctx["company_name"], ctx["stock_id"])
+
+def _extracted_round_keywords(ctx: Dict, dep_results: List[Dict]) -> List[str]:
+    # 相關性高的新聞排前面，prompt 超過 token 預算時先捨棄較不相關的新聞
+    ranked = rank_by_terms(dep_results, ctx["query_terms"])
+    return extract_keywords_from_results(ranked, ctx["company_name"], ctx["stock_id"])
+
+# 搜尋輪次定義；depends_on 的結果會合併後交給 keywords 函式萃取關鍵字，
+# 設有 min_budget 的輪次在請求剩餘時間不足時會略過，
+# adaptive 的輪次在前面輪次的效益已足夠時會略過，
+# priority 為 Serper 限流排隊時的優先順序（預設為互動）
+SEARCH_ROUNDS = [
+    {
+        "round": 1,
+        "label": "第一次",
+        "depends_on": [],
+        "start_log": None,
+        "keyword_log": "🔍 搜尋關鍵字: {keywords}",
+        "keywords": _first_round_keywords
+    },
+    {
+        "round": 4,
+        "label": "第四次",
+        "depends_on": [],
+        "start_log": "🔄 開始第四次搜尋，使用備用關鍵字...",
+        "keyword_log": "🔍 第四次搜尋關鍵字: {keywords}",
+        "keywords": _fallback_round_keywords
+    },
+    {
+        "round": 2,
+        "label": "第二次",
+        "depends_on": [1],
+        "start_log": "🔄 開始第二次搜尋，根據第一次結果生成新關鍵字...",
+        "keyword_log": "🔍 第二次搜尋關鍵字: {keywords}",
+        "keywords": _extracted_round_keywords,
+        "min_budget": EXTRA_ROUND_MIN_BUDGET,
+        "adaptive": True,
+        "priority": PRIORITY_SPECULATIVE
+    },
+    {
+        "round": 3,
+        "label": "第三次",
+        "depends_on": [1, 2],
+        "start_log": "🔄 開始第三次搜尋，根據前兩次結果生成新關鍵字...",
+        "keyword_log": "🔍 第三次搜尋關鍵字: {keywords}",
+        "keywords": _extracted_round_keywords,
+        "min_budget": EXTRA_ROUND_MIN_BUDGET,
+        "adaptive": True,
+        "priority": PRIORITY_SPECULATIVE
+    },
+]
+
+async def run_search_rounds(
+    company_name: str,
+    stock_id: str,
+    intent: str,
+    serper_api_key: str,
+    first_keywords_fn: Callable[[], List[str]],
+    rounds: List[Dict] = None,
+    question: str = "",
+    event_type: str = "",
+    keywords: List[str] = None
+) -> AsyncIterator[Dict]:
+    """
+    依相依關係並行執行所有搜尋輪次
+
+    Args:
+        company_name: 公司名稱
+        stock_id: 股票代號
+        intent: 搜尋意圖
+        serper_api_key: Serper API 金鑰
+        first_keywords_fn: 產生第一輪關鍵字的函式（同步，會在執行緒池中執行）
+        rounds: 搜尋輪次定義，預設為 SEARCH_ROUNDS
+        question: 使用者問題（評估輪次效益時排序新聞用）
+        event_type: 事件類型
+        keywords: 問題關鍵字
+
+    Yields:
+        {"log": 訊息} 形式的進度事件；最後一個事件為
+        {"results": 合併後結果, "rounds": {輪次: 該輪結果數}, "indexed": 來自新聞索引的新聞數}
+    """
+    rounds = rounds or SEARCH_ROUNDS
+    query_terms = build_query_terms(question, company_name, stock_id, event_type, keywords)
+    ctx = {
+        "company_name": company_name,
+        "stock_id": stock_id,
+        "intent": intent,
+        "first_keywords_fn": first_keywords_fn,
+        "query_terms": query_terms
+    }
+    merger = SearchResultMerger()
+    controller = SearchRoundController(merger, query_terms)
+    started_at = time.time()
+    indexed, delta = await run_blocking(news_index.fresh_articles, stock_id)
+    if indexed:
+        controller.record(0, "新聞索引", indexed)
+        yield {"log": f'🗂️ 新聞索引已有 {len(indexed)} 則近 {NEWS_INDEX_WINDOW_DAYS} 天的{company_name}新聞，只搜尋最近 {delta[1]} 的新聞'}
+
+    # 在建立各輪 task 之前綁定，task 複製 context 時會帶到同一個規劃器
+    planner, planner_token = bind_query_planner(QueryPlanner(time_range=delta[0] if delta else None))
+    round_results: Dict[int, List[Dict]] = {}
+    succeeded = set()
+    finished = {spec["round"]: asyncio.Event() for spec in rounds}
+    queue: asyncio.Queue = asyncio.Queue()
+    done_marker = object()
+
+    async def run_round(spec: Dict):
+        round_no = spec["round"]
+        label = spec["label"]
+        try:
+            for dep in spec["depends_on"]:
+                await finished[dep].wait()
+            dep_results = []
+            for dep in spec["depends_on"]:
+                dep_results.extend(round_results.get(dep, []))
+
+            if spec.get("adaptive") and controller.stop_reason:
+                round_results[round_no] = []
+                await queue.put({"log": f'⏭️ 略過{label}搜尋：{controller.stop_reason}'})
+                return
+            if spec.get("min_budget") and not has_budget(spec["min_budget"], stage=f"{label}搜尋"):
+                round_results[round_no] = []
+                await queue.put({"log": f'⏱️ 剩餘時間不足，略過{label}搜尋'})
+                return
+
+            with span(f"search_round.{round_no}", label=label) as round_span:
+                if spec["start_log"]:
+                    await queue.put({"log": spec["start_log"]})
+                with span(f"search_round.{round_no}.keywords"):
+                    keywords = await run_blocking(spec["keywords"], ctx, dep_results)
+                print(f"🔍 DEBUG - {label}搜尋關鍵字: {keywords} (長度: {len(keywords)})")
+                await queue.put({"log": spec["keyword_log"].format(keywords=', '.join(keywords))})
+
+                with request_priority(spec.get("priority", PRIORITY_INTERACTIVE)):
+                    search_result = await run_blocking(
+                        search_news_smart,
+                        company_name=company_name,
+                        stock_id=stock_id,
+                        intent=intent,
+                        keywords=keywords,
+                        serper_api_key=serper_api_key,
+                        use_grouped=True
+                    )
+                if search_result.get("success"):
+                    succeeded.add(round_no)
+                    results = search_result.get("results", [])
+                    await queue.put({"log": f'📰 {label}搜尋找到 {len(results)} 則相關新聞'})
+                    for i, news in enumerate(results[:5]):
+                        await queue.put({"log": f'📄 {round_no}-{i+1}. {news.get("title", "")}'})
+                else:
+                    results = []
+                    await queue.put({"log": f'❌ {label}新聞搜尋失敗: ' + search_result.get('error', '未知錯誤')})
+
+                round_results[round_no] = results
+                decided = controller.stop_reason is not None
+                gain = controller.record(round_no, label, results)
+                await queue.put({"log": f'📈 {label}搜尋新增 {gain["new_results"]} 則新聞、{gain["new_sites"]} 個新來源，前 {NEWS_PROMPT_TOP_K} 則中有 {gain["top_k_gain"]} 則來自這輪'})
+                if not decided and controller.stop_reason:
+                    await queue.put({"log": f'🛑 不再執行額外搜尋：{controller.stop_reason}'})
+                if round_span:
+                    round_span.set_attribute("results", len(results))
+                    round_span.set_attribute("new_results", gain["new_results"])
+                    round_span.set_attribute("new_sites", gain["new_sites"])
+                    round_span.set_attribute("top_k_gain", gain["top_k_gain"])
+        except Exception as e:
+            print(f"[run_search_rounds ERROR] 第{round_no}輪: {e}")
+            round_results.setdefault(round_no, [])
+            await queue.put({"log": f'❌ {label}新聞搜尋失敗: {str(e)}'})
+        finally:
+            finished[round_no].set()
+            await queue.put(done_marker)
+
+    tasks = [asyncio.ensure_future(run_round(spec)) for spec in rounds]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is done_marker:
+                remaining -= 1
+                continue
+            yield event
+    finally:
+        # 呼叫端中途停止（例如使用者斷線）時，取消尚未完成的輪次
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        reset_query_planner(planner_token)
+
+    merged = merger.results()
+    # 有任何一輪搜尋成功時才更新同步時間，下次的增量時間窗從這次搜尋開始算起
+    await run_blocking(news_index.record, merged, stock_id if succeeded else None, started_at)
+
+    if planner.saved:
+        print(f"♻️ 本次請求略過 {planner.saved} 個重複的搜尋關鍵字（實際送出 {planner.issued} 個）")
+    trace = current_trace()
+    if trace is not None:
+        trace.root.set_attribute("search.queries_issued", planner.issued)
+        trace.root.set_attribute("search.queries_saved", planner.saved)
+        trace.root.set_attribute("search.url_duplicates", merger.stats["url_duplicates"])
+        trace.root.set_attribute("search.near_duplicates", merger.stats["near_duplicates"])
+        trace.root.set_attribute("search.indexed_articles", len(indexed))
+        if delta:
+            trace.root.set_attribute("search.time_range", delta[0])
+        if controller.stop_reason:
+            trace.root.set_attribute("search.stop_reason", controller.stop_reason)
+
+    yield {
+        "results": merged,
+        "rounds": {round_no: len(results) for round_no, results in sorted(round_results.items())},
+        "indexed": len(indexed)
+    }
@@ -0,0 +1,139 @@
+"""
+報告 section 執行器
+
+每個 section 宣告自己需要的輸入欄位與相依的其他 section，
+執行器以有上限的執行緒池並行執行互不相依的 section，
+最後仍依照宣告順序（即 UI 順序）回傳結果。
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.concurrency import submit_with_context
+from utils.deadline import has_budget
+from utils.tracing import span
+
+# 單一報告同時執行的 section 數量上限
+REPORT_SECTION_WORKERS = int(os.getenv("REPORT_SECTION_WORKERS", "6"))
+
+def validate_section_specs(specs: List[Dict]) -> None:
+    """
+    檢查 section 定義：名稱不可重複、相依的 section 必須存在且不可循環
+
+    Raises:
+        ValueError: 定義不合法時
+    """
+    names = [spec["name"] for spec in specs]
+    if len(names) != len(set(names)):
+        raise ValueError(f"section 名稱重複: {names}")
+
+    deps = {spec["name"]: spec.get("depends_on", []) for spec in specs}
+    for name, dep_names in deps.items():
+        for dep in dep_names:
+            if dep not in deps:
+                raise ValueError(f"section {name} 相依的 {dep} 不存在")
+
+    # 以 DFS 檢查循環相依
+    visiting, visited = set(), set()
+
+    def visit(name: str):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"section 相依關係出現循環: {name}")
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+
+    for name in deps:
+        visit(name)
+
+def run_sections(
+    specs: List[Dict],
+    context: Dict[str, Any],
+    max_workers: int = None,
+    on_section: Optional[Callable[[int, Dict], None]] = None
+) -> List[Dict]:
+    """
+    依相依關係並行執行所有 section
+
+    Args:
+        specs: section 定義列表，順序即 UI 順序，每個元素包含：
+            - name: section 名稱
+            - inputs: 從 context 取用的欄位名稱列表
+            - build: 產生函式，以 inputs 對應的關鍵字參數呼叫
+            - depends_on: （可選）需先完成的 section 名稱，其結果以 deps 參數傳入
+            - min_budget: （可選）可略過的 section 所需的最少剩餘秒數，請求時間不足時直接略過
+        context: 所有 section 共用的輸入資料
+        max_workers: 執行緒池上限，預設為 REPORT_SECTION_WORKERS
+        on_section: （可選）每個 section 完成時的回呼，參數為 (UI 順序 index, 執行結果)
+
+    Returns:
+        依 specs 順序排列的執行結果，每個元素包含 name、outcome、error、elapsed、skipped
+    """
+    validate_section_specs(specs)
+    max_workers = max_workers or REPORT_SECTION_WORKERS
+
+    index_by_name = {spec["name"]: i for i, spec in enumerate(specs)}
+    results: List[Optional[Dict]] = [None] * len(specs)
+    pending = list(specs)
+    running = {}
+
+    def call_build(spec: Dict, deps: Dict[str, Any]) -> Dict:
+        kwargs = {key: context.get(key) for key in spec.get("inputs", [])}
+        if spec.get("depends_on"):
+            kwargs["deps"] = deps
+        start = time.time()
+        try:
+            with span(f"section.{spec['name']}"):
+                outcome = spec["build"](**kwargs)
+            error = None
+        except Exception as e:
+            print(f"[run_sections ERROR] {spec['name']}: {e}")
+            outcome = None
+            error = str(e)
+        return {
+            "name": spec["name"],
+            "outcome": outcome,
+            "error": error,
+            "elapsed": round(time.time() - start, 3),
+            "skipped": False
+        }
+
+    def finish(index: int, run: Dict):
+        results[index] = run
+        if on_section:
+            try:
+                on_section(index, run)
+            except Exception as e:
+                print(f"[run_sections ERROR] on_section 回呼失敗: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-section") as executor:
+        while pending or running:
+            # 送出所有相依已完成的 section
+            for spec in list(pending):
+                dep_names = spec.get("depends_on", [])
+                if all(results[index_by_name[dep]] is not None for dep in dep_names):
+                    pending.remove(spec)
+                    if spec.get("min_budget") and not has_budget(spec["min_budget"], stage=spec["name"]):
+                        finish(index_by_name[spec["name"]], {
+                            "name": spec["name"], "outcome": None, "error": "剩餘時間不足", "elapsed": 0, "skipped": True
+                        })
+                        continue
+                    deps = {dep: results[index_by_name[dep]]["outcome"] for dep in dep_names}
+                    future = submit_with_context(executor, call_build, spec, deps)
+                    running[future] = spec["name"]
+
+            if not running:
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                finish(index_by_name[name], future.result())
+
+    return results
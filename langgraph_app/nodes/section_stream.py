@@ -0,0 +1,72 @@
+"""
+報告 section 的串流增量
+
+長的 section（投資策略建議、完整報告摘要）原本要等整個 completion 完成才送出。
+串流模式下以 stream_chat_completion() 邊收邊解析目前已產生的卡片，
+只把內容有變化的卡片交給 on_delta(card_index, card)，由 pipeline 轉成 section_delta 事件；
+完成後仍照原本的流程送出完整的 section。
+"""
+
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+# 是否以串流產生長的 section（0 時維持一次取得完整回應）
+REPORT_STREAM_ENABLED = os.getenv("REPORT_STREAM_ENABLED", "1") == "1"
+# 累積多少新字元才重新解析並送出一次增量，避免每個 token 都送一個事件
+SECTION_DELTA_MIN_CHARS = int(os.getenv("SECTION_DELTA_MIN_CHARS", "60"))
+
+class SectionDeltaStream:
+    """
+    累積串流文字，解析出目前已產生的卡片，只送出有變化的卡片
+
+    每次送出的是該卡片目前的完整內容（不是文字差異），前端以 card_index 取代即可。
+    """
+
+    def __init__(
+        self,
+        parse_cards: Callable[[str], Optional[List[Dict]]],
+        on_delta: Callable[[int, Dict], None],
+        min_chars: int = SECTION_DELTA_MIN_CHARS
+    ):
+        """
+        Args:
+            parse_cards: 把目前累積的文字解析成卡片列表
+            on_delta: 卡片內容有變化時呼叫，參數為 (card_index, card)
+            min_chars: 累積多少新字元才重新解析
+        """
+        self.parse_cards = parse_cards
+        self.on_delta = on_delta
+        self.min_chars = min_chars
+        self.text = ""
+        self.deltas = 0
+        self._parsed_length = 0
+        self._sent: Dict[int, str] = {}
+
+    def feed(self, text: str) -> None:
+        """接收一段串流文字（作為 stream_chat_completion 的 on_text）"""
+        self.text += text
+        if len(self.text) - self._parsed_length >= self.min_chars:
+            self._emit()
+
+    def _emit(self) -> None:
+        self._parsed_length = len(self.text)
+        try:
+            cards = self.parse_cards(self.text) or []
+        except Exception as e:
+            print(f"[SectionDeltaStream ERROR] 解析串流內容失敗: {e}")
+            return
+        for index, card in enumerate(cards):
+            # 剛開始輸出、還沒有任何欄位的卡片先不送
+            if not isinstance(card, dict) or not card:
+                continue
+            snapshot = json.dumps(card, ensure_ascii=False, sort_keys=True)
+            if self._sent.get(index) == snapshot:
+                continue
+            self._sent[index] = snapshot
+            self.deltas += 1
+            try:
+                self.on_delta(index, card)
+            except Exception as e:
+                # 增量只是提早顯示，送出失敗不影響完整 section
+                print(f"[SectionDeltaStream ERROR] 送出增量失敗: {e}")
@@ -1,8 +1,17 @@
-import openai
 import json
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 import os
 
+from langgraph_app.nodes.news_ranker import rank_news
+from langgraph_app.nodes.section_stream import REPORT_STREAM_ENABLED, SectionDeltaStream
+from utils.llm_gateway import chat_completion, stream_chat_completion
+from utils.prompt_budget import PROMPT_BLOCKS, PromptBuilder
+
+# 摘要 prompt 中放入的新聞數（原本直接取前 20 則）
+SUMMARY_TOP_K = 10
+# 產生完整報告（max_tokens=4000）的逾時秒數
+SUMMARY_TIMEOUT = 120.0
+
 SUMMARIZER_PROMPTS = {
     "price_movement_analysis": """
 你是一位專業的證券分析師，請根據輸入的公司代號與近期市場變化，分析該股票在特定日期發生漲停、跌停或劇烈變動的可能原因。
@@ -102,19 +111,22 @@ SUMMARIZER_PROMPTS = {
 """
 }
 
-def summarize_results(company_name: str, stock_id: str, news_results: List[Dict], user_input: str, factset_data: str = "", news_sources: List[Dict] = None, financial_sources: List[Dict] = None) -> Dict:
+def parse_partial_summary(text: str) -> List[Dict]:
+    """把串流到一半的摘要解析成卡片；只解析到最後一個換行，避免標題只出現一半"""
+    complete = text[:text.rfind("\n") + 1]
+    return [{"title": title, "content": content} for title, content in parse_summary_sections(complete).items()]
+
+def summarize_results(company_name: str, stock_id: str, news_results: List[Dict], user_input: str, factset_data: str = "", news_sources: List[Dict] = None, financial_sources: List[Dict] = None, on_delta: Optional[Callable[[int, Dict], None]] = None) -> Dict:
     """
     使用 OpenAI 生成投資分析報告摘要
+    
+    on_delta: （可選）串流產生時，每個面向的內容有更新就以 (card_index, {"title", "content"}) 呼叫
     """
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
         # 準備新聞內容
-        news_content = ""
-        for i, news in enumerate(news_results[:20]):  # 限制前20則新聞
-            title = news.get("title", "")
-            snippet = news.get("snippet", "")
-            news_content += f"新聞{i+1}: {title}\n{snippet}\n\n"
+        # 依與問題的相關性、新聞時間與來源可信度挑出前 SUMMARY_TOP_K 則，超過 token 預算時捨棄排序較後面的新聞
+        top_news = rank_news(news_results, question=user_input, company_name=company_name, stock_id=stock_id, top_k=SUMMARY_TOP_K)
+        news_blocks = [f"新聞{i+1}: {news.get('title', '')}\n{news.get('snippet', '')}\n" for i, news in enumerate(top_news)]
         
         # 構建完整的提示詞
         full_prompt = f"""
@@ -125,7 +137,7 @@ def summarize_results(company_name: str, stock_id: str, news_results: List[Dict]
 {factset_data}
 
 相關新聞：
-{news_content}
+{PROMPT_BLOCKS}
 
 請按照以下8個面向生成分析報告：
 
@@ -153,15 +165,29 @@ def summarize_results(company_name: str, stock_id: str, news_results: List[Dict]
 請確保每個面向都有詳細的分析內容。
 """
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "你是一位專業的證券分析師，擅長分析台股個股。"},
-                {"role": "user", "content": full_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=4000
-        )
+        system_message = {"role": "system", "content": "你是一位專業的證券分析師，擅長分析台股個股。"}
+        full_prompt = PromptBuilder("summarize_results", model="gpt-4o-mini").fill(full_prompt, news_blocks, separator="\n", other_messages=[system_message])
+        messages = [system_message, {"role": "user", "content": full_prompt}]
+        if on_delta and REPORT_STREAM_ENABLED:
+            stream = SectionDeltaStream(parse_partial_summary, on_delta)
+            response = stream_chat_completion(
+                "summarize_results",
+                model="gpt-4o-mini",
+                messages=messages,
+                on_text=stream.feed,
+                temperature=0.7,
+                max_tokens=4000,
+                timeout=SUMMARY_TIMEOUT
+            )
+        else:
+            response = chat_completion(
+                "summarize_results",
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=4000,
+                timeout=SUMMARY_TIMEOUT
+            )
         
         summary = response.choices[0].message.content
         
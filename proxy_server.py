@@ -5,6 +5,8 @@ import uvicorn
 from flask import Flask, request, Response
 import os
 
+from utils.http_client import http_get, startup_http_pool, shutdown_http_pool
+
 app = FastAPI()
 
 app.add_middleware(
@@ -16,6 +18,14 @@ app.add_middleware(
 
 API_BASE_URL = os.environ.get('API_BASE_URL', 'http://localhost:8000')
 
+@app.on_event("startup")
+async def startup_event():
+    await startup_http_pool()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await shutdown_http_pool()
+
 @app.get("/proxy-news")
 def proxy_news(stockId: str = Query(...)):
     url = (
@@ -37,7 +47,7 @@ def proxy_news(stockId: str = Query(...)):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=5)
+        response = http_get(url, headers=headers, timeout=5)
         return response.json()
     except Exception as e:
         return {"error": str(e)}
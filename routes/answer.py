@@ -24,7 +24,7 @@ except ImportError as e:
     from llm.summarizer import summarize_with_llm
     from langgraph_app.nodes.generate_watchlist_summary_pipeline import generate_watchlist_summary_pipeline, generate_watchlist_summary_sse_pipeline
 
-import httpx
+from utils.http_client import async_http_post
 
 router = APIRouter()
 
@@ -118,19 +118,21 @@ async def login(
     呼叫 CMoney 會員登入 API
     """
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                "https://www.cmoney.tw/member/api/v1.0/Token",
-                data={
-                    "grant_type": grant_type,
-                    "login_method": login_method,
-                    "client_id": client_id,
-                    "account": account,
-                    "password": password
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
-            return resp.json(), resp.status_code
+        resp = await async_http_post(
+            "https://www.cmoney.tw/member/api/v1.0/Token",
+            data={
+                "grant_type": grant_type,
+                "login_method": login_method,
+                "client_id": client_id,
+                "account": account,
+                "password": password
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            # 維持原本 httpx 的預設（5 秒逾時、不跟隨轉址）
+            timeout=5.0,
+            follow_redirects=False
+        )
+        return resp.json(), resp.status_code
     except Exception as e:
         print(f"[ERROR] 登入處理時發生錯誤: {e}")
         return {
@@ -149,19 +151,20 @@ async def custom_group(
     """
     try:
         print(f"[DEBUG] 收到自選股群組請求: {Action}, {docType}")
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                "https://www.cmoney.tw/member/api/v1.0/CustomGroup",
-                data={
-                    "Action": Action,
-                    "docType": docType
-                },
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "Authorization": authorization or ""
-                }
-            )
-            return resp.json(), resp.status_code
+        resp = await async_http_post(
+            "https://www.cmoney.tw/member/api/v1.0/CustomGroup",
+            data={
+                "Action": Action,
+                "docType": docType
+            },
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Authorization": authorization or ""
+            },
+            timeout=5.0,
+            follow_redirects=False
+        )
+        return resp.json(), resp.status_code
     except Exception as e:
         print(f"[ERROR] 自選股群組處理時發生錯誤: {e}")
         return {
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+測試 Serper 批次搜尋：整輪關鍵字單一請求、批次失敗改為並行搜尋、結果依關鍵字歸屬
+"""
+
+import json
+import httpx
+from langgraph_app.nodes import search_news
+from langgraph_app.nodes.search_news import (
+    collect_keyword_results,
+    interleave_keyword_groups,
+    serper_search_many
+)
+from utils.http_client import http_pool
+from utils.search_cache import SearchCache
+
+def _organic(query: str):
+    return {"organic": [{"title": f"{query} 新聞", "link": f"https://cnyes.com/news/{query}"}]}
+
+class FakeSerper:
+    """記錄收到的請求，batch=False 時模擬不支援陣列查詢"""
+
+    def __init__(self, batch: bool = True):
+        self.batch = batch
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        if isinstance(payload, list):
+            if not self.batch:
+                return httpx.Response(400, json={"message": "not supported"})
+            return httpx.Response(200, json=[_organic(item["q"]) for item in payload])
+        return httpx.Response(200, json=_organic(payload["q"]))
+
+def _run_with_fake(fake: FakeSerper, queries):
+    original_clients = dict(http_pool._sync_clients)
+    original_cache = search_news.search_cache
+    http_pool._sync_clients["google.serper.dev"] = httpx.Client(transport=httpx.MockTransport(fake))
+    search_news.search_cache = SearchCache(db_path="")
+    try:
+        return serper_search_many(queries, "fake-key")
+    finally:
+        http_pool._sync_clients.clear()
+        http_pool._sync_clients.update(original_clients)
+        search_news.search_cache = original_cache
+
+def test_interleave_keyword_groups():
+    """各組第一個關鍵字排在最前面"""
+    print("🔍 測試關鍵字交錯排列")
+    assert interleave_keyword_groups([["a1", "a2", "a3"], ["b1", "b2"], ["a1"], []]) == ["a1", "b1", "a2", "b2", "a3"]
+
+def test_round_sent_as_single_batch():
+    """整輪關鍵字只送出一個請求，且每個關鍵字都有自己的結果"""
+    print("🔍 測試批次請求")
+    fake = FakeSerper()
+    queries = ["台積電 2330 財報", "2330 法人動向", "台積電 EPS"]
+    responses = _run_with_fake(fake, queries)
+    assert len(fake.requests) == 1 and len(fake.requests[0]) == 3
+    results = collect_keyword_results(queries, responses)
+    for query in queries:
+        assert results[query][0]["search_keyword"] == query
+        assert results[query][0]["link"] == f"https://cnyes.com/news/{query}"
+
+def test_fallback_to_fanout():
+    """不支援批次時改為逐一搜尋"""
+    print("🔍 測試逐一搜尋備援")
+    fake = FakeSerper(batch=False)
+    queries = ["台積電 2330 財報", "2330 法人動向"]
+    responses = _run_with_fake(fake, queries)
+    assert len(fake.requests) == 3  # 一次失敗的批次 + 兩次單一查詢
+    assert all(responses[query][0] == 200 for query in queries)
+
+if __name__ == "__main__":
+    test_interleave_keyword_groups()
+    test_round_sent_as_single_batch()
+    test_fallback_to_fanout()
+    print("✅ 所有批次搜尋測試通過")
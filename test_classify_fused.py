@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+測試合併模式的問題理解：一次 LLM 呼叫同時回傳分類與第一輪搜尋關鍵字，關閉時維持原本的兩次呼叫
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+from langgraph_app.nodes import classify_and_extract as classify_module
+from langgraph_app.nodes.classify_and_extract import aclassify_and_extract, classify_and_extract, parse_search_keywords
+from utils import tracing
+from utils.tracing import trace_request
+
+CLASSIFICATION = {
+    "category": "個股分析",
+    "subcategory": ["價格評論"],
+    "view_type": ["沒有特別"],
+    "keywords": ["台積電", "2330", "上漲"],
+    "company_name": "台積電",
+    "stock_id": "2330",
+    "time_info": "today",
+    "event_type": "上漲",
+}
+
+def _run(fused: bool, reply: dict):
+    prompts = []
+
+    def fake_chat_completion(node, messages, model, **kwargs):
+        prompts.append(messages[-1]["content"])
+        return SimpleNamespace(
+            model=model,
+            usage=None,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply, ensure_ascii=False)))]
+        )
+
+    original = (classify_module.chat_completion, classify_module.CLASSIFY_LOG_FILE, tracing.TRACE_FILE)
+    classify_module.chat_completion = fake_chat_completion
+    classify_module.CLASSIFY_LOG_FILE = ""
+    tracing.TRACE_FILE = ""
+    try:
+        with trace_request("test") as trace:
+            result = classify_and_extract("台積電今天為什麼上漲？", fused=fused, local=False)
+    finally:
+        classify_module.chat_completion, classify_module.CLASSIFY_LOG_FILE, tracing.TRACE_FILE = original
+    return result, prompts, trace
+
+def test_fused_returns_search_keywords():
+    """合併模式只呼叫一次 LLM，回傳整理過的第一輪搜尋關鍵字"""
+    print("🔍 測試合併模式")
+    reply = dict(CLASSIFICATION, search_keywords=["台積電 2330 財報", "台積電 外資買賣", "台積電 2330 財報", "", 5])
+    result, prompts, trace = _run(True, reply)
+    print(f"   搜尋關鍵字: {result['search_keywords']}")
+    assert len(prompts) == 1 and "search_keywords" in prompts[0]
+    assert result["category"] == "個股分析" and result["company_name"] == "台積電"
+    assert result["search_keywords"] == ["台積電 2330 財報", "台積電 外資買賣"]
+    assert trace.root.attributes["classify.mode"] == "fused"
+
+def test_two_call_mode_keeps_original_prompt():
+    """關閉合併模式時使用原本的 prompt，不回傳搜尋關鍵字"""
+    reply = dict(CLASSIFICATION, search_keywords=["不應出現"])
+    result, prompts, trace = _run(False, reply)
+    assert prompts[0] == classify_module.PROMPT.replace("{{ user_input }}", "台積電今天為什麼上漲？")
+    assert "search_keywords" not in result
+    assert trace.root.attributes["classify.mode"] == "two_call"
+
+def test_missing_search_keywords():
+    """模型沒有回傳關鍵字時為空陣列，第一輪改由 generate_search_keywords 產生"""
+    result, _, _ = _run(True, CLASSIFICATION)
+    assert result["search_keywords"] == []
+    assert parse_search_keywords("台積電") == []
+    assert len(parse_search_keywords([f"關鍵字{i}" for i in range(20)])) == 12
+
+def test_async_version_uses_async_gateway():
+    """SSE 端點使用的 async 版本經由 achat_completion 呼叫，結果與同步版本相同"""
+    reply = dict(CLASSIFICATION, search_keywords=["台積電 2330 財報"])
+    nodes = []
+
+    async def fake_achat_completion(node, messages, model, **kwargs):
+        nodes.append(node)
+        return SimpleNamespace(
+            model=model,
+            usage=None,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply, ensure_ascii=False)))]
+        )
+
+    original = (classify_module.achat_completion, classify_module.CLASSIFY_LOG_FILE)
+    classify_module.achat_completion = fake_achat_completion
+    classify_module.CLASSIFY_LOG_FILE = ""
+    try:
+        result = asyncio.run(aclassify_and_extract("台積電今天為什麼上漲？", fused=True, local=False))
+    finally:
+        classify_module.achat_completion, classify_module.CLASSIFY_LOG_FILE = original
+    assert nodes == ["classify_and_extract"]
+    assert result == _run(True, reply)[0]
+
+if __name__ == "__main__":
+    test_fused_returns_search_keywords()
+    test_two_call_mode_keeps_original_prompt()
+    test_missing_search_keywords()
+    test_async_version_uses_async_gateway()
+    print("✅ 所有合併問題理解測試通過")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+測試請求截止時間：逾時計算、context 傳遞、時間不足時略過可選階段
+"""
+
+import asyncio
+from langgraph_app.nodes.section_executor import run_sections
+from utils.concurrency import run_blocking
+from utils.deadline import Deadline, bind_deadline, budget_timeout, has_budget
+
+def test_timeout_follows_remaining_budget():
+    """逾時秒數取預設值與剩餘時間的較小者，但不低於下限"""
+    print("🔍 測試逾時計算")
+    deadline = Deadline(budget=5)
+    assert 4 < deadline.timeout(30) <= 5
+    assert deadline.timeout(1) == 1
+    expired = Deadline(budget=0)
+    assert expired.expired()
+    assert expired.timeout(30, minimum=2) == 2
+
+def test_no_deadline_keeps_defaults():
+    """沒有綁定 deadline 時維持原本的行為"""
+    print("🔍 測試未綁定 deadline")
+    assert budget_timeout(30) == 30
+    assert has_budget(9999)
+
+def test_deadline_reaches_worker_threads():
+    """綁定的 deadline 會隨 run_blocking 與 run_sections 傳到執行緒中"""
+    print("🔍 測試 deadline 傳遞")
+    deadline = Deadline(budget=1)
+
+    def read_timeout():
+        return budget_timeout(30)
+
+    specs = [
+        {"name": "required", "inputs": [], "build": lambda: {"section": {"timeout": read_timeout()}}},
+        {"name": "optional", "inputs": [], "min_budget": 10, "build": lambda: {"section": {"ran": True}}},
+    ]
+
+    async def main():
+        bind_deadline(deadline)
+        from_executor = await run_blocking(read_timeout)
+        runs = await run_blocking(run_sections, specs, {})
+        return from_executor, runs
+
+    from_executor, runs = asyncio.run(main())
+    print(f"   執行緒中的逾時: {from_executor:.2f}，略過: {deadline.skipped}")
+    assert from_executor <= 2
+    assert runs[0]["outcome"]["section"]["timeout"] <= 2
+    assert runs[1]["skipped"] and runs[1]["outcome"] is None
+    assert deadline.skipped == ["optional"]
+
+if __name__ == "__main__":
+    test_timeout_follows_remaining_budget()
+    test_no_deadline_keeps_defaults()
+    test_deadline_reaches_worker_threads()
+    print("✅ 所有截止時間測試通過")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+測試本機問題分類：規則分類常見問題、以 LLM 記錄訓練字元 n-gram 模型、信心不足時才呼叫 LLM、離線評估
+"""
+
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from eval_intent_classifier import evaluate
+from langgraph_app.nodes import classify_and_extract as classify_module
+from langgraph_app.nodes import fast_classifier as fast_module
+from langgraph_app.nodes.classify_and_extract import classify_and_extract
+from langgraph_app.nodes.fast_classifier import (
+    FAST_CLASSIFY_THRESHOLD,
+    RULE_CONFIDENCE,
+    FastIntentClassifier,
+    load_classify_log,
+    load_intent_model,
+    normalize_question,
+    rule_classify,
+    save_intent_model,
+    train_intent_model
+)
+
+def _record(question: str, category: str, subcategory: str, view_type: str = "沒有特別", event_type: str = "其他") -> dict:
+    return {
+        "question": question,
+        "latency_ms": 900.0,
+        "result": {"category": category, "subcategory": [subcategory], "view_type": [view_type], "event_type": event_type}
+    }
+
+# 模擬 classify_and_extract 記錄的 LLM 分類結果
+RECORDS = [
+    _record(f"{market}今天{verb}", "盤勢分析", "大盤走勢分析")
+    for market in ["大盤", "台股", "加權指數", "台灣股市"] for verb in ["走勢如何", "為什麼跌", "怎麼看", "表現"]
+] + [
+    _record(f"{topic}是什麼意思", "金融知識詢問", "指標定義")
+    for topic in ["RSI", "本益比", "周轉率", "殖利率", "KD", "融資餘額", "ETF", "除權息"]
+] + [
+    _record(f"{stock}最近怎麼樣", "個股分析", "綜合分析")
+    for stock in ["台積電", "聯電", "鴻海", "長榮", "聯發科", "華碩"]
+]
+
+def test_rules_cover_common_questions():
+    """單一股票的常見句型由規則直接分類"""
+    print("🔍 測試規則分類")
+    result, confidence = rule_classify("2330 EPS 多少")
+    print(f"   2330 EPS 多少 → {result['category']} / {result['subcategory']}，{result['company_name']}")
+    assert result["category"] == "個股分析" and result["subcategory"] == ["個股資訊查找"]
+    assert result["company_name"] == "台積電" and result["stock_id"] == "2330"
+    assert result["view_type"] == ["基本面"] and min(confidence.values()) == RULE_CONFIDENCE
+
+    result, confidence = rule_classify("聯電法人買賣超")
+    assert result["subcategory"] == ["籌碼面分析"] and result["view_type"] == ["籌碼面"] and confidence
+
+    result, confidence = rule_classify("華碩前天漲停板但今天下跌，是什麼原因")
+    assert result["subcategory"] == ["價格評論"] and result["event_type"] == "漲停" and confidence
+
+    # 預測性問題、沒有股票的問題交給 LLM
+    assert rule_classify("台積電明天會漲嗎")[1] == {}
+    assert rule_classify("今天大盤為什麼跌")[1] == {}
+
+def test_rules_alone_do_not_skip_llm():
+    """沒有模型時規則的結果不直接採用；否定或相反的漲跌方向不由規則判斷事件類型"""
+    print("🔍 測試規則單獨判斷的信心")
+    assert RULE_CONFIDENCE < FAST_CLASSIFY_THRESHOLD
+    classifier = FastIntentClassifier({}, threshold=FAST_CLASSIFY_THRESHOLD)
+    assert classifier.try_classify("台積電最近怎麼樣") is None
+
+    for question in ["台積電今天不漲反跌", "台積電先漲後跌", "聯電今天沒跌", "鴻海漲多拉回"]:
+        result, confidence = rule_classify(question)
+        print(f"   {question} → {result['event_type']}，{confidence}")
+        assert result["event_type"] not in ("上漲", "下跌") and "event_type" not in confidence
+        assert classifier.try_classify(question) is None
+    # 只有一個方向時照常判斷
+    assert rule_classify("聯電今天大漲")[0]["event_type"] == "上漲"
+    assert rule_classify("台積電漲跌幅多少")[0]["event_type"] == "其他"
+    assert classifier.get_stats()["fallback"] == 5 and classifier.get_stats()["local"] == 0
+
+def test_model_learns_from_logged_results():
+    """以記錄訓練的模型可以分類沒有股票的問題，存檔後載入結果相同"""
+    print("🔍 測試字元 n-gram 模型")
+    models = train_intent_model(RECORDS)
+    classifier = FastIntentClassifier(models, threshold=0.5)
+    result, confidence = classifier.classify("加權指數今天走勢如何")
+    print(f"   加權指數今天走勢如何 → {result['category']}（信心 {confidence:.2f}）")
+    assert result["category"] == "盤勢分析" and confidence >= 0.5
+    assert classifier.classify("殖利率是什麼意思")[0]["category"] == "金融知識詢問"
+    # 股票名稱以同一個字元取代，模型學到的是句型
+    assert normalize_question("聯發科 最近怎麼樣") == normalize_question("鴻海最近怎麼樣")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "intent_model.json")
+        save_intent_model(models, path)
+        loaded = FastIntentClassifier(load_intent_model(path), threshold=0.5)
+        assert loaded.classify("加權指數今天走勢如何")[0]["category"] == "盤勢分析"
+    assert load_intent_model(os.path.join(tempfile.gettempdir(), "missing_model.json")) == {}
+
+def test_classify_and_extract_skips_llm_when_confident():
+    """信心足夠時不呼叫 LLM；信心不足時呼叫 LLM 並記錄結果作為訓練資料"""
+    print("🔍 測試 classify_and_extract 的本機分類")
+    calls = []
+
+    def fake_chat_completion(node, messages, model, **kwargs):
+        calls.append(node)
+        content = json.dumps({"category": "無效問題", "subcategory": ["預測性問題"], "view_type": ["沒有特別"], "keywords": [], "company_name": "台積電", "stock_id": "2330", "time_info": "tomorrow", "event_type": "其他"}, ensure_ascii=False)
+        return SimpleNamespace(model=model, usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = os.path.join(tmpdir, "classify_log.jsonl")
+        original = (classify_module.chat_completion, classify_module.CLASSIFY_LOG_FILE, fast_module.fast_classifier)
+        classify_module.chat_completion = fake_chat_completion
+        classify_module.CLASSIFY_LOG_FILE = log_file
+        fast_module.fast_classifier = FastIntentClassifier(train_intent_model(RECORDS), threshold=0.85)
+        try:
+            local = classify_and_extract("台積電最近怎麼樣", local=True, fused=True)
+            remote = classify_and_extract("台積電明天會漲嗎", local=True, fused=False)
+            stats = fast_module.fast_classifier.get_stats()
+        finally:
+            classify_module.chat_completion, classify_module.CLASSIFY_LOG_FILE, fast_module.fast_classifier = original
+        logged = load_classify_log(log_file)
+
+    print(f"   LLM 呼叫: {calls}，本機採用率: {stats['local_rate']:.0%}")
+    assert local["category"] == "個股分析" and local["search_keywords"] == []
+    assert remote["category"] == "無效問題"
+    assert calls == ["classify_and_extract"]
+    assert stats["local"] == 1 and stats["fallback"] == 1
+    assert len(logged) == 1 and logged[0]["question"] == "台積電明天會漲嗎"
+
+def test_offline_evaluation_report():
+    """離線評估回報一致率、涵蓋比例與延遲"""
+    report = evaluate(FastIntentClassifier(train_intent_model(RECORDS), threshold=0.5), RECORDS)
+    print(f"   類別一致: {report['agreement']['category']}/{report['total']}，直接採用: {report['confident']}")
+    assert report["total"] == len(RECORDS)
+    assert report["agreement"]["category"] >= len(RECORDS) * 0.9
+    assert report["local_ms"]["p95"] < 50 and report["llm_ms"]["p50"] == 900.0
+
+if __name__ == "__main__":
+    test_rules_cover_common_questions()
+    test_rules_alone_do_not_skip_llm()
+    test_model_learns_from_logged_results()
+    test_classify_and_extract_skips_llm_when_confident()
+    test_offline_evaluation_report()
+    print("✅ 所有本機問題分類測試通過")
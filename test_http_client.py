@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+測試共用 HTTP 連線池：依主機分配連線池、重複使用 client、不保存 cookie、關閉
+"""
+
+import asyncio
+import httpx
+from utils.http_client import HttpClientPool, parse_host_limits
+
+def test_parse_host_limits():
+    """解析各主機的連線上限設定"""
+    print("🔍 測試連線上限設定解析")
+    assert parse_host_limits("google.serper.dev=32, WWW.CMONEY.TW=8,bad") == {
+        "google.serper.dev": 32,
+        "www.cmoney.tw": 8
+    }
+
+def test_clients_are_shared_per_host():
+    """設定過上限的主機有自己的連線池，其他主機共用預設連線池"""
+    print("🔍 測試依主機分配連線池")
+    pool = HttpClientPool(host_limits={"google.serper.dev": 4})
+    serper = pool.sync_client("https://google.serper.dev/search")
+    assert pool.sync_client("https://google.serper.dev/news") is serper
+    default = pool.sync_client("https://www.cmoney.tw/forum/stock/2330")
+    assert default is not serper
+    assert pool.sync_client("https://tw.finance.yahoo.com/") is default
+
+    options = pool._client_options("google.serper.dev")
+    assert options["limits"].max_connections == 4
+    assert options["limits"].max_keepalive_connections == 4
+    print(f"   連線池: {pool.get_stats()}")
+    assert pool.get_stats()["sync_pools"] == ["default", "google.serper.dev"]
+
+def test_cookies_are_not_shared_between_users():
+    """使用者 A 登入回應的 Set-Cookie 不會被帶到使用者 B 的請求"""
+    print("🔍 測試共用 client 不保存 cookie")
+    received = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        received.append(request.headers.get("cookie"))
+        return httpx.Response(200, json={}, headers={"set-cookie": "session=userA; Path=/"})
+
+    pool = HttpClientPool(host_limits={})
+    options = pool._client_options("")
+    options.pop("limits")
+    pool._sync_clients[""] = httpx.Client(transport=httpx.MockTransport(handler), **options)
+    pool.request("POST", "https://www.cmoney.tw/identity/token")
+    pool.request("POST", "https://www.cmoney.tw/identity/token")
+
+    async def main():
+        pool._async_clients[""] = httpx.AsyncClient(transport=httpx.MockTransport(handler), **options)
+        await pool.arequest("POST", "https://www.cmoney.tw/identity/token")
+        await pool.arequest("POST", "https://www.cmoney.tw/identity/token")
+
+    asyncio.run(main())
+    print(f"   各請求的 Cookie: {received}")
+    assert received == [None, None, None, None]
+
+def test_aclose_releases_all_clients():
+    """關閉後所有 client 都被釋放，之後會重新建立"""
+    print("🔍 測試關閉連線池")
+    pool = HttpClientPool(host_limits={})
+
+    async def main():
+        client = pool.async_client("https://www.cmoney.tw/")
+        sync_client = pool.sync_client("https://www.cmoney.tw/")
+        await pool.aclose()
+        return client, sync_client
+
+    client, sync_client = asyncio.run(main())
+    assert client.is_closed and sync_client.is_closed
+    assert pool.get_stats()["async_pools"] == [] and pool.get_stats()["sync_pools"] == []
+    assert pool.sync_client("https://www.cmoney.tw/") is not sync_client
+
+if __name__ == "__main__":
+    test_parse_host_limits()
+    test_clients_are_shared_per_host()
+    test_cookies_are_not_shared_between_users()
+    test_aclose_releases_all_clients()
+    print("✅ 所有 HTTP 連線池測試通過")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+測試 LLM 回應快取：key 正規化、各節點有效秒數、LRU 上限、SQLite 共用、閘道命中時以零成本記錄
+"""
+
+import json
+import os
+import tempfile
+import time
+import httpx
+import openai
+from utils import token_tracker as tracker_module
+from utils import tracing
+from utils.llm_cache import LLMResponseCache, make_llm_key, parse_node_ttls
+from utils.llm_gateway import LLMGateway
+from utils.token_tracker import TokenTracker, track_openai_call
+from utils.tracing import trace_request
+
+def _completion(content: str, finish_reason: str = "stop"):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 500, "total_tokens": 1500},
+    }
+
+def test_key_normalizes_whitespace():
+    """訊息的空白差異不影響 key，temperature 與 max_tokens 不同則 key 不同"""
+    messages = [{"role": "user", "content": "台積電  最近\n 怎麼樣？"}]
+    same = [{"role": "user", "content": " 台積電 最近 怎麼樣？ "}]
+    key = make_llm_key("gpt-3.5-turbo", messages, 0, None)
+    assert key == make_llm_key("gpt-3.5-turbo", same, 0, None)
+    assert key != make_llm_key("gpt-3.5-turbo", messages, 0.3, None)
+    assert key != make_llm_key("gpt-3.5-turbo", messages, 0, 100)
+    assert key != make_llm_key("gpt-4", messages, 0, None)
+
+def test_ttl_by_node_and_temperature():
+    """只有列出的節點、且 temperature 不高於門檻時才快取"""
+    cache = LLMResponseCache(db_path="", node_ttls=parse_node_ttls("classify_and_extract=60,bad=x"), max_temperature=0.3)
+    assert cache.node_ttls == {"classify_and_extract": 60}
+    assert cache.ttl_for("classify_and_extract", 0) == 60
+    assert cache.ttl_for("classify_and_extract", 0.7) == 0
+    assert cache.ttl_for("classify_and_extract", None) == 0
+    assert cache.ttl_for("generate_section_strategy", 0) == 0
+
+def test_expiry_and_lru():
+    """超過有效秒數視為未命中，超過筆數上限時淘汰最久未使用的項目"""
+    cache = LLMResponseCache(max_entries=2, db_path="", node_ttls={})
+    cache.put("old", _completion("舊"), stored_at=time.time() - 120)
+    assert cache.get("old", ttl=60) is None
+    assert cache.get("old", ttl=300) is not None
+    cache.put("a", _completion("a"))
+    cache.put("b", _completion("b"))
+    assert cache.get("old", ttl=300) is None
+    stats = cache.get_stats()
+    print(f"   快取統計: {stats}")
+    assert stats["entries"] == 2 and stats["hits"] == 1 and stats["saved_tokens"] == 1500
+
+def test_sqlite_shared_between_workers():
+    """兩個 worker（兩個實例）共用 SQLite 快取"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "llm_cache.sqlite3")
+        LLMResponseCache(db_path=db_path, node_ttls={}).put("key", _completion("共用"))
+        other = LLMResponseCache(db_path=db_path, node_ttls={})
+        value = other.get("key", ttl=60)
+        assert value["choices"][0]["message"]["content"] == "共用"
+        assert other.get_stats()["db_hits"] == 1
+
+def test_gateway_serves_hits_at_zero_cost():
+    """第二次相同的呼叫由快取回應，TokenTracker 記錄零成本命中與省下的成本"""
+    print("🔍 測試閘道的回應快取")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        # 被截斷的回應不快取
+        finish_reason = "length" if "截斷" in body["messages"][-1]["content"] else "stop"
+        return httpx.Response(200, json=_completion('{"category": "個股分析"}', finish_reason))
+
+    gateway = LLMGateway(cache=LLMResponseCache(db_path="", node_ttls={"classify_and_extract": 60}))
+    gateway._client = openai.OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    gateway._client_key = os.getenv("OPENAI_API_KEY")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original = (tracker_module.token_tracker, tracing.TRACE_FILE)
+        tracker_module.token_tracker = TokenTracker(os.path.join(tmpdir, "token_usage.json"))
+        tracing.TRACE_FILE = ""
+        try:
+            with trace_request("test") as trace:
+                messages = [{"role": "user", "content": "台積電怎麼樣？"}]
+                first = gateway.chat_completion("classify_and_extract", messages, model="gpt-3.5-turbo", temperature=0)
+                track_openai_call("classify_and_extract", first)
+                second = gateway.chat_completion("classify_and_extract", messages, model="gpt-3.5-turbo", temperature=0)
+                # 閘道已記錄每一次呼叫，節點再呼叫 track_openai_call 也不會重複記錄
+                track_openai_call("classify_and_extract", second)
+                # 溫度較高或不在快取清單的節點照常呼叫
+                gateway.chat_completion("classify_and_extract", messages, model="gpt-3.5-turbo", temperature=0.9)
+                gateway.chat_completion("generate_section_strategy", messages, model="gpt-3.5-turbo", temperature=0)
+                for _ in range(2):
+                    gateway.chat_completion("classify_and_extract", [{"role": "user", "content": "截斷"}], model="gpt-3.5-turbo", temperature=0)
+            summary = tracker_module.token_tracker.get_usage_summary()
+        finally:
+            tracker_module.token_tracker, tracing.TRACE_FILE = original
+
+    print(f"   OpenAI 請求數: {len(requests)}，快取命中: {summary['cache_hits']}，省下成本: ${summary['saved_cost']:.4f}")
+    assert second.choices[0].message.content == first.choices[0].message.content
+    assert getattr(second, "cache_hit", False) and not getattr(first, "cache_hit", False)
+    assert len(requests) == 5
+    # 5 次實際呼叫與 1 次命中都由閘道記錄
+    assert summary["total_calls"] == 6 and summary["cache_hits"] == 1
+    assert summary["saved_tokens"] == 1500 and summary["saved_cost"] > 0
+    breakdown = summary["node_breakdown"]
+    assert breakdown["classify_and_extract"]["calls"] == 5 and breakdown["generate_section_strategy"]["calls"] == 1
+    assert abs(breakdown["classify_and_extract"]["cost"] + breakdown["generate_section_strategy"]["cost"] - summary["total_cost"]) < 1e-9
+    # 命中率的分母是查過快取的呼叫：1 次命中 + 3 次未命中（溫度較高、不在快取清單的呼叫不算）
+    assert summary["cache_lookups"] == 4 and summary["cache_hit_rate"] == 0.25
+    assert breakdown["classify_and_extract"]["cache_lookups"] == 4 and breakdown["generate_section_strategy"]["cache_lookups"] == 0
+    spans = [s for s in trace.spans if s.name == "openai.chat"]
+    assert [s.attributes.get("cache") for s in spans] == ["miss", "hit", None, None, "miss", "miss"]
+    assert gateway.get_stats()["cache"]["hits"] == 1
+
+if __name__ == "__main__":
+    test_key_normalizes_whitespace()
+    test_ttl_by_node_and_temperature()
+    test_expiry_and_lru()
+    test_sqlite_shared_between_workers()
+    test_gateway_serves_hits_at_zero_cost()
+    print("✅ 所有 LLM 回應快取測試通過")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+測試 OpenAI 閘道：同步 client 重複使用、async client 並行呼叫、openai.chat span
+"""
+
+import asyncio
+import json
+import os
+import time
+import httpx
+import openai
+from utils import llm_gateway as gateway_module
+from utils import tracing
+from utils.llm_gateway import LLMGateway
+from utils.tracing import trace_request
+
+def _completion(content: str):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+
+class FakeOpenAI:
+    """以 MockTransport 取代 OpenAI API，記錄請求內容"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.requests = []
+
+    def sync_handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        return httpx.Response(200, json=_completion(body["messages"][-1]["content"]))
+
+    async def async_handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        await asyncio.sleep(self.delay)
+        return httpx.Response(200, json=_completion(body["messages"][-1]["content"]))
+
+def _gateway(fake: FakeOpenAI) -> LLMGateway:
+    gateway = LLMGateway()
+    gateway._client = openai.OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(fake.sync_handler)))
+    # 與呼叫時讀到的 OPENAI_API_KEY 相同，才會沿用這個 client
+    gateway._client_key = os.getenv("OPENAI_API_KEY")
+    return gateway
+
+def test_sync_client_is_reused():
+    """同一個 API key 只建立一個 client，呼叫都經過 openai.chat span"""
+    print("🔍 測試同步 client 重複使用")
+    fake = FakeOpenAI()
+    gateway = _gateway(fake)
+    # 不把測試的 span 寫入 trace_spans.jsonl
+    original_file = tracing.TRACE_FILE
+    tracing.TRACE_FILE = ""
+    try:
+        with trace_request("test") as trace:
+            for i in range(3):
+                response = gateway.chat_completion("fake_node", [{"role": "user", "content": f"問題{i}"}], model="gpt-3.5-turbo", temperature=0)
+                assert response.choices[0].message.content == f"問題{i}"
+    finally:
+        tracing.TRACE_FILE = original_file
+    assert gateway.client() is gateway._client
+    assert gateway.get_stats()["sync_clients"] == 0
+    spans = [s for s in trace.spans if s.name == "openai.chat"]
+    print(f"   請求數: {len(fake.requests)}，span 數: {len(spans)}")
+    assert len(fake.requests) == 3 and len(spans) == 3
+    assert spans[0].attributes["node"] == "fake_node"
+    assert fake.requests[0]["temperature"] == 0
+    assert gateway.get_stats()["calls"] == 3
+
+def test_async_calls_run_concurrently():
+    """async client 的呼叫可以在 event loop 中並行"""
+    print("🔍 測試 async 並行呼叫")
+    fake = FakeOpenAI(delay=0.2)
+    gateway = LLMGateway()
+
+    async def run():
+        gateway._async_clients[asyncio.get_running_loop()] = openai.AsyncOpenAI(
+            api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(fake.async_handler))
+        )
+        start = time.monotonic()
+        responses = await asyncio.gather(*[
+            gateway.achat_completion("fake_node", [{"role": "user", "content": f"問題{i}"}], model="gpt-3.5-turbo")
+            for i in range(4)
+        ])
+        elapsed = time.monotonic() - start
+        await gateway.aclose()
+        return responses, elapsed
+
+    responses, elapsed = asyncio.run(run())
+    print(f"   4 個呼叫耗時 {elapsed:.2f} 秒")
+    assert [r.choices[0].message.content for r in responses] == [f"問題{i}" for i in range(4)]
+    assert elapsed < 0.6
+    assert gateway.get_stats()["async_calls"] == 4
+
+def test_module_level_gateway_is_shared():
+    """模組層級的函式使用同一個閘道"""
+    assert gateway_module.chat_completion.__module__ == "utils.llm_gateway"
+    assert isinstance(gateway_module.llm_gateway, LLMGateway)
+
+if __name__ == "__main__":
+    test_sync_client_is_reused()
+    test_async_calls_run_concurrently()
+    test_module_level_gateway_is_shared()
+    print("✅ 所有 OpenAI 閘道測試通過")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+測試新聞時間解析：Serper date 欄位、中文日期、民國年、相對時間與結果快取
+"""
+
+from datetime import datetime
+from utils.news_dates import is_recent, parse_date_text, result_age_days, result_timestamp
+
+NOW = datetime(2024, 10, 15, 12, 0)
+
+def test_formats():
+    """各種日期寫法都解析成同一種時間"""
+    print("🔍 測試日期格式")
+    cases = {
+        "3 小時前": datetime(2024, 10, 15, 9, 0),
+        "2 days ago": datetime(2024, 10, 13, 12, 0),
+        "5天前": datetime(2024, 10, 10, 12, 0),
+        "Oct 10, 2024": datetime(2024, 10, 10),
+        "2024年1月1日": datetime(2024, 1, 1),
+        "2024/10/01 盤後": datetime(2024, 10, 1),
+        "2024-09-30T08:00:00Z": datetime(2024, 9, 30),
+        "113年10月8日": datetime(2024, 10, 8),
+        "113/10/08": datetime(2024, 10, 8),
+        "昨天": datetime(2024, 10, 14, 12, 0),
+        "9/30 台股盤後": datetime(2024, 9, 30),
+        "12月20日法說會": datetime(2023, 12, 20),  # 沒有年份且在未來，視為去年
+    }
+    for text, expected in cases.items():
+        assert parse_date_text(text, NOW) == expected, text
+    assert parse_date_text("台積電法說會", NOW) is None
+    assert parse_date_text("10月3日前完成", NOW) == datetime(2024, 10, 3)
+
+def test_result_timestamp_cached():
+    """每筆結果只解析一次，結果快取在 published_at"""
+    print("🔍 測試解析結果快取")
+    result = {"title": "台積電營收", "snippet": "Oct 10, 2024 — 台積電公布9月營收", "date": ""}
+    assert result_timestamp(result, NOW) == datetime(2024, 10, 10).timestamp()
+    assert result["published_at"] == datetime(2024, 10, 10).timestamp()
+    result["snippet"] = "已被快取，不會重新解析"
+    assert result_age_days(result, NOW) == 5.5
+
+    unknown = {"title": "台積電營收", "snippet": ""}
+    assert result_timestamp(unknown, NOW) is None and "published_at" in unknown
+
+def test_is_recent():
+    """近期新聞篩選"""
+    print("🔍 測試近期新聞篩選")
+    assert is_recent({"date": "3 天前"}, 7, NOW)
+    assert not is_recent({"date": "2024年9月1日"}, 7, NOW)
+    assert is_recent({"date": "2024年9月1日"}, 45, NOW)
+    assert not is_recent({"title": "沒有日期"}, 31, NOW)
+
+if __name__ == "__main__":
+    test_formats()
+    test_result_timestamp_cached()
+    test_is_recent()
+    print("✅ 所有新聞時間解析測試通過")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+測試新聞去重：網址正規化、轉載新聞的近似重複、保留來源最好的一筆
+"""
+
+from langgraph_app.nodes.search_news import ALLOWED_SITES, remove_duplicate_results
+from langgraph_app.nodes.search_planner import SearchResultMerger
+from utils.news_dedup import NewsDeduplicator, canonicalize_url, result_simhash
+
+STORY_TITLE = "台積電9月營收年增36% 第三季營收創同期新高"
+STORY_SNIPPET = "台積電今日公布9月營收，受惠AI伺服器需求強勁，單月營收年增36%，第三季營收創下同期新高，法人看好第四季持續成長。"
+
+def test_canonicalize_url():
+    """追蹤參數、行動版與 AMP 網址、http/https 與結尾斜線不影響比對"""
+    print("🔍 測試網址正規化")
+    base = canonicalize_url("https://news.cnyes.com/news/id/5678")
+    assert canonicalize_url("http://news.cnyes.com/news/id/5678/?utm_source=line&fbclid=abc") == base
+    assert canonicalize_url("https://m.cnyes.com/news/id/5678") != base  # 不同子網域的行動版不一定是同一頁
+    assert canonicalize_url("https://www.ctee.com.tw/news/20241010700-430101/amp") == canonicalize_url("https://ctee.com.tw/news/20241010700-430101")
+    assert canonicalize_url("https://money.udn.com/money/story/5612/8283?outputType=amp") == canonicalize_url("https://money.udn.com/money/story/5612/8283")
+    assert canonicalize_url("https://tw.stock.yahoo.com/news?id=1&p=2") == canonicalize_url("https://tw.stock.yahoo.com/news?p=2&id=1")
+    assert canonicalize_url("https://tw.stock.yahoo.com/news?id=1") != canonicalize_url("https://tw.stock.yahoo.com/news?id=2")
+
+def test_syndicated_story_collapsed():
+    """同一則新聞的轉載只保留來源排序較前面的一筆，位置取最早出現的"""
+    print("🔍 測試轉載新聞近似重複")
+    results = [
+        {"title": STORY_TITLE + " - ETtoday財經雲", "snippet": STORY_SNIPPET, "link": "https://finance.ettoday.net/news/1"},
+        {"title": "聯發科推出新晶片 搶攻AI手機市場", "snippet": "聯發科發表新一代旗艦晶片，強化生成式AI運算效能。", "link": "https://technews.tw/2024/10/10/mediatek"},
+        {"title": STORY_TITLE + "｜鉅亨網", "snippet": STORY_SNIPPET.replace("今日", "10日"), "link": "https://news.cnyes.com/news/id/5678?utm_source=x"},
+        {"title": STORY_TITLE, "snippet": STORY_SNIPPET, "link": "https://finance.ettoday.net/news/1?from=rss"},
+    ]
+    assert bin(result_simhash(results[0]) ^ result_simhash(results[2])).count("1") <= 3
+    unique = remove_duplicate_results(results)
+    assert [r["link"] for r in unique] == ["https://news.cnyes.com/news/id/5678?utm_source=x", "https://technews.tw/2024/10/10/mediatek"]
+
+def test_short_titles_not_merged():
+    """特徵太少的短標題只比對網址"""
+    print("🔍 測試短標題")
+    dedup = NewsDeduplicator()
+    assert dedup.add({"title": "r1-0", "link": "https://cnyes.com/r1/0"})
+    assert dedup.add({"title": "r4-0", "link": "https://cnyes.com/r4/0"})
+    assert len(dedup) == 2
+
+def test_merger_collapses_across_rounds():
+    """跨輪次的重複新聞只留一筆，並記錄重複統計"""
+    print("🔍 測試跨輪次去重")
+    merger = SearchResultMerger()
+    assert merger.add(4, [{"title": STORY_TITLE, "snippet": STORY_SNIPPET, "link": "https://money.udn.com/money/story/1"}]) == 1
+    assert merger.add(1, [{"title": STORY_TITLE, "snippet": STORY_SNIPPET, "link": "https://tw.finance.yahoo.com/news/1"}]) == 0
+    assert merger.add(2, [{"title": STORY_TITLE, "snippet": STORY_SNIPPET, "link": "https://tw.finance.yahoo.com/news/1/"}]) == 0
+    # 經濟日報的可信度權重高於 Yahoo奇摩股市
+    assert [r["link"] for r in merger.results()] == ["https://money.udn.com/money/story/1"]
+    print(f"   統計: {merger.stats}")
+    assert merger.stats == {"url_duplicates": 1, "near_duplicates": 1}
+
+if __name__ == "__main__":
+    test_canonicalize_url()
+    test_syndicated_story_collapsed()
+    test_short_titles_not_merged()
+    test_merger_collapses_across_rounds()
+    print("✅ 所有新聞去重測試通過")
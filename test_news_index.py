@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+測試個股新聞索引：股票標記、同步時間窗、以索引作答時只搜尋增量時間
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from langgraph_app.nodes import search_planner
+from langgraph_app.nodes.search_planner import run_search_rounds
+from utils.news_index import NewsIndex, StockTagger, delta_window
+from utils.query_planner import current_query_planner
+
+ALIASES = {"2330": ["2330", "台積電", "台積"], "2454": ["2454", "聯發科"], "2317": ["2317", "鴻海"]}
+
+def _articles(count: int, days_ago: float = 1, prefix: str = "a"):
+    date = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+    return [
+        {"title": f"台積電 新聞 {prefix}{i}", "snippet": f"台積電 2330 第 {i} 則", "link": f"https://cnyes.com/news/{prefix}{i}?utm_source=x", "date": date}
+        for i in range(count)
+    ]
+
+def _index(tmpdir: str) -> NewsIndex:
+    return NewsIndex(db_path=os.path.join(tmpdir, "news_index.sqlite3"), tagger=StockTagger(ALIASES))
+
+def test_tagger_prefers_longest_alias():
+    """別名與四位數代號都會被標記，依出現順序"""
+    print("🔍 測試股票標記")
+    tagger = StockTagger(ALIASES)
+    tags = tagger.tag("鴻海與台積電(2330)、聯發科同步上漲，12345 不是代號")
+    print(f"   標記結果: {tags}")
+    assert tags == ["2317", "2330", "2454"]
+    assert tagger.tag("沒有提到任何股票") == []
+
+def test_delta_window():
+    """上次同步後的時間對應到最小的 Serper 時間窗"""
+    assert delta_window(600)[0] == "qdr:h"
+    assert delta_window(5 * 3600)[0] == "qdr:d"
+    assert delta_window(3 * 86400)[0] == "qdr:w"
+    assert delta_window(30 * 86400) is None
+
+def test_fresh_articles_require_sync_and_volume():
+    """需要同步紀錄與足夠數量的近期新聞才以索引作答"""
+    print("🔍 測試索引作答條件")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = _index(tmpdir)
+        assert index.record(_articles(25)) == 25
+        # 沒有同步紀錄（例如搜尋失敗）時不使用索引
+        assert index.fresh_articles("2330") == ([], None)
+
+        index.record([], synced_stock_id="2330", synced_at=time.time() - 7200)
+        articles, delta = index.fresh_articles("2330")
+        print(f"   索引新聞: {len(articles)} 則，增量時間窗: {delta}")
+        assert len(articles) == 25 and delta[0] == "qdr:d"
+        assert articles[0]["published_at"] is not None
+        # 追蹤參數不同的同一則新聞不會重複寫入
+        index.record(_articles(25))
+        assert len(index.fresh_articles("2330")[0]) == 25
+        assert index.fresh_articles("2454") == ([], None)
+        assert index.get_stats()["articles"] == 25
+
+def test_old_articles_do_not_count():
+    """時間窗以外的新聞不計入"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = _index(tmpdir)
+        index.record(_articles(25, days_ago=30), synced_stock_id="2330")
+        assert index.fresh_articles("2330") == ([], None)
+
+def test_search_rounds_use_index_and_delta_window():
+    """索引已有足夠新聞時，搜尋輪次以增量時間窗查詢，結果包含索引新聞"""
+    print("🔍 測試搜尋規劃器使用新聞索引")
+    seen_ranges = []
+
+    def fake_search(company_name, stock_id, intent, keywords, serper_api_key, use_grouped):
+        seen_ranges.append(current_query_planner().time_range)
+        return {"success": True, "results": _articles(2, days_ago=0, prefix=keywords[0])}
+
+    rounds = [{"round": 1, "label": "第一次", "depends_on": [], "start_log": None, "keyword_log": "{keywords}", "keywords": lambda ctx, deps: ["new"]}]
+
+    async def collect():
+        return [event async for event in run_search_rounds("台積電", "2330", "個股分析", "fake", lambda: [], rounds=rounds)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = _index(tmpdir)
+        original = (search_planner.news_index, search_planner.search_news_smart)
+        search_planner.news_index = index
+        search_planner.search_news_smart = fake_search
+        try:
+            # 第一次：索引是空的，完整搜尋
+            first = asyncio.run(collect())[-1]
+            assert seen_ranges == [None] and first["indexed"] == 0
+
+            index.record(_articles(25), synced_stock_id="2330", synced_at=time.time() - 600)
+            events = asyncio.run(collect())
+        finally:
+            search_planner.news_index, search_planner.search_news_smart = original
+
+    final = events[-1]
+    logs = [event["log"] for event in events if "log" in event]
+    print(f"   時間範圍: {seen_ranges}，索引新聞: {final['indexed']}，合併後: {len(final['results'])}")
+    assert seen_ranges[-1] == "qdr:h"
+    # 第一次搜尋的 2 則也已寫入索引，增量搜尋找到的是同樣的新聞
+    assert final["indexed"] == 27
+    assert len(final["results"]) == 27
+    assert any(log.startswith("🗂️") for log in logs)
+
+if __name__ == "__main__":
+    test_tagger_prefers_longest_alias()
+    test_delta_window()
+    test_fresh_articles_require_sync_and_volume()
+    test_old_articles_do_not_count()
+    test_search_rounds_use_index_and_delta_window()
+    print("✅ 所有新聞索引測試通過")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+測試新聞相關性排序：BM25 相關性、公司別名、新聞時間、來源可信度與 top-k
+"""
+
+from datetime import datetime
+from langgraph_app.nodes.news_ranker import build_query_terms, rank_news, recency_score, tokenize
+
+NOW = datetime(2024, 10, 15, 12, 0)
+
+def _news(title, snippet="", link="https://news.cnyes.com/news/id/1", date=""):
+    return {"title": title, "snippet": snippet, "link": link, "date": date}
+
+def test_tokenize():
+    """中文取字元 bigram，英數字取整個單字"""
+    print("🔍 測試斷詞")
+    assert tokenize("台積電 TSMC 2330") == ["台積", "積電", "tsmc", "2330"]
+    assert tokenize("ＥＰＳ") == ["eps"]
+
+def test_query_terms_include_aliases():
+    """查詢詞彙包含股票別名"""
+    print("🔍 測試公司別名")
+    terms = build_query_terms(question="最近財報如何", stock_id="2330")
+    assert "護國" in terms and "tsmc" in terms and "財報" in terms
+
+def test_relevant_news_ranked_first():
+    """與問題相關的新聞排在前面，不論原本的輪次順序"""
+    print("🔍 測試相關性排序")
+    results = [
+        _news("美股收盤 道瓊小漲", "美國股市週一收盤，道瓊指數小漲。"),
+        _news("聯發科新晶片發表", "聯發科推出新一代旗艦晶片。"),
+        _news("台積電法說會 第三季毛利率優於預期", "台積電法說會公布第三季財報，毛利率與EPS皆優於預期。"),
+        _news("護國神山營收創新高", "台積電9月營收年增，財報表現亮眼。"),
+    ]
+    ranked = rank_news(results, question="台積電最近財報怎麼樣", company_name="台積電", stock_id="2330", now=NOW)
+    titles = [r["title"] for r in ranked]
+    print(f"   排序結果: {titles}")
+    assert set(titles[:2]) == {"台積電法說會 第三季毛利率優於預期", "護國神山營收創新高"}
+    assert len(rank_news(results, question="台積電財報", top_k=2, now=NOW)) == 2
+    assert rank_news([], question="台積電") == []
+
+def test_recency_and_source_break_ties():
+    """內容相同時，較新的新聞與可信度較高的來源排在前面"""
+    print("🔍 測試新聞時間與來源")
+    assert recency_score({"date": "3 小時前"}, NOW) > recency_score({"date": "2024年10月1日"}, NOW)
+    assert recency_score({"date": "2 days ago"}, NOW) > recency_score({}, NOW)
+
+    old = _news("台積電財報亮眼", "台積電財報優於預期", date="2024年9月1日")
+    fresh = _news("台積電財報亮眼", "台積電財報優於預期", date="1 天前")
+    assert rank_news([old, fresh], question="台積電財報", now=NOW)[0] is fresh
+
+    nownews = _news("台積電財報亮眼", "台積電財報優於預期", link="https://www.nownews.com/news/1")
+    udn = _news("台積電財報亮眼", "台積電財報優於預期", link="https://money.udn.com/money/story/1")
+    assert rank_news([nownews, udn], question="台積電財報", now=NOW)[0] is udn
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_query_terms_include_aliases()
+    test_relevant_news_ranked_first()
+    test_recency_and_source_break_ties()
+    print("✅ 所有新聞排序測試通過")
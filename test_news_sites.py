@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+測試新聞來源白名單：後綴查詢、最長後綴優先、過濾不修改原始結果
+"""
+
+from langgraph_app.nodes.generate_section_sources import extract_site_name
+from langgraph_app.nodes.search_news import ALLOWED_SITES, filter_results_by_site
+from utils.news_sites import NEWS_SITES, classify_site, site_registry
+
+def test_classify_by_suffix():
+    """子網域依後綴歸到白名單網站，未列入的網站回傳 None"""
+    print("🔍 測試網域分類")
+    assert classify_site("https://news.cnyes.com/news/id/5678").name == "鉅亨網"
+    assert classify_site("WWW.CTEE.COM.TW").domain == "ctee.com.tw"
+    assert classify_site("https://smart.businessweekly.com.tw/Reading/1").name == "Smart智富"
+    assert classify_site("https://www.businessweekly.com.tw/business/1").name == "商業周刊"
+    assert classify_site("https://www.businessweekly.com.tw/business/1").paywall
+    assert classify_site("https://tw.stock.yahoo.com/news/1") is None
+    assert classify_site("https://notcnyes.com/news") is None
+    assert classify_site("") is None
+
+def test_single_definition():
+    """ALLOWED_SITES 與來源優先順序都來自同一份白名單"""
+    print("🔍 測試白名單來源")
+    assert ALLOWED_SITES == [site.domain for site in NEWS_SITES]
+    priority = site_registry.priority()
+    assert sorted(priority) == sorted(ALLOWED_SITES)
+    weights = [classify_site(domain).weight for domain in priority]
+    assert weights == sorted(weights, reverse=True)
+
+def test_filter_does_not_mutate():
+    """過濾後的結果帶有 site_name，原始結果不被修改"""
+    print("🔍 測試過濾結果")
+    results = [
+        {"title": "台積電法說會", "link": "https://news.cnyes.com/news/id/1"},
+        {"title": "PTT 討論", "link": "https://www.ptt.cc/bbs/Stock/M.1.html"},
+    ]
+    filtered = filter_results_by_site(results)
+    assert [r["site_name"] for r in filtered] == ["cnyes.com"]
+    assert "site_name" not in results[0] and "filtered" not in results[1]
+    assert extract_site_name("https://money.udn.com/money/story/1") == "經濟日報"
+    assert extract_site_name("https://www.ptt.cc/bbs/Stock/M.1.html") == "ptt.cc"
+
+if __name__ == "__main__":
+    test_classify_by_suffix()
+    test_single_definition()
+    test_filter_does_not_mutate()
+    print("✅ 所有新聞來源白名單測試通過")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+測試 prompt token 預算：本機計算 token 數、依預算放入排序後的內容區塊、閘道送出前的估計值與實際用量記錄在同一筆
+"""
+
+import json
+import os
+import tempfile
+import time
+import httpx
+import openai
+from types import SimpleNamespace
+from langgraph_app.nodes import search_news as search_module
+from langgraph_app.nodes.search_news import extract_keywords_from_results
+from utils import prompt_budget
+from utils import token_tracker as tracker_module
+from utils import tracing
+from utils.llm_cache import LLMResponseCache
+from utils.llm_gateway import LLMGateway
+from utils.prompt_budget import PROMPT_BLOCKS, PromptBuilder, count_message_tokens, count_tokens, fit_blocks, truncate_to_tokens
+from utils.token_tracker import TokenTracker, track_openai_call
+from utils.tracing import trace_request
+
+def test_count_and_truncate():
+    """token 數隨內容增加，截斷後不超過上限"""
+    print("🔍 測試 token 計算")
+    text = "台積電(2330)第三季營收創新高，外資連續買超 TSMC revenue hits record high. " * 20
+    assert count_tokens("") == 0
+    assert 0 < count_tokens(text[:50]) < count_tokens(text)
+    messages = [{"role": "system", "content": "分析師"}, {"role": "user", "content": text}]
+    assert count_message_tokens(messages) > count_tokens("分析師") + count_tokens(text)
+    truncated = truncate_to_tokens(text, 30)
+    assert text.startswith(truncated) and 0 < count_tokens(truncated) <= 30
+    assert truncate_to_tokens(text, 0) == ""
+
+def test_fit_blocks_keeps_ranked_prefix():
+    """依排序放入區塊，最後一個放不下的區塊在空間足夠時截斷，其餘捨棄"""
+    blocks = [f"新聞{i}: " + "台積電營收成長" * 10 for i in range(10)]
+    per_block = count_tokens(blocks[0])
+    kept, truncated = fit_blocks(blocks, per_block * 3 + prompt_budget.PROMPT_MIN_BLOCK_TOKENS + 10, separator="")
+    print(f"   每個區塊 {per_block} tokens，放入 {len(kept)} 個（截斷 {truncated} 個）")
+    assert kept[:3] == blocks[:3] and len(kept) == 4 and truncated == 1
+    assert blocks[3].startswith(kept[3]) and kept[3] != blocks[3]
+    # 剩餘空間不足 PROMPT_MIN_BLOCK_TOKENS 時直接捨棄
+    kept, truncated = fit_blocks(blocks, per_block * 2 + 1, separator="")
+    assert kept == blocks[:2] and truncated == 0
+
+def test_builder_respects_budget():
+    """組好的 prompt（含 system 訊息）不超過預算；沒有預算時全部放入"""
+    system = {"role": "system", "content": "你是一位專業的證券分析師。"}
+    template = f"請根據以下新聞分析台積電：\n{PROMPT_BLOCKS}\n請列出重點。"
+    blocks = [f"新聞{i}: 台積電法說會釋出樂觀展望，外資調升目標價" for i in range(200)]
+
+    builder = PromptBuilder("budget_test", model="gpt-4o-mini", budget=500)
+    prompt = builder.fill(template, blocks, other_messages=[system])
+    actual = count_message_tokens([system, {"role": "user", "content": prompt}], "gpt-4o-mini")
+    print(f"   預算 500 tokens，放入 {builder.stats['kept']}/{builder.stats['blocks']} 則，估計 {builder.stats['estimated_tokens']}")
+    assert actual <= 500 and builder.stats["estimated_tokens"] <= 500
+    assert prompt.startswith("請根據以下新聞分析台積電：\n新聞0:") and prompt.endswith("請列出重點。")
+    assert 0 < builder.stats["kept"] < 200 and builder.stats["dropped"] == 200 - builder.stats["kept"]
+
+    unlimited = PromptBuilder("budget_test", model="gpt-4o-mini", budget=0)
+    assert unlimited.fill(template, blocks[:3]) == template.replace(PROMPT_BLOCKS, "\n".join(blocks[:3]))
+
+def test_extract_keywords_prompt_is_bounded():
+    """第二輪關鍵字的 prompt 不再串接所有搜尋結果"""
+    prompts = []
+
+    def fake_chat_completion(node, messages, model, **kwargs):
+        prompts.append(messages)
+        return SimpleNamespace(model=model, usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content='["台積電 財報"]'))])
+
+    results = [{"title": f"台積電新聞{i}", "snippet": "台積電第三季營收創新高，法人看好先進製程需求。" * 5} for i in range(100)]
+    original = search_module.chat_completion
+    search_module.chat_completion = fake_chat_completion
+    try:
+        keywords = extract_keywords_from_results(results, "台積電", "2330")
+    finally:
+        search_module.chat_completion = original
+    tokens = count_message_tokens(prompts[0], "gpt-3.5-turbo")
+    print(f"   100 則搜尋結果的 prompt: {tokens} tokens")
+    assert keywords == ["台積電 財報"]
+    assert tokens <= prompt_budget.node_budget("extract_keywords_from_results")
+    assert "台積電新聞0 " in prompts[0][0]["content"] and "台積電新聞99 " not in prompts[0][0]["content"]
+
+def test_gateway_records_estimate_next_to_usage():
+    """閘道在送出前估計 token 數，TokenTracker 將估計值與實際用量、超過預算的呼叫記錄下來"""
+    print("🔍 測試送出前的 token 估計")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "好"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 40, "completion_tokens": 1, "total_tokens": 41},
+        })
+
+    gateway = LLMGateway(cache=LLMResponseCache(db_path="", node_ttls={}))
+    gateway._client = openai.OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    gateway._client_key = os.getenv("OPENAI_API_KEY")
+
+    prompt_budget._node_budgets["budget_test"] = 10
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original = (tracker_module.token_tracker, tracing.TRACE_FILE)
+        tracker_module.token_tracker = TokenTracker(os.path.join(tmpdir, "token_usage.json"))
+        tracing.TRACE_FILE = ""
+        try:
+            with trace_request("test") as trace:
+                messages = [{"role": "user", "content": "請分析台積電(2330)近期股價走勢與法人動向"}]
+                response = gateway.chat_completion("budget_test", messages, model="gpt-3.5-turbo")
+                # 閘道已記錄這次呼叫，節點再呼叫 track_openai_call 不會重複記錄
+                track_openai_call("budget_test", response)
+            summary = tracker_module.token_tracker.get_usage_summary()
+            records = list(tracker_module.token_tracker.usage_log)
+            record = records[-1]
+        finally:
+            tracker_module.token_tracker, tracing.TRACE_FILE = original
+            prompt_budget._node_budgets.pop("budget_test", None)
+
+    print(f"   估計 {response.estimated_prompt_tokens} tokens，實際 {record['prompt_tokens']} tokens")
+    assert response.estimated_prompt_tokens == count_message_tokens(messages, "gpt-3.5-turbo")
+    assert len(records) == 1
+    assert record["estimated_prompt_tokens"] == response.estimated_prompt_tokens and record["prompt_budget"] == 10
+    assert summary["estimated_prompt_tokens"] == response.estimated_prompt_tokens
+    assert summary["estimated_actual_prompt_tokens"] == 40 and summary["over_budget_calls"] == 1
+    assert summary["node_breakdown"]["budget_test"]["max_prompt_tokens"] == 40
+    assert gateway.get_stats()["over_budget"] == 1
+    spans = [s for s in trace.spans if s.name == "openai.chat"]
+    assert spans[0].attributes["estimated_prompt_tokens"] == response.estimated_prompt_tokens
+
+def test_budgeted_node_usage_reaches_tracker():
+    """有預算的節點不必自己記錄：超過預算的實際呼叫經由閘道出現在 TokenTracker 的統計"""
+    print("🔍 測試有預算節點的用量記錄")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": '["台積電 財報"]'}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 2000, "completion_tokens": 10, "total_tokens": 2010},
+        })
+
+    gateway = LLMGateway(cache=LLMResponseCache(db_path="", node_ttls={}))
+    gateway._client = openai.OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    gateway._client_key = os.getenv("OPENAI_API_KEY")
+
+    results = [{"title": f"台積電新聞{i}", "snippet": "台積電第三季營收創新高，法人看好先進製程需求。" * 5} for i in range(100)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original = (tracker_module.token_tracker, search_module.chat_completion)
+        tracker_module.token_tracker = TokenTracker(os.path.join(tmpdir, "token_usage.json"))
+        search_module.chat_completion = gateway.chat_completion
+        try:
+            keywords = extract_keywords_from_results(results, "台積電", "2330")
+            summary = tracker_module.token_tracker.get_usage_summary()
+        finally:
+            tracker_module.token_tracker, search_module.chat_completion = original
+
+    node = summary["node_breakdown"]["extract_keywords_from_results"]
+    print(f"   實際輸入 {node['max_prompt_tokens']} tokens，預算 {prompt_budget.node_budget('extract_keywords_from_results')}")
+    assert keywords == ["台積電 財報"]
+    assert summary["total_calls"] == 1 and summary["over_budget_calls"] == 1
+    assert node["max_prompt_tokens"] == 2000 and node["over_budget"] == 1
+    assert 0 < node["estimated_prompt_tokens"] <= prompt_budget.node_budget("extract_keywords_from_results")
+
+if __name__ == "__main__":
+    test_count_and_truncate()
+    test_fit_blocks_keeps_ranked_prefix()
+    test_builder_respects_budget()
+    test_extract_keywords_prompt_is_bounded()
+    test_gateway_records_estimate_next_to_usage()
+    test_budgeted_node_usage_reaches_tracker()
+    print("✅ 所有 prompt token 預算測試通過")
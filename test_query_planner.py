@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+測試搜尋關鍵字規劃：正規化、同一請求跨輪次去重、省下的查詢數記錄在 trace
+"""
+
+import asyncio
+from langgraph_app.nodes import search_planner
+from langgraph_app.nodes.search_news import ALLOWED_SITES
+from langgraph_app.nodes.search_planner import run_search_rounds
+from utils import tracing
+from utils.query_planner import QueryPlanner, canonicalize_query, current_query_planner
+from utils.tracing import trace_request
+from utils.news_index import NewsIndex
+
+# 測試不讀寫本機的新聞索引
+search_planner.news_index = NewsIndex(db_path="")
+
+def test_canonicalize_query():
+    """site: 條件、全形字元、空白與詞序不影響正規化結果"""
+    print("🔍 測試關鍵字正規化")
+    base = canonicalize_query("台積電 2025 財報", ALLOWED_SITES)
+    assert canonicalize_query("台積電 2025 財報 site:tw.finance.yahoo.com", ALLOWED_SITES) == base
+    assert canonicalize_query("財報　台積電  ２０２５", ALLOWED_SITES) == base
+    assert canonicalize_query("台積電 2025 財報 site:news.cnyes.com", ALLOWED_SITES) == base
+    # 未涵蓋的網站保留
+    assert canonicalize_query("台積電 2025 財報 site:ptt.cc", ALLOWED_SITES) != base
+    assert canonicalize_query("TSMC ADR", ALLOWED_SITES) == canonicalize_query("adr tsmc", ALLOWED_SITES)
+
+def test_planner_drops_duplicates():
+    """已送出的關鍵字不再送出，並計入省下的查詢數"""
+    print("🔍 測試重複關鍵字略過")
+    planner = QueryPlanner()
+    first = planner.plan(["台積電 2025 財報", "2330 法人動向", "台積電 2025 財報"], ALLOWED_SITES)
+    assert [query for query, _ in first] == ["台積電 2025 財報", "2330 法人動向"]
+    second = planner.plan(["台積電 2025 財報 site:cnyes.com", "台積電 EPS"], ALLOWED_SITES)
+    assert [query for query, _ in second] == ["台積電 EPS"]
+    assert planner.saved == 2 and planner.issued == 3
+
+def test_rounds_share_planner():
+    """同一請求的各輪搜尋共用規劃器，省下的查詢數記錄在 trace"""
+    print("🔍 測試跨輪次去重")
+
+    def fake_search(company_name, stock_id, intent, keywords, serper_api_key, use_grouped):
+        planned = current_query_planner().plan(keywords, ALLOWED_SITES)
+        return {"success": True, "results": [{"title": q, "link": f"https://cnyes.com/{q}"} for q, _ in planned]}
+
+    def keywords_for(keywords):
+        return lambda ctx, dep_results: keywords
+
+    rounds = [
+        {"round": 1, "label": "第一次", "depends_on": [], "start_log": None, "keyword_log": "{keywords}",
+         "keywords": keywords_for(["台積電 2025 財報", "2330 法人動向"])},
+        {"round": 2, "label": "第二次", "depends_on": [1], "start_log": None, "keyword_log": "{keywords}",
+         "keywords": keywords_for(["台積電 2025 財報 site:tw.finance.yahoo.com", "台積電 EPS"])},
+    ]
+
+    async def collect():
+        with trace_request("ask_sse") as trace:
+            events = [event async for event in run_search_rounds("台積電", "2330", "個股分析", "fake", lambda: [], rounds=rounds)]
+        return trace, events
+
+    original_search = search_planner.search_news_smart
+    original_file = tracing.TRACE_FILE
+    search_planner.search_news_smart = fake_search
+    tracing.TRACE_FILE = ""
+    try:
+        trace, events = asyncio.run(collect())
+    finally:
+        search_planner.search_news_smart = original_search
+        tracing.TRACE_FILE = original_file
+
+    print(f"   trace 屬性: {trace.root.attributes}")
+    assert events[-1]["rounds"] == {1: 2, 2: 1}
+    assert trace.root.attributes["search.queries_saved"] == 1
+    assert trace.root.attributes["search.queries_issued"] == 3
+    assert current_query_planner() is None
+
+if __name__ == "__main__":
+    test_canonicalize_query()
+    test_planner_drops_duplicates()
+    test_rounds_share_planner()
+    print("✅ 所有關鍵字規劃測試通過")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+測試 Serper 限流器：token bucket 速率、優先順序排隊、跨 worker 共用狀態、429 退讓重試
+"""
+
+import os
+import tempfile
+import threading
+import time
+import httpx
+from langgraph_app.nodes import search_news
+from utils.http_client import http_pool
+from utils.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_SPECULATIVE,
+    RateLimitTimeout,
+    TokenBucket,
+    current_priority,
+    request_priority
+)
+
+def test_bucket_allows_burst_then_limits():
+    """先用掉 burst，之後依 rate 補充"""
+    print("🔍 測試 token bucket 速率")
+    bucket = TokenBucket("test", rate=20, burst=3)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire(PRIORITY_INTERACTIVE)
+    elapsed = time.monotonic() - start
+    stats = bucket.get_stats()["priorities"]["interactive"]
+    print(f"   5 次取得耗時 {elapsed:.2f} 秒，等待 {stats['waited']} 次")
+    assert 0.08 <= elapsed < 0.5
+    assert stats["acquired"] == 5 and stats["waited"] == 2
+
+def test_priority_order():
+    """配額不足時，互動查詢排在推測性與背景查詢之前"""
+    print("🔍 測試優先順序排隊")
+    bucket = TokenBucket("test", rate=20, burst=1)
+    bucket.acquire(PRIORITY_INTERACTIVE)
+    order = []
+    lock = threading.Lock()
+
+    def worker(priority, name):
+        bucket.acquire(priority)
+        with lock:
+            order.append(name)
+
+    threads = []
+    # 先到的是背景與推測性查詢，互動查詢最後才到
+    for priority, name in [(PRIORITY_BACKGROUND, "background"), (PRIORITY_SPECULATIVE, "speculative"), (PRIORITY_INTERACTIVE, "interactive")]:
+        thread = threading.Thread(target=worker, args=(priority, name))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+    print(f"   取得順序: {order}")
+    assert order == ["interactive", "speculative", "background"]
+
+def test_timeout_and_penalize():
+    """429 暫停後在逾時內排不到配額時拋出 RateLimitTimeout"""
+    bucket = TokenBucket("test", rate=100, burst=5)
+    bucket.penalize(1.0)
+    try:
+        bucket.acquire(PRIORITY_INTERACTIVE, timeout=0.05)
+        assert False, "應該逾時"
+    except RateLimitTimeout:
+        pass
+    assert bucket.get_stats()["priorities"]["interactive"]["timeouts"] == 1
+
+def test_shared_bucket_across_instances():
+    """兩個 worker（兩個實例）共用同一個 SQLite bucket"""
+    print("🔍 測試跨 worker 共用配額")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "limits.sqlite3")
+        first = TokenBucket("serper", rate=0.5, burst=2, db_path=db_path)
+        second = TokenBucket("serper", rate=0.5, burst=2, db_path=db_path)
+        first.acquire(PRIORITY_INTERACTIVE)
+        second.acquire(PRIORITY_INTERACTIVE)
+        try:
+            first.acquire(PRIORITY_INTERACTIVE, timeout=0.1)
+            assert False, "配額已被另一個 worker 用完"
+        except RateLimitTimeout:
+            pass
+
+def test_priority_context():
+    """request_priority 只影響區塊內的呼叫"""
+    assert current_priority() == PRIORITY_INTERACTIVE
+    with request_priority(PRIORITY_SPECULATIVE):
+        assert current_priority() == PRIORITY_SPECULATIVE
+    assert current_priority() == PRIORITY_INTERACTIVE
+
+def test_serper_retries_after_429():
+    """收到 429 時依 Retry-After 退讓後重試"""
+    print("🔍 測試 429 退讓重試")
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.2"}, json={"message": "rate limited"})
+        return httpx.Response(200, json={"organic": []})
+
+    original_client = http_pool._sync_clients.get("google.serper.dev")
+    original_limiter = search_news.serper_limiter
+    http_pool._sync_clients["google.serper.dev"] = httpx.Client(transport=httpx.MockTransport(handler))
+    search_news.serper_limiter = TokenBucket("serper", rate=100, burst=10)
+    try:
+        response = search_news._post_serper({"q": "台積電"}, "fake", timeout=5)
+    finally:
+        search_news.serper_limiter = original_limiter
+        if original_client is None:
+            http_pool._sync_clients.pop("google.serper.dev", None)
+        else:
+            http_pool._sync_clients["google.serper.dev"] = original_client
+    print(f"   請求次數: {len(calls)}，間隔 {calls[-1] - calls[0]:.2f} 秒")
+    assert response.status_code == 200
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.2
+
+if __name__ == "__main__":
+    test_bucket_allows_burst_then_limits()
+    test_priority_order()
+    test_timeout_and_penalize()
+    test_shared_bucket_across_instances()
+    test_priority_context()
+    test_serper_retries_after_429()
+    print("✅ 所有限流器測試通過")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+測試完整報告快取：LRU 淘汰、分類 TTL、磁碟層、交易日換算
+"""
+
+import tempfile
+import time
+from datetime import date, datetime
+from utils.report_cache import ReportCache, current_trading_date, parse_category_ttl, TAIPEI_TZ
+
+def _payload(name: str):
+    return {
+        "sections": [{"section": {"section": name}, "index": 0, "total": 1}],
+        "report": {"stockId": "2330", "sections": [{"section": name}]},
+        "report_complete": {"stockId": "2330", "sections_count": 1, "indices": [0]}
+    }
+
+def test_lru_eviction_and_stats():
+    """超過上限時淘汰最久未使用的項目，並正確計算命中/未命中"""
+    print("🔍 測試 LRU 淘汰與統計")
+    cache = ReportCache(max_entries=2, default_ttl=60, category_ttl={}, cache_dir="")
+    cache.put(("2330",), "個股分析", _payload("a"))
+    cache.put(("2317",), "個股分析", _payload("b"))
+    assert cache.get(("2330",)) is not None  # 2330 變成最近使用
+    cache.put(("2454",), "個股分析", _payload("c"))
+
+    assert cache.get(("2317",)) is None
+    assert cache.get(("2454",))["report"]["sections"] == [{"section": "c"}]
+    stats = cache.get_stats()
+    print(f"   統計: {stats}")
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["evictions"] == 1
+
+def test_category_ttl():
+    """不同分類有不同的有效時間，TTL 為 0 的分類不快取"""
+    print("🔍 測試分類 TTL")
+    cache = ReportCache(default_ttl=60, category_ttl={"盤勢分析": 0, "個股分析": 1}, cache_dir="")
+    cache.put(("大盤",), "盤勢分析", _payload("market"))
+    assert cache.get(("大盤",)) is None
+    cache.put(("2330",), "個股分析", _payload("stock"))
+    assert cache.get(("2330",)) is not None
+    cache._entries[("2330",)]["expires_at"] = time.time() - 1
+    assert cache.get(("2330",)) is None
+    assert parse_category_ttl("個股分析=900, 盤勢分析=abc") == {"個股分析": 900}
+
+def test_disk_tier_survives_restart():
+    """寫入磁碟的報告在新的快取實例（模擬重啟）中仍可讀取"""
+    print("🔍 測試磁碟快取")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        key = ("2330", "個股分析", "", "2024-07-05")
+        ReportCache(default_ttl=60, category_ttl={}, cache_dir=cache_dir).put(key, "個股分析", _payload("disk"))
+        restarted = ReportCache(default_ttl=60, category_ttl={}, cache_dir=cache_dir)
+        entry = restarted.get(key)
+        assert entry is not None and entry["sections"][0]["section"] == {"section": "disk"}
+        assert restarted.get_stats()["disk_hits"] == 1
+
+def test_trading_date():
+    """週末與開盤前對應到前一個交易日"""
+    print("🔍 測試交易日換算")
+    assert current_trading_date(datetime(2024, 7, 6, 15, 0, tzinfo=TAIPEI_TZ)) == date(2024, 7, 5)   # 週六
+    assert current_trading_date(datetime(2024, 7, 8, 8, 30, tzinfo=TAIPEI_TZ)) == date(2024, 7, 5)   # 週一開盤前
+    assert current_trading_date(datetime(2024, 7, 8, 10, 0, tzinfo=TAIPEI_TZ)) == date(2024, 7, 8)
+
+if __name__ == "__main__":
+    test_lru_eviction_and_stats()
+    test_category_ttl()
+    test_disk_tier_survives_restart()
+    test_trading_date()
+    print("✅ 所有報告快取測試通過")
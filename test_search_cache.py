@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+測試搜尋結果快取：新鮮命中、過期回傳並背景更新、SQLite 跨 worker 共用、LRU 淘汰
+"""
+
+import os
+import tempfile
+import threading
+import time
+from utils.search_cache import SearchCache, make_search_key
+
+def test_search_key():
+    """來源網站的順序不影響 key"""
+    print("🔍 測試快取 key")
+    assert make_search_key("台積電 2330 財報", 10, ["a.com", "b.com"]) == make_search_key(" 台積電 2330 財報", 10, ["b.com", "a.com"])
+    assert make_search_key("台積電 2330 財報", 10, []) != make_search_key("台積電 2330 財報", 20, [])
+
+def test_fresh_hit_and_failure_not_cached():
+    """新鮮期內不再查詢，失敗的結果不快取"""
+    print("🔍 測試新鮮命中")
+    cache = SearchCache(ttl=60, stale_ttl=600, db_path="")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"organic": [{"link": "https://cnyes.com/news/1"}]}
+
+    assert cache.lookup("k", fetch)[1] == "miss"
+    value, state = cache.lookup("k", fetch)
+    assert state == "hit" and value["organic"][0]["link"] == "https://cnyes.com/news/1"
+    assert len(calls) == 1
+
+    assert cache.lookup("failed", lambda: None) == (None, "miss")
+    assert cache.lookup("failed", lambda: None) == (None, "miss")
+    print(f"   統計: {cache.get_stats()}")
+
+def test_stale_returns_immediately_and_refreshes():
+    """過期結果立即回傳，背景更新後取得新結果"""
+    print("🔍 測試 stale-while-revalidate")
+    cache = SearchCache(ttl=60, stale_ttl=600, db_path="")
+    cache.put("k", {"organic": ["old"]}, fetched_at=time.time() - 120)
+    refreshed = threading.Event()
+
+    def slow_fetch():
+        time.sleep(0.2)
+        refreshed.set()
+        return {"organic": ["new"]}
+
+    start = time.time()
+    value, state = cache.lookup("k", slow_fetch)
+    assert state == "stale" and value == {"organic": ["old"]}
+    assert time.time() - start < 0.1
+    # 背景更新進行中，不會重複排入
+    assert cache.lookup("k", slow_fetch)[1] == "stale"
+    assert refreshed.wait(2)
+    time.sleep(0.05)
+    assert cache.lookup("k", slow_fetch) == ({"organic": ["new"]}, "hit")
+    assert cache.get_stats()["refreshes"] == 1
+
+def test_sqlite_shared_between_workers():
+    """另一個 worker（另一個快取實例）可讀到 SQLite 中的結果"""
+    print("🔍 測試 SQLite 共用")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "search_cache.sqlite3")
+        SearchCache(db_path=db_path).lookup("k", lambda: {"organic": ["2330"]})
+        other = SearchCache(db_path=db_path)
+        assert other.lookup("k", lambda: {"organic": ["should not fetch"]}) == ({"organic": ["2330"]}, "hit")
+        assert other.get_stats()["db_hits"] == 1
+
+def test_lru_eviction():
+    """超過筆數上限時淘汰最久未使用的結果"""
+    print("🔍 測試 LRU 淘汰")
+    cache = SearchCache(max_entries=2, db_path="")
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    cache.lookup("a", lambda: None)
+    cache.put("c", {"v": 3})
+    assert cache.lookup("b", lambda: None) == (None, "miss")
+    assert cache.lookup("a", lambda: None)[1] == "hit"
+
+if __name__ == "__main__":
+    test_search_key()
+    test_fresh_hit_and_failure_not_cached()
+    test_stale_returns_immediately_and_refreshes()
+    test_sqlite_shared_between_workers()
+    test_lru_eviction()
+    print("✅ 所有搜尋快取測試通過")
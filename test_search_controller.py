@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+測試搜尋輪次的提前結束：邊際效益不足或新聞已足夠時略過額外輪次
+"""
+
+import asyncio
+from datetime import datetime
+from langgraph_app.nodes import search_planner
+from langgraph_app.nodes.search_planner import SearchResultMerger, SearchRoundController, run_search_rounds
+from utils.news_index import NewsIndex
+
+# 測試不讀寫本機的新聞索引
+search_planner.news_index = NewsIndex(db_path="")
+
+def _result(prefix: str, i: int, site: str = "cnyes.com", date: str = ""):
+    return {"title": f"台積電 {prefix} 新聞 {i}", "snippet": f"台積電 {prefix} 第 {i} 則", "link": f"https://{site}/{prefix}/{i}", "date": date}
+
+def test_diminishing_round_stops():
+    """第二輪沒有新新聞、新來源，前 k 名也沒變時停止"""
+    print("🔍 測試效益不足時停止")
+    controller = SearchRoundController(SearchResultMerger(), ["台積"], enabled=True)
+    first = [_result("a", i) for i in range(6)]
+    gain = controller.record(1, "第一次", first)
+    print(f"   第一輪: {gain}")
+    assert gain["new_results"] == 6 and gain["new_sites"] == 1
+    assert controller.stop_reason is None
+
+    gain = controller.record(4, "第四次", first[:2])
+    print(f"   第四輪: {gain}，停止原因: {controller.stop_reason}")
+    assert gain == {"new_results": 0, "new_sites": 0, "top_k_gain": 0}
+    assert controller.stop_reason and "第四次" in controller.stop_reason
+
+def test_new_site_keeps_searching():
+    """有新來源時繼續搜尋"""
+    print("🔍 測試新來源時繼續")
+    controller = SearchRoundController(SearchResultMerger(), ["台積"], enabled=True)
+    controller.record(1, "第一次", [_result("a", i) for i in range(6)])
+    gain = controller.record(4, "第四次", [_result("b", 0, site="money.udn.com")])
+    print(f"   第四輪: {gain}")
+    assert gain["new_sites"] == 1
+    assert controller.stop_reason is None
+
+def test_sufficient_results_skip_adaptive_round():
+    """近期相關新聞已足夠時，adaptive 輪次不會執行"""
+    print("🔍 測試新聞已足夠時略過 adaptive 輪次")
+    today = datetime.now().strftime("%Y-%m-%d")
+    searched = []
+
+    def fake_search(company_name, stock_id, intent, keywords, serper_api_key, use_grouped):
+        searched.append(keywords[0])
+        return {"success": True, "results": [_result(keywords[0], i, date=today) for i in range(40)]}
+
+    rounds = [
+        {"round": 1, "label": "第一次", "depends_on": [], "start_log": None, "keyword_log": "{keywords}", "keywords": lambda ctx, deps: ["r1"]},
+        {"round": 2, "label": "第二次", "depends_on": [1], "start_log": None, "keyword_log": "{keywords}", "keywords": lambda ctx, deps: ["r2"], "adaptive": True},
+    ]
+
+    async def collect():
+        return [event async for event in run_search_rounds("台積電", "2330", "個股分析", "fake", lambda: [], rounds=rounds, question="台積電 新聞")]
+
+    original = (search_planner.search_news_smart, search_planner.SEARCH_ADAPTIVE_ENABLED)
+    search_planner.search_news_smart = fake_search
+    search_planner.SEARCH_ADAPTIVE_ENABLED = True
+    try:
+        events = asyncio.run(collect())
+    finally:
+        search_planner.search_news_smart, search_planner.SEARCH_ADAPTIVE_ENABLED = original
+
+    logs = [event["log"] for event in events if "log" in event]
+    print(f"   搜尋過的輪次: {searched}")
+    assert searched == ["r1"]
+    assert any(log.startswith("🛑") for log in logs)
+    assert any(log.startswith("⏭️ 略過第二次搜尋") for log in logs)
+    assert events[-1]["rounds"][2] == 0
+
+if __name__ == "__main__":
+    test_diminishing_round_stops()
+    test_new_site_keeps_searching()
+    test_sufficient_results_skip_adaptive_round()
+    print("✅ 所有搜尋輪次控制測試通過")
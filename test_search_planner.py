@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+測試新聞搜尋規劃器：輪次並行、相依順序、串流去重合併
+"""
+
+import asyncio
+import time
+from langgraph_app.nodes import search_planner
+from langgraph_app.nodes.search_planner import SEARCH_ROUNDS, SearchResultMerger, run_search_rounds
+from utils.news_index import NewsIndex
+
+# 測試不讀寫本機的新聞索引
+search_planner.news_index = NewsIndex(db_path="")
+
+def _fake_result(prefix: str, count: int = 3):
+    return [{"title": f"{prefix}-{i}", "link": f"https://cnyes.com/{prefix}/{i}"} for i in range(count)]
+
+def test_merger_keeps_round_order():
+    """較後輪次先到的重複連結，最後仍排在較前輪次的位置"""
+    print("🔍 測試串流去重合併器")
+    merger = SearchResultMerger()
+    assert merger.add(4, _fake_result("shared", 1) + _fake_result("r4", 1)) == 2
+    assert merger.add(1, _fake_result("r1", 1) + _fake_result("shared", 1)) == 1
+    titles = [r["title"] for r in merger.results()]
+    print(f"   合併結果: {titles}")
+    assert titles == ["r1-0", "shared-0", "r4-0"]
+
+def test_independent_rounds_run_in_parallel():
+    """第一輪與第四輪同時開始，第二輪拿到第一輪的結果"""
+    print("🔍 測試輪次並行")
+    started = {}
+    seen_deps = {}
+
+    def fake_search(company_name, stock_id, intent, keywords, serper_api_key, use_grouped):
+        started[keywords[0]] = time.time()
+        time.sleep(0.2)
+        return {"success": True, "results": _fake_result(keywords[0])}
+
+    def keywords_for(name):
+        def build(ctx, dep_results):
+            seen_deps[name] = [r["title"] for r in dep_results]
+            return [name]
+        return build
+
+    rounds = [
+        {"round": 1, "label": "第一次", "depends_on": [], "start_log": None, "keyword_log": "{keywords}", "keywords": keywords_for("r1")},
+        {"round": 4, "label": "第四次", "depends_on": [], "start_log": None, "keyword_log": "{keywords}", "keywords": keywords_for("r4")},
+        {"round": 2, "label": "第二次", "depends_on": [1], "start_log": None, "keyword_log": "{keywords}", "keywords": keywords_for("r2")},
+    ]
+
+    async def collect():
+        events = []
+        async for event in run_search_rounds("台積電", "2330", "個股分析", "fake", lambda: [], rounds=rounds):
+            events.append(event)
+        return events
+
+    original = search_planner.search_news_smart
+    search_planner.search_news_smart = fake_search
+    try:
+        start = time.time()
+        events = asyncio.run(collect())
+        elapsed = time.time() - start
+    finally:
+        search_planner.search_news_smart = original
+
+    final = events[-1]
+    print(f"   總耗時: {elapsed:.2f} 秒，各輪結果數: {final['rounds']}")
+    assert abs(started["r1"] - started["r4"]) < 0.1
+    assert seen_deps["r2"] == ["r1-0", "r1-1", "r1-2"]
+    assert elapsed < 0.6  # 兩層相依，而非三輪串行
+    assert [r["title"] for r in final["results"]][:3] == ["r1-0", "r1-1", "r1-2"]
+    assert len(final["results"]) == 9
+
+def test_rounds_keep_serial_inputs():
+    """第二、三輪萃取關鍵字的輸入與原本串行搜尋相同"""
+    depends_on = {spec["round"]: spec["depends_on"] for spec in SEARCH_ROUNDS}
+    assert depends_on == {1: [], 4: [], 2: [1], 3: [1, 2]}
+
+if __name__ == "__main__":
+    test_merger_keeps_round_order()
+    test_independent_rounds_run_in_parallel()
+    test_rounds_keep_serial_inputs()
+    print("✅ 所有搜尋規劃器測試通過")
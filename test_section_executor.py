@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+測試報告 section 執行器：並行執行、UI 順序、相依關係
+"""
+
+import time
+from langgraph_app.nodes.section_executor import run_sections, validate_section_specs
+
+def _slow_section(name: str, delay: float):
+    def build(**kwargs):
+        time.sleep(delay)
+        return {"section": {"section": name}, "kwargs": kwargs}
+    return build
+
+def test_sections_run_concurrently_and_keep_order():
+    """互不相依的 section 應並行執行，回傳仍維持宣告順序"""
+    print("🔍 測試並行執行與 UI 順序")
+    specs = [
+        {"name": "A", "inputs": ["stock_id"], "build": _slow_section("A", 0.3)},
+        {"name": "B", "inputs": [], "build": _slow_section("B", 0.1)},
+        {"name": "C", "inputs": ["stock_id"], "build": _slow_section("C", 0.2)},
+    ]
+    completed = []
+    start = time.time()
+    results = run_sections(specs, {"stock_id": "2330"}, max_workers=3,
+                           on_section=lambda index, run: completed.append(index))
+    elapsed = time.time() - start
+
+    print(f"   總耗時: {elapsed:.2f} 秒，完成順序: {completed}")
+    assert [r["name"] for r in results] == ["A", "B", "C"]
+    assert results[0]["outcome"]["kwargs"] == {"stock_id": "2330"}
+    assert completed[0] == 1  # B 最快完成
+    assert elapsed < 0.55  # 接近最慢的 section，而非總和 0.6
+
+def test_dependent_section_waits_for_dependency():
+    """有 depends_on 的 section 會拿到相依 section 的結果"""
+    print("🔍 測試相依關係")
+    specs = [
+        {"name": "summary", "inputs": [], "depends_on": ["base"],
+         "build": lambda deps: {"section": {"from": deps["base"]["section"]["section"]}}},
+        {"name": "base", "inputs": [], "build": _slow_section("base", 0.05)},
+    ]
+    results = run_sections(specs, {})
+    assert results[0]["outcome"]["section"] == {"from": "base"}
+
+def test_failed_section_is_reported():
+    """section 拋出例外時，不影響其他 section"""
+    print("🔍 測試失敗處理")
+
+    def broken():
+        raise RuntimeError("boom")
+
+    specs = [
+        {"name": "broken", "inputs": [], "build": broken},
+        {"name": "ok", "inputs": [], "build": _slow_section("ok", 0)},
+    ]
+    results = run_sections(specs, {})
+    assert results[0]["outcome"] is None and results[0]["error"] == "boom"
+    assert results[1]["outcome"]["section"] == {"section": "ok"}
+
+def test_invalid_specs():
+    """循環相依或不存在的相依應在執行前報錯"""
+    print("🔍 測試不合法的 section 定義")
+    for specs in (
+        [{"name": "a", "depends_on": ["b"], "build": None}, {"name": "b", "depends_on": ["a"], "build": None}],
+        [{"name": "a", "depends_on": ["missing"], "build": None}],
+    ):
+        try:
+            validate_section_specs(specs)
+        except ValueError as e:
+            print(f"   ✅ 正確拒絕: {e}")
+        else:
+            raise AssertionError("應該拋出 ValueError")
+
+if __name__ == "__main__":
+    test_sections_run_concurrently_and_keep_order()
+    test_dependent_section_waits_for_dependency()
+    test_failed_section_is_reported()
+    test_invalid_specs()
+    print("✅ 所有 section 執行器測試通過")
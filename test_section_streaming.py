@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+測試 section 串流：解析未完成的 JSON、閘道的串流呼叫、投資策略建議邊產生邊送出卡片增量，完成後仍回傳原本的 section 格式
+"""
+
+import json
+import os
+import tempfile
+import time
+import httpx
+import openai
+from types import SimpleNamespace
+from langgraph_app.nodes import generate_section_strategy as strategy_module
+from langgraph_app.nodes.generate_report_pipeline import build_strategy
+from langgraph_app.nodes.section_stream import SectionDeltaStream
+from langgraph_app.nodes.summarize_results import parse_partial_summary
+from utils import token_tracker as tracker_module
+from utils import tracing
+from utils.llm_cache import LLMResponseCache
+from utils.llm_gateway import LLMGateway
+from utils.partial_json import parse_partial_json
+from utils.token_tracker import TokenTracker
+from utils.tracing import trace_request
+
+STRATEGY = {
+    "section": "不同投資型態的投資策略建議",
+    "cards": [
+        {"title": "日內交易", "content": [{"text": "留意台積電(2330)的盤勢波動，可考慮在適當時機進行快速交易。", "sources": [{"title": "技術面分析", "link": "https://example.com/tech"}]}]},
+        {"title": "短線交易", "content": [{"text": "關注台積電(2330)的支撐壓力位。"}]},
+        {"title": "中線投資", "content": [{"text": "可分批布局台積電(2330)，關注產業政策變化。"}]},
+        {"title": "長線投資", "content": [{"text": "台積電(2330)具備良好的成長潛力，適合長期持有。"}]}
+    ]
+}
+
+def _pieces(text: str, size: int = 7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_parse_partial_json():
+    """正在輸出的字串值直接補上引號，其他未完成的部分退回到上一個完整位置"""
+    print("🔍 測試未完成 JSON 的解析")
+    assert parse_partial_json('{"cards": [{"title": "日內交易", "content": [{"text": "留意盤') == {
+        "cards": [{"title": "日內交易", "content": [{"text": "留意盤"}]}]
+    }
+    assert parse_partial_json('{"cards": [{"title": "日內交易", "con') == {"cards": [{"title": "日內交易"}]}
+    assert parse_partial_json('{"count": 12') == {}
+    assert parse_partial_json('```json\n{"a": "x\\') == {"a": "x"}
+    assert parse_partial_json("模型還沒開始輸出") is None
+    text = json.dumps(STRATEGY, ensure_ascii=False)
+    assert parse_partial_json(text + "\n```") == STRATEGY
+    # 任何位置截斷都能解析，且解析出的卡片數不會減少
+    counts = [len((parse_partial_json(text[:end]) or {}).get("cards", [])) for end in range(len(text) + 1)]
+    assert counts == sorted(counts) and counts[-1] == 4
+
+def _chunk(content: str = None, finish_reason: str = None, usage: dict = None) -> str:
+    choices = [] if usage else [{"index": 0, "delta": {"content": content} if content else {}, "finish_reason": finish_reason}]
+    chunk = {"id": "chatcmpl-stream", "object": "chat.completion.chunk", "created": int(time.time()), "model": "gpt-3.5-turbo", "choices": choices, "usage": usage}
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+def test_gateway_stream_chat_completion():
+    """串流呼叫邊收邊交給 on_text，結束後組回含 usage 的 ChatCompletion，並記錄 ttft"""
+    print("🔍 測試閘道的串流呼叫")
+    requests = []
+    text = json.dumps(STRATEGY, ensure_ascii=False)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        body = "".join(_chunk(piece) for piece in _pieces(text, 40))
+        body += _chunk(finish_reason="stop")
+        body += _chunk(usage={"prompt_tokens": 800, "completion_tokens": 300, "total_tokens": 1100})
+        body += "data: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode(), headers={"content-type": "text/event-stream"})
+
+    gateway = LLMGateway(cache=LLMResponseCache(db_path="", node_ttls={"generate_strategy_section": 60}))
+    gateway._client = openai.OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    gateway._client_key = os.getenv("OPENAI_API_KEY")
+
+    received = []
+    cached_text = []
+    messages = [{"role": "user", "content": "台積電投資策略"}]
+    # 快取命中會寫入 TokenTracker，span 也不寫入 trace_spans.jsonl
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original = (tracker_module.token_tracker, tracing.TRACE_FILE)
+        tracker_module.token_tracker = TokenTracker(os.path.join(tmpdir, "token_usage.json"))
+        tracing.TRACE_FILE = ""
+        try:
+            with trace_request("test") as trace:
+                response = gateway.stream_chat_completion("generate_strategy_section", messages, model="gpt-3.5-turbo", on_text=received.append, temperature=0)
+                cached = gateway.stream_chat_completion("generate_strategy_section", messages, model="gpt-3.5-turbo", on_text=cached_text.append, temperature=0)
+        finally:
+            tracker_module.token_tracker, tracing.TRACE_FILE = original
+
+    print(f"   收到 {len(received)} 段文字，usage: {response.usage.total_tokens}")
+    assert requests[0]["stream"] is True and requests[0]["stream_options"] == {"include_usage": True}
+    assert "".join(received) == text and len(received) > 1
+    assert response.choices[0].message.content == text and response.choices[0].finish_reason == "stop"
+    assert response.usage.total_tokens == 1100
+    # 完整的回應照常寫入快取，命中時以完整內容呼叫一次 on_text
+    assert len(requests) == 1 and getattr(cached, "cache_hit", False) and cached_text == [text]
+    spans = [s for s in trace.spans if s.name == "openai.chat"]
+    assert spans[0].attributes["stream"] is True and spans[0].attributes["ttft_ms"] >= 0
+    assert gateway.get_stats()["stream_calls"] == 2
+
+def test_strategy_section_streams_card_deltas():
+    """投資策略建議邊產生邊送出卡片增量，完成後回傳原本的 section 格式"""
+    print("🔍 測試投資策略建議的卡片增量")
+    text = json.dumps(STRATEGY, ensure_ascii=False)
+
+    def fake_stream_chat_completion(node, messages, model, on_text, **kwargs):
+        for piece in _pieces(text):
+            on_text(piece)
+        return SimpleNamespace(model=model, usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+    deltas = []
+    original = strategy_module.stream_chat_completion
+    strategy_module.stream_chat_completion = fake_stream_chat_completion
+    try:
+        outcome = build_strategy(
+            "台積電", "2330", "新聞摘要", None, [{"title": "台積電新聞", "link": "https://example.com/1"}],
+            section_delta=lambda name, card_index, card: deltas.append((name, card_index, card))
+        )
+    finally:
+        strategy_module.stream_chat_completion = original
+
+    print(f"   卡片增量: {len(deltas)} 次")
+    assert deltas and all(name == "投資策略建議" for name, _, _ in deltas)
+    indices = [card_index for _, card_index, _ in deltas]
+    assert indices == sorted(indices) and set(indices) == {0, 1, 2, 3}
+    # 第一張卡片的文字是逐步出現的
+    first_texts = [card["content"][0]["text"] for _, card_index, card in deltas if card_index == 0 and card.get("content")]
+    assert len(first_texts) > 1 and STRATEGY["cards"][0]["content"][0]["text"].startswith(first_texts[0])
+
+    section = outcome["section"]
+    assert [card["title"] for card in section["cards"]] == ["日內交易", "短線交易", "中線投資", "長線投資"]
+    assert section["summary_table"] and section["sources"]
+    assert section["cards"][0]["content"][0]["sources"][0]["title"] == "台積電新聞"
+
+def test_delta_stream_throttles_and_skips_unchanged():
+    """累積足夠字元才解析，內容沒有變化的卡片不重複送出"""
+    sent = []
+    stream = SectionDeltaStream(lambda text: [{"text": text[:10]}], lambda index, card: sent.append(card), min_chars=5)
+    for piece in "abcdefghijklmnopqrstuvwxyz":
+        stream.feed(piece)
+    assert [card["text"] for card in sent] == ["abcde", "abcdefghij"]
+
+def test_summary_markdown_deltas():
+    """完整報告摘要（markdown）只解析到最後一個換行，每個面向是一張卡片"""
+    partial = "1. 📈 股價變動分析\n外資連續買超\n\n2. 📊 財務數據摘要\n營收成長\n3. 🌐 產業"
+    cards = parse_partial_summary(partial)
+    assert [card["title"] for card in cards] == ["1. 📈 股價變動分析", "2. 📊 財務數據摘要"]
+    assert cards[1]["content"] == "營收成長"
+
+if __name__ == "__main__":
+    test_parse_partial_json()
+    test_gateway_stream_chat_completion()
+    test_strategy_section_streams_card_deltas()
+    test_delta_stream_throttles_and_skips_unchanged()
+    test_summary_markdown_deltas()
+    print("✅ 所有 section 串流測試通過")
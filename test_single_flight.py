@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+測試進行中分析的合併：相同 key 共用事件流、後加入者重播、全部離開時取消
+"""
+
+import asyncio
+from utils import tracing
+from utils.deadline import Deadline, bind_deadline, current_deadline
+from utils.single_flight import SingleFlight
+from utils.tracing import current_trace, trace_request
+
+def _counting_producer(calls: list, count: int = 3, delay: float = 0.05):
+    async def produce():
+        calls.append(1)
+        for i in range(count):
+            await asyncio.sleep(delay)
+            yield f"event-{i}"
+    return produce
+
+def test_identical_requests_share_one_producer():
+    """同時發出的相同請求只執行一次 producer，且都收到完整事件"""
+    print("🔍 測試相同請求合併")
+    calls = []
+    flights = SingleFlight()
+
+    async def consume():
+        return [event async for event in flights.subscribe("2330", _counting_producer(calls))]
+
+    async def main():
+        return await asyncio.gather(consume(), consume(), consume())
+
+    results = asyncio.run(main())
+    print(f"   producer 執行次數: {len(calls)}，統計: {flights.stats}")
+    assert len(calls) == 1
+    assert all(events == ["event-0", "event-1", "event-2"] for events in results)
+    assert flights.stats == {"leaders": 1, "joiners": 2}
+    assert not flights.is_in_flight("2330")
+
+def test_late_joiner_receives_replay():
+    """中途加入的訂閱者會先收到已送出的事件"""
+    print("🔍 測試後加入者重播")
+    calls = []
+    flights = SingleFlight()
+
+    async def main():
+        leader = asyncio.ensure_future(
+            _collect(flights.subscribe("2330", _counting_producer(calls, count=4)))
+        )
+        await asyncio.sleep(0.12)
+        assert flights.is_in_flight("2330")
+        late = await _collect(flights.subscribe("2330", _counting_producer(calls)))
+        return await leader, late
+
+    leader_events, late_events = asyncio.run(main())
+    assert len(calls) == 1
+    assert late_events == leader_events == ["event-0", "event-1", "event-2", "event-3"]
+
+def test_producer_cancelled_when_all_subscribers_leave():
+    """所有訂閱者都離開後，producer 應被取消"""
+    print("🔍 測試全部離開時取消")
+    closed = []
+    flights = SingleFlight()
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "tick"
+        finally:
+            closed.append(True)
+
+    async def main():
+        async for event in flights.subscribe("2330", endless):
+            break
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert closed == [True]
+    assert not flights.is_in_flight("2330")
+
+def test_producer_runs_outside_leader_context():
+    """producer 有自己的 trace，發起者斷線後仍以最晚的訂閱者截止時間繼續執行"""
+    print("🔍 測試 producer 的 context")
+    seen = []
+    flights = SingleFlight(trace_name="analysis")
+
+    async def produce():
+        for i in range(4):
+            await asyncio.sleep(0.05)
+            seen.append((current_trace(), current_deadline()))
+            yield f"event-{i}"
+
+    async def subscriber(budget: float, leave_after: int = None):
+        bind_deadline(Deadline(budget))
+        with trace_request("ask_sse") as trace:
+            events = []
+            async for event in flights.subscribe("2330", produce):
+                events.append(event)
+                if len(events) == leave_after:
+                    break
+        return trace, current_deadline(), events
+
+    async def main():
+        leader = asyncio.ensure_future(subscriber(5, leave_after=1))
+        await asyncio.sleep(0.01)
+        joiner = asyncio.ensure_future(subscriber(60))
+        return await leader, await joiner
+
+    original = tracing.TRACE_FILE
+    tracing.TRACE_FILE = ""
+    try:
+        (leader_trace, leader_deadline, leader_events), (joiner_trace, joiner_deadline, joiner_events) = asyncio.run(main())
+    finally:
+        tracing.TRACE_FILE = original
+
+    traces = {id(trace) for trace, _ in seen}
+    deadlines = {id(deadline) for _, deadline in seen}
+    producer_trace, producer_deadline = seen[-1]
+    print(f"   producer trace: {producer_trace.root.name}，剩餘 {producer_deadline.remaining():.1f} 秒")
+    assert leader_events == ["event-0"] and joiner_events == ["event-0", "event-1", "event-2", "event-3"]
+    assert len(traces) == 1 and producer_trace not in (leader_trace, joiner_trace)
+    assert producer_trace.root.name == "analysis" and producer_trace.root.end is not None
+    assert len(deadlines) == 1 and producer_deadline not in (leader_deadline, joiner_deadline)
+    assert abs(producer_deadline.expires_at - joiner_deadline.expires_at) < 0.01
+    assert leader_trace.root.attributes["single_flight.role"] == "leader"
+    assert joiner_trace.root.attributes["single_flight.role"] == "joiner"
+    assert joiner_trace.root.attributes["single_flight.trace_id"] == producer_trace.trace_id
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+if __name__ == "__main__":
+    test_identical_requests_share_one_producer()
+    test_late_joiner_receives_replay()
+    test_producer_cancelled_when_all_subscribers_leave()
+    test_producer_runs_outside_leader_context()
+    print("✅ 所有合併請求測試通過")
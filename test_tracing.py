@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+測試請求追蹤：巢狀 span、跨執行緒傳遞、時間軸與 trace 檔案輸出
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from langgraph_app.nodes.section_executor import run_sections
+from utils import tracing
+from utils.concurrency import run_blocking
+from utils.tracing import span, trace_request
+
+def test_span_without_trace_is_noop():
+    """沒有 trace 時 span() 不做任何事"""
+    print("🔍 測試未綁定 trace")
+    with span("orphan") as current:
+        assert current is None
+
+def test_nested_spans_across_threads():
+    """執行緒中的 span 會掛在提交當下的 span 底下"""
+    print("🔍 測試跨執行緒的巢狀 span")
+
+    def slow_section():
+        with span("openai.chat", node="fake"):
+            time.sleep(0.05)
+        return {"section": {}}
+
+    specs = [
+        {"name": "A", "inputs": [], "build": slow_section},
+        {"name": "B", "inputs": [], "build": slow_section},
+    ]
+
+    async def main():
+        with trace_request("ask_sse", question="台積電") as trace:
+            with span("report"):
+                await run_blocking(run_sections, specs, {})
+            return trace
+
+    original = tracing.TRACE_FILE
+    tracing.TRACE_FILE = ""
+    try:
+        trace = asyncio.run(main())
+    finally:
+        tracing.TRACE_FILE = original
+
+    by_name = {}
+    for s in trace.spans:
+        by_name.setdefault(s.name, []).append(s)
+    report = by_name["report"][0]
+    assert all(s.parent is report for s in by_name["section.A"] + by_name["section.B"])
+    assert by_name["openai.chat"][0].parent.name.startswith("section.")
+
+    timeline = trace.timeline()
+    print(f"   時間軸: {[(t['name'], t['depth']) for t in timeline]}")
+    assert timeline[0]["name"] == "ask_sse" and timeline[0]["depth"] == 0
+    assert {t["name"] for t in timeline if t["depth"] == 3} == {"openai.chat"}
+    assert all(t["ms"] >= 50 for t in timeline if t["name"] == "openai.chat")
+
+def test_spans_written_in_otel_format():
+    """請求結束時，span 以 JSON Lines 寫入 trace 檔案"""
+    print("🔍 測試 trace 檔案輸出")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "trace_spans.jsonl")
+        original = tracing.TRACE_FILE
+        tracing.TRACE_FILE = path
+        tracing._trace_logger = None
+        try:
+            with trace_request("ask_sse"):
+                try:
+                    with span("serper.search", query="台積電"):
+                        raise RuntimeError("timeout")
+                except RuntimeError:
+                    pass
+            logger = tracing._get_trace_logger()
+            for handler in logger.handlers:
+                handler.flush()
+            with open(path, encoding="utf-8") as f:
+                spans = [json.loads(line) for line in f]
+        finally:
+            for handler in list(tracing._trace_logger.handlers):
+                handler.close()
+                tracing._trace_logger.removeHandler(handler)
+            tracing._trace_logger = None
+            tracing.TRACE_FILE = original
+
+    root, search = spans
+    assert search["parentSpanId"] == root["spanId"] and search["traceId"] == root["traceId"]
+    assert search["attributes"] == {"query": "台積電"}
+    assert search["status"] == {"code": "ERROR", "message": "timeout"}
+    assert search["endTimeUnixNano"] >= search["startTimeUnixNano"]
+
+if __name__ == "__main__":
+    test_span_without_trace_is_noop()
+    test_nested_spans_across_threads()
+    test_spans_written_in_otel_format()
+    print("✅ 所有追蹤測試通過")
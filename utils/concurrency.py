@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Tuple
+
+# 專門給阻塞型節點（舊的同步 OpenAI / requests 呼叫）使用的執行緒池，
+# 避免佔用 Starlette 預設的 threadpool（上限約 40）而卡住其他請求
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "256"))
+
+# stream_blocking 用來標記函式已執行完畢
+_DONE = object()
+
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_POOL_SIZE,
+    thread_name_prefix="blocking-node"
+)
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    在共用執行緒池中執行同步函式，並以 await 等待結果
+
+    Args:
+        func: 要執行的同步函式
+        *args: 位置參數
+        **kwargs: 關鍵字參數
+
+    Returns:
+        函式的回傳值
+    """
+    loop = asyncio.get_running_loop()
+    # 複製目前的 context，讓 contextvars 在執行緒中也能讀到
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+def submit_with_context(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Future:
+    """
+    以目前 context 的複本提交工作到指定的執行緒池
+
+    ThreadPoolExecutor.submit 不會帶上 contextvars（例如請求的 deadline），
+    巢狀的執行緒池需透過此函式提交
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, func, *args, **kwargs)
+
+def shutdown_blocking_pool():
+    """關閉共用執行緒池（應用程式關閉時呼叫）"""
+    _blocking_executor.shutdown(wait=False)
+
+async def stream_blocking(func: Callable, *args, callback_name: str = "on_event", **kwargs) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    在共用執行緒池中執行同步函式，並把它透過回呼送出的事件即時轉交給 event loop
+
+    func 會收到名為 callback_name 的回呼參數，每次呼叫回呼都會 yield ("event", payload)；
+    函式結束後最後 yield ("result", 回傳值)。函式拋出的例外會原樣拋出。
+
+    Args:
+        func: 要執行的同步函式
+        *args: 位置參數
+        callback_name: 傳給 func 的回呼參數名稱
+        **kwargs: 關鍵字參數
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def callback(payload: Any):
+        loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+    kwargs[callback_name] = callback
+    task = asyncio.ensure_future(run_blocking(func, *args, **kwargs))
+    task.add_done_callback(lambda _: queue.put_nowait(_DONE))
+
+    try:
+        while True:
+            payload = await queue.get()
+            if payload is _DONE:
+                break
+            yield "event", payload
+        # 回呼排入的事件一定早於完成訊號，這裡只需補上回傳值
+        yield "result", task.result()
+    finally:
+        if not task.done():
+            task.cancel()
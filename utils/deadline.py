@@ -0,0 +1,110 @@
+"""
+請求層級的截止時間
+
+在端點建立 Deadline 並以 bind_deadline() 綁定到目前的 context，
+之後 run_blocking / run_sections 會把 context 複製到執行緒中，
+各階段即可透過 budget_timeout() 依剩餘時間決定自己的逾時秒數，
+並以 has_budget() 判斷是否還有時間執行可略過的階段。
+沒有綁定 Deadline 時（例如直接呼叫節點函式），一律使用原本的預設值。
+"""
+
+import contextvars
+import os
+import threading
+import time
+from typing import List, Optional
+
+# 單一分析請求的總時間預算（秒）
+REQUEST_TIME_BUDGET = float(os.getenv("REQUEST_TIME_BUDGET", "90"))
+# 單次外部呼叫至少保留的逾時秒數，避免剩餘時間極短時立即失敗
+MIN_CALL_TIMEOUT = float(os.getenv("MIN_CALL_TIMEOUT", "2"))
+
+# 各外部呼叫的預設逾時秒數（剩餘時間充足時使用）
+LLM_TIMEOUT = 30.0
+FINLAB_TIMEOUT = 30.0
+
+class Deadline:
+    """一個請求的截止時間，並記錄因時間不足而略過的階段"""
+
+    def __init__(self, budget: float = None):
+        self.budget = REQUEST_TIME_BUDGET if budget is None else budget
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.budget
+        self.skipped: List[str] = []
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        """已經過的秒數"""
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        """剩餘秒數（不會小於 0）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """是否已超過截止時間"""
+        return self.remaining() <= 0
+
+    def timeout(self, default: float, minimum: float = None) -> float:
+        """
+        依剩餘時間計算單次呼叫的逾時秒數
+
+        Args:
+            default: 時間充足時使用的逾時秒數
+            minimum: 最少保留的秒數，預設為 MIN_CALL_TIMEOUT
+
+        Returns:
+            min(default, 剩餘秒數)，但不小於 minimum（minimum 大於 default 時以 default 為準）
+        """
+        minimum = MIN_CALL_TIMEOUT if minimum is None else minimum
+        return max(min(minimum, default), min(default, self.remaining()))
+
+    def extend(self, expires_at: float) -> None:
+        """把截止時間延後到 expires_at（只會延後，不會提前）"""
+        with self._lock:
+            self.expires_at = max(self.expires_at, expires_at)
+
+    def allows(self, seconds: float) -> bool:
+        """剩餘時間是否還夠執行預估需要 seconds 秒的階段"""
+        return self.remaining() >= seconds
+
+    def skip(self, stage: str) -> None:
+        """記錄因時間不足而略過的階段"""
+        with self._lock:
+            self.skipped.append(stage)
+        print(f"⏱️ 剩餘 {self.remaining():.1f} 秒，略過: {stage}")
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("current_deadline", default=None)
+
+def bind_deadline(deadline: Optional[Deadline]) -> contextvars.Token:
+    """把 deadline 綁定到目前的 context，回傳可用於 reset 的 token"""
+    return _current_deadline.set(deadline)
+
+def current_deadline() -> Optional[Deadline]:
+    """取得目前 context 的 deadline，沒有則回傳 None"""
+    return _current_deadline.get()
+
+def budget_timeout(default: float, minimum: float = None) -> float:
+    """依目前 deadline 的剩餘時間計算逾時秒數；沒有 deadline 時回傳 default"""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    return deadline.timeout(default, minimum)
+
+def has_budget(seconds: float, stage: str = None) -> bool:
+    """
+    檢查是否還有時間執行可略過的階段
+
+    Args:
+        seconds: 該階段預估需要的秒數
+        stage: 階段名稱；時間不足時會記錄到 deadline.skipped
+
+    Returns:
+        沒有 deadline 或剩餘時間足夠時回傳 True
+    """
+    deadline = current_deadline()
+    if deadline is None or deadline.allows(seconds):
+        return True
+    if stage:
+        deadline.skip(stage)
+    return False
@@ -0,0 +1,184 @@
+"""
+應用程式共用的 HTTP 連線池
+
+Serper、CMoney、同學會論壇等外部呼叫原本每次都以 requests / 新的 httpx.AsyncClient
+發送，每次都要重新做 DNS、TCP 與 TLS 握手。這裡提供整個應用程式共用的
+httpx.Client（給執行緒池中的同步節點）與 httpx.AsyncClient（給 async 端點），
+保持 keep-alive 連線，伺服器支援時使用 HTTP/2。
+
+HTTP_HOST_LIMITS 中列出的主機各自擁有獨立的連線池與連線上限，
+其他主機共用預設連線池。
+共用的 client 由所有使用者的請求共用，因此不保存任何 cookie（避免把某位使用者
+登入取得的 Set-Cookie 帶到下一位使用者的請求）；需要 cookie 的請求請自行在 headers 帶入。
+"""
+
+import os
+import threading
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# 未指定 timeout 的請求使用的預設逾時秒數
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+# 各主機的連線上限，例如 "google.serper.dev=32,www.cmoney.tw=8"
+HTTP_HOST_LIMITS = os.getenv("HTTP_HOST_LIMITS", "google.serper.dev=32,www.cmoney.tw=16")
+
+def parse_host_limits(value: str) -> Dict[str, int]:
+    """
+    解析 "主機=連線數,主機=連線數" 格式的設定
+
+    Returns:
+        主機對應連線上限的字典，格式錯誤的項目會被忽略
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        host, count = item.split("=", 1)
+        try:
+            limits[host.strip().lower()] = int(count.strip())
+        except ValueError:
+            print(f"[HttpClientPool WARNING] 無法解析的連線上限設定: {item}")
+    return limits
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("[HttpClientPool WARNING] 未安裝 h2 套件，改用 HTTP/1.1（pip install 'httpx[http2]'）")
+        return False
+
+class _RejectAllCookies(DefaultCookiePolicy):
+    """不接受也不送出任何 cookie"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+def _cookieless_jar() -> CookieJar:
+    return CookieJar(policy=_RejectAllCookies())
+
+class HttpClientPool:
+    """
+    依主機分配的共用 httpx 連線池
+
+    同步與非同步 client 都在第一次使用時建立；async client 綁定在建立它的
+    event loop 上，因此應在應用程式 startup 之後才使用。
+    """
+
+    def __init__(self, host_limits: Dict[str, int] = None):
+        self.host_limits = parse_host_limits(HTTP_HOST_LIMITS) if host_limits is None else host_limits
+        self.http2 = _http2_available()
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    def _pool_key(self, url: str) -> str:
+        host = (urlsplit(url).hostname or "").lower()
+        return host if host in self.host_limits else ""
+
+    def _client_options(self, pool_key: str) -> Dict:
+        max_connections = self.host_limits.get(pool_key, HTTP_MAX_CONNECTIONS)
+        return {
+            "http2": self.http2,
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=min(HTTP_MAX_KEEPALIVE, max_connections),
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            "timeout": HTTP_DEFAULT_TIMEOUT,
+            # 與 requests 的行為一致，自動跟隨轉址
+            "follow_redirects": True,
+            # client 跨使用者共用，不保存回應的 Set-Cookie
+            "cookies": _cookieless_jar()
+        }
+
+    def sync_client(self, url: str) -> httpx.Client:
+        """取得 url 所屬主機的同步 client"""
+        pool_key = self._pool_key(url)
+        client = self._sync_clients.get(pool_key)
+        if client is None:
+            with self._lock:
+                client = self._sync_clients.get(pool_key)
+                if client is None:
+                    client = httpx.Client(**self._client_options(pool_key))
+                    self._sync_clients[pool_key] = client
+        return client
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        """取得 url 所屬主機的非同步 client"""
+        pool_key = self._pool_key(url)
+        client = self._async_clients.get(pool_key)
+        if client is None:
+            client = httpx.AsyncClient(**self._client_options(pool_key))
+            self._async_clients[pool_key] = client
+        return client
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """以共用的同步 client 發送請求"""
+        return self.sync_client(url).request(method, url, **kwargs)
+
+    async def arequest(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """以共用的非同步 client 發送請求"""
+        return await self.async_client(url).request(method, url, **kwargs)
+
+    def get_stats(self) -> Dict:
+        """目前建立的連線池"""
+        return {
+            "http2": self.http2,
+            "sync_pools": sorted(key or "default" for key in self._sync_clients),
+            "async_pools": sorted(key or "default" for key in self._async_clients),
+            "host_limits": self.host_limits
+        }
+
+    async def aclose(self) -> None:
+        """關閉所有連線池（應用程式關閉時呼叫）"""
+        async_clients = list(self._async_clients.values())
+        self._async_clients.clear()
+        for client in async_clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"[HttpClientPool ERROR] 關閉 async client 失敗: {e}")
+        with self._lock:
+            sync_clients = list(self._sync_clients.values())
+            self._sync_clients.clear()
+        for client in sync_clients:
+            try:
+                client.close()
+            except Exception as e:
+                print(f"[HttpClientPool ERROR] 關閉 client 失敗: {e}")
+
+http_pool = HttpClientPool()
+
+def http_get(url: str, **kwargs) -> httpx.Response:
+    """共用連線池的 GET（同步）"""
+    return http_pool.request("GET", url, **kwargs)
+
+def http_post(url: str, **kwargs) -> httpx.Response:
+    """共用連線池的 POST（同步）"""
+    return http_pool.request("POST", url, **kwargs)
+
+async def async_http_post(url: str, **kwargs) -> httpx.Response:
+    """共用連線池的 POST（非同步）"""
+    return await http_pool.arequest("POST", url, **kwargs)
+
+async def startup_http_pool() -> None:
+    """應用程式啟動時呼叫，預先建立預設連線池"""
+    http_pool.async_client("")
+    print(f"🌐 共用 HTTP 連線池已啟動 (HTTP/2: {http_pool.http2})")
+
+async def shutdown_http_pool() -> None:
+    """應用程式關閉時呼叫，關閉所有連線"""
+    await http_pool.aclose()
@@ -0,0 +1,203 @@
+"""
+LLM 回應快取
+
+classify_and_extract（temperature 0）與 generate_search_keywords / extract_keywords_from_results
+（temperature 0.3）在熱門股票上一再收到相同的 prompt，每次仍送到 OpenAI。
+低 temperature 的回應幾乎固定，這裡以 (model, 正規化後的 messages, temperature, max_tokens)
+為 key 快取完整的 ChatCompletion：
+- 只有設定了有效秒數的節點才快取（LLM_CACHE_TTLS），各節點的有效秒數不同
+- temperature 高於 LLM_CACHE_MAX_TEMPERATURE 的呼叫不快取
+- 記憶體 LRU（LLM_CACHE_SIZE）；設定 LLM_CACHE_DB 時以 SQLite 讓多個 worker 共用
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+# temperature 不高於此值的呼叫才快取
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+# 各節點的有效秒數，未列出的節點不快取
+LLM_CACHE_TTLS = os.getenv(
+    "LLM_CACHE_TTLS",
+    "classify_and_extract=86400,generate_search_keywords=21600,extract_keywords_from_results=3600"
+)
+# SQLite 檔案路徑，留空則只使用記憶體快取
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.sqlite3")
+
+def parse_node_ttls(value: str) -> Dict[str, int]:
+    """
+    解析 "節點=秒數,節點=秒數" 格式的設定
+
+    Returns:
+        節點對應有效秒數的字典，格式錯誤的項目會被忽略
+    """
+    ttls = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        node, seconds = item.split("=", 1)
+        try:
+            ttls[node.strip()] = int(seconds.strip())
+        except ValueError:
+            print(f"[LLMResponseCache WARNING] 無法解析的快取有效秒數設定: {item}")
+    return ttls
+
+def make_llm_key(model: str, messages: List[Dict], temperature: Optional[float], max_tokens: Optional[int], **options) -> str:
+    """
+    以 (model, messages, temperature, max_tokens) 產生快取 key
+
+    訊息內容的連續空白視為一個空格，prompt 範本的縮排或換行差異不會產生不同的 key；
+    其他會影響回應的參數（例如 response_format）也一併納入。
+    """
+    normalized = [
+        [message.get("role", ""), " ".join(str(message.get("content") or "").split())]
+        for message in messages
+    ]
+    raw = json.dumps([model, normalized, temperature, max_tokens, options], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    LLM 回應快取：記憶體 LRU + SQLite
+
+    值為 ChatCompletion.model_dump() 的結果；有效秒數在查詢時依節點決定。
+    """
+
+    def __init__(self, max_entries: int = None, db_path: str = None, node_ttls: Dict[str, int] = None, max_temperature: float = None):
+        self.max_entries = max_entries or LLM_CACHE_SIZE
+        self.db_path = LLM_CACHE_DB if db_path is None else db_path
+        self.node_ttls = parse_node_ttls(LLM_CACHE_TTLS) if node_ttls is None else dict(node_ttls)
+        self.max_temperature = LLM_CACHE_MAX_TEMPERATURE if max_temperature is None else max_temperature
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_ready = False
+        self._puts = 0
+        self.stats = {"hits": 0, "db_hits": 0, "misses": 0, "saved_tokens": 0}
+
+    def ttl_for(self, node: str, temperature: Optional[float]) -> int:
+        """
+        節點與 temperature 對應的有效秒數，0 表示這次呼叫不快取
+
+        未指定 temperature 時 OpenAI 預設為 1，不快取。
+        """
+        if temperature is None or temperature > self.max_temperature:
+            return 0
+        return max(0, self.node_ttls.get(node, 0))
+
+    def get(self, key: str, ttl: int) -> Optional[Dict]:
+        """取得有效期內的快取回應，未命中時回傳 None"""
+        value, stored_at = self._get(key)
+        if value is not None and time.time() - stored_at <= ttl:
+            usage = value.get("usage") or {}
+            with self._lock:
+                self.stats["hits"] += 1
+                self.stats["saved_tokens"] += usage.get("total_tokens") or 0
+            return value
+        self._count("misses")
+        return None
+
+    def put(self, key: str, value: Dict, stored_at: float = None) -> None:
+        """寫入快取（記憶體與 SQLite）"""
+        stored_at = stored_at or time.time()
+        with self._lock:
+            self._remember(key, stored_at, value)
+            self._puts += 1
+            purge = self._puts % 100 == 0
+        self._write_db(key, stored_at, value, purge)
+
+    def get_stats(self) -> Dict:
+        """取得命中率、省下的 token 數等統計資料"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """清除記憶體快取"""
+        with self._lock:
+            self._entries.clear()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _get(self, key: str) -> Tuple[Optional[Dict], float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                stored_at, value = entry
+                return value, stored_at
+
+        row = self._read_db(key)
+        if row is None:
+            return None, 0
+        stored_at, value = row
+        with self._lock:
+            self._remember(key, stored_at, value)
+            self.stats["db_hits"] += 1
+        return value, stored_at
+
+    def _remember(self, key: str, stored_at: float, value: Dict) -> None:
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        if not self._db_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def _read_db(self, key: str) -> Optional[Tuple[float, Dict]]:
+        try:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT stored_at, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return None
+            return row[0], json.loads(row[1])
+        except Exception as e:
+            print(f"[LLMResponseCache ERROR] 讀取 SQLite 快取失敗: {e}")
+            return None
+
+    def _write_db(self, key: str, stored_at: float, value: Dict, purge: bool) -> None:
+        try:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, stored_at, value) VALUES (?, ?, ?)",
+                    (key, stored_at, json.dumps(value, ensure_ascii=False))
+                )
+                if purge:
+                    # 超過最長有效秒數的項目已不可能命中
+                    max_ttl = max(self.node_ttls.values(), default=0)
+                    conn.execute("DELETE FROM llm_cache WHERE stored_at < ?", (time.time() - max_ttl,))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[LLMResponseCache ERROR] 寫入 SQLite 快取失敗: {e}")
@@ -0,0 +1,341 @@
+"""
+OpenAI 呼叫閘道
+
+各節點原本每次呼叫都建立新的 openai.OpenAI(...)，等於每次都建立新的 HTTP 連線池、
+重新做 TLS 握手。這裡保存整個程序共用、長期存活的 OpenAI（給執行緒池中的同步節點）
+與 AsyncOpenAI（給 async 端點）client，連線上限與 keep-alive 可由環境變數調整。
+
+chat_completion() / achat_completion() 是節點呼叫 LLM 的唯一入口：
+統一記錄 openai.chat span，並依請求剩餘時間決定逾時秒數。
+stream_chat_completion() 以 stream=True 呼叫，每收到一段文字就交給 on_text，
+結束後組回與 chat_completion() 相同的 ChatCompletion，節點後續處理不必改變。
+低 temperature 的呼叫先查 LLM 回應快取（utils/llm_cache.py），命中時不呼叫 OpenAI，
+並在 TokenTracker 記錄一筆零成本的命中；未命中的實際呼叫也在同一處記錄，標記為可快取，
+命中率以兩者計算。
+送出前先在本機估計輸入 token 數（utils/prompt_budget.py），超過節點預算時警告；
+估計值附在回應的 estimated_prompt_tokens。
+每次實際呼叫的 token 用量由閘道以 track_openai_call() 記錄（節點名稱、送出前的估計值與實際用量在同一筆），
+節點不必自己記錄；呼叫時可傳入 user_input / stock_id 一併記錄。
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+
+from utils.deadline import budget_timeout, LLM_TIMEOUT
+from utils.llm_cache import LLMResponseCache, make_llm_key
+from utils.prompt_budget import count_message_tokens, node_budget
+from utils.concurrency import run_blocking
+from utils.token_tracker import track_cache_hit, track_openai_call
+from utils.tracing import span
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# SDK 對 429 / 5xx / 連線錯誤的自動重試次數
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=min(OPENAI_MAX_KEEPALIVE, OPENAI_MAX_CONNECTIONS),
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+
+class LLMGateway:
+    """
+    共用的 OpenAI client
+
+    同步 client 在第一次使用時建立（此時 .env 已載入）；API key 改變時重新建立。
+    async client 綁定在建立它的 event loop 上，不同 event loop（例如測試中的 asyncio.run）
+    各自擁有一個 client。
+    """
+
+    def __init__(self, cache: LLMResponseCache = None):
+        self.cache = cache if cache is not None else LLMResponseCache()
+        self._client: Optional[openai.OpenAI] = None
+        self._client_key: Optional[str] = None
+        self._async_clients: Dict[asyncio.AbstractEventLoop, openai.AsyncOpenAI] = {}
+        self._lock = threading.Lock()
+        self.stats = {"sync_clients": 0, "async_clients": 0, "calls": 0, "async_calls": 0, "stream_calls": 0, "over_budget": 0}
+
+    def client(self, api_key: str = None) -> openai.OpenAI:
+        """取得共用的同步 client"""
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        client = self._client
+        if client is not None and self._client_key == api_key:
+            return client
+        with self._lock:
+            if self._client is None or self._client_key != api_key:
+                # 舊的 client 可能仍被其他執行緒使用，不主動關閉
+                self._client = openai.OpenAI(
+                    api_key=api_key,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=httpx.Client(limits=_limits(), timeout=LLM_TIMEOUT)
+                )
+                self._client_key = api_key
+                self.stats["sync_clients"] += 1
+            return self._client
+
+    def async_client(self, api_key: str = None) -> openai.AsyncOpenAI:
+        """取得目前 event loop 的共用 async client"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # 已關閉的 event loop 留下的 client 無法再使用，順便移除
+            for stale in [stale for stale in self._async_clients if stale.is_closed()]:
+                self._async_clients.pop(stale, None)
+            client = openai.AsyncOpenAI(
+                api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=LLM_TIMEOUT)
+            )
+            self._async_clients[loop] = client
+            self._count("async_clients")
+        return client
+
+    def chat_completion(self, node: str, messages: List[Dict], model: str, timeout: float = LLM_TIMEOUT,
+                        user_input: str = "", stock_id: str = "", **kwargs):
+        """
+        以共用 client 呼叫 chat completions（同步）
+
+        Args:
+            node: 節點名稱（記錄在 span 與 token 用量）
+            messages: 對話訊息
+            model: 模型名稱
+            timeout: 剩餘時間充足時的逾時秒數
+            user_input: 記錄在 token 用量的使用者問題
+            stock_id: 記錄在 token 用量的股票代號
+            **kwargs: 其他 chat.completions.create 參數（temperature、max_tokens…）
+
+        Returns:
+            OpenAI 的 ChatCompletion 回應；快取命中時 cache_hit 屬性為 True
+        """
+        self._count("calls")
+        with span("openai.chat", node=node) as current:
+            key, ttl, cached = self._lookup(node, model, messages, kwargs, current)
+            if cached is not None:
+                self._track(node, cached, user_input, stock_id, cacheable=True)
+                return cached
+            estimated = self._estimate(node, model, messages, current)
+            response = self.client().chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=budget_timeout(timeout),
+                **kwargs
+            )
+            self._store(key, ttl, response)
+            response.estimated_prompt_tokens = estimated
+            self._track(node, response, user_input, stock_id, cacheable=key is not None)
+            return response
+
+    def stream_chat_completion(
+        self,
+        node: str,
+        messages: List[Dict],
+        model: str,
+        on_text: Callable[[str], None],
+        timeout: float = LLM_TIMEOUT,
+        user_input: str = "",
+        stock_id: str = "",
+        **kwargs
+    ) -> ChatCompletion:
+        """
+        以串流方式呼叫 chat completions（同步），邊收邊把文字交給 on_text
+
+        Args:
+            node: 節點名稱（記錄在 span 與 token 用量）
+            messages: 對話訊息
+            model: 模型名稱
+            on_text: 每收到一段文字就呼叫一次；快取命中時以完整內容呼叫一次
+            timeout: 剩餘時間充足時的逾時秒數
+            user_input: 記錄在 token 用量的使用者問題
+            stock_id: 記錄在 token 用量的股票代號
+            **kwargs: 其他 chat.completions.create 參數（temperature、max_tokens…）
+
+        Returns:
+            組合後的 ChatCompletion（含 usage）
+        """
+        self._count("stream_calls")
+        with span("openai.chat", node=node, stream=True) as current:
+            key, ttl, cached = self._lookup(node, model, messages, kwargs, current)
+            if cached is not None:
+                self._track(node, cached, user_input, stock_id, cacheable=True)
+                content = cached.choices[0].message.content
+                if content:
+                    on_text(content)
+                return cached
+            estimated = self._estimate(node, model, messages, current)
+            started = time.perf_counter()
+            parts = []
+            finish_reason = None
+            usage = None
+            response_id, created = "", int(time.time())
+            with self.client().chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=budget_timeout(timeout),
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            ) as stream:
+                for chunk in stream:
+                    response_id, created = chunk.id or response_id, chunk.created or created
+                    if chunk.usage is not None:
+                        usage = chunk.usage.model_dump(mode="json")
+                    for choice in chunk.choices:
+                        if choice.index != 0:
+                            continue
+                        if choice.finish_reason:
+                            finish_reason = choice.finish_reason
+                        text = choice.delta.content if choice.delta else None
+                        if not text:
+                            continue
+                        if not parts and current is not None:
+                            # 第一段文字到達的時間（time to first token）
+                            current.set_attribute("ttft_ms", round((time.perf_counter() - started) * 1000, 1))
+                        parts.append(text)
+                        on_text(text)
+            response = ChatCompletion.model_validate({
+                "id": response_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                # 串流中途結束、沒有收到 finish_reason 時視為被截斷（不快取）
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": finish_reason or "length"}],
+                "usage": usage,
+            })
+            self._store(key, ttl, response)
+            response.estimated_prompt_tokens = estimated
+            self._track(node, response, user_input, stock_id, cacheable=key is not None)
+            return response
+
+    async def achat_completion(self, node: str, messages: List[Dict], model: str, timeout: float = LLM_TIMEOUT,
+                               user_input: str = "", stock_id: str = "", **kwargs):
+        """chat_completion 的 async 版本，在 event loop 中 await，不佔用執行緒池"""
+        self._count("async_calls")
+        with span("openai.chat", node=node) as current:
+            key, ttl, cached = self._lookup(node, model, messages, kwargs, current)
+            if cached is not None:
+                await run_blocking(self._track, node, cached, user_input, stock_id, True)
+                return cached
+            estimated = self._estimate(node, model, messages, current)
+            response = await self.async_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=budget_timeout(timeout),
+                **kwargs
+            )
+            self._store(key, ttl, response)
+            response.estimated_prompt_tokens = estimated
+            # 寫入 token 記錄檔是檔案 I/O，交給執行緒池
+            await run_blocking(self._track, node, response, user_input, stock_id, key is not None)
+            return response
+
+    def get_stats(self) -> Dict:
+        """建立的 client 數、呼叫次數與回應快取統計"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["cache"] = self.cache.get_stats()
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _estimate(self, node: str, model: str, messages: List[Dict], current) -> int:
+        """送出前估計輸入 token 數，超過節點預算時警告並計數"""
+        try:
+            estimated = count_message_tokens(messages, model)
+        except Exception as e:
+            print(f"[LLMGateway ERROR] 估計 token 數失敗: {e}")
+            return 0
+        budget = node_budget(node)
+        if current is not None:
+            current.set_attribute("estimated_prompt_tokens", estimated)
+        if budget and estimated > budget:
+            self._count("over_budget")
+            print(f"[LLMGateway WARNING] {node} 的 prompt 估計 {estimated} tokens，超過預算 {budget}")
+        return estimated
+
+    def _track(self, node: str, response, user_input: str, stock_id: str, cacheable: bool = False) -> None:
+        """
+        記錄一次呼叫，並標記回應，讓節點再呼叫 track_openai_call 時不重複記錄
+
+        快取命中記錄為零成本；實際呼叫記錄 token 用量與送出前的估計值，
+        查過回應快取（cacheable）的實際呼叫即為未命中。
+        """
+        if getattr(response, "cache_hit", False):
+            track_cache_hit(node, response, user_input=user_input, stock_id=stock_id)
+        elif response.usage is None:
+            print(f"⚠️ 無法追蹤 token 使用量: {node} - 回應沒有 usage")
+        else:
+            track_openai_call(node, response, user_input=user_input, stock_id=stock_id, cacheable=cacheable)
+        response.usage_tracked = True
+
+    def _lookup(self, node: str, model: str, messages: List[Dict], kwargs: Dict, current) -> Tuple[Optional[str], int, Optional[ChatCompletion]]:
+        """查詢回應快取，回傳 (key, 有效秒數, 快取的回應)；不快取的呼叫 key 為 None"""
+        ttl = self.cache.ttl_for(node, kwargs.get("temperature"))
+        if not ttl:
+            return None, 0, None
+        options = {name: value for name, value in kwargs.items() if name not in ("temperature", "max_tokens")}
+        key = make_llm_key(model, messages, kwargs.get("temperature"), kwargs.get("max_tokens"), **options)
+        value = self.cache.get(key, ttl)
+        if current is not None:
+            current.set_attribute("cache", "miss" if value is None else "hit")
+        if value is None:
+            return key, ttl, None
+        response = ChatCompletion.model_validate(value)
+        response.cache_hit = True
+        return key, ttl, response
+
+    def _store(self, key: Optional[str], ttl: int, response) -> None:
+        """只快取正常結束的回應（被 max_tokens 截斷的不快取）"""
+        if key is None:
+            return
+        try:
+            if all(choice.finish_reason == "stop" for choice in response.choices):
+                self.cache.put(key, response.model_dump(mode="json"))
+        except Exception as e:
+            print(f"[LLMGateway ERROR] 寫入回應快取失敗: {e}")
+
+    async def aclose(self) -> None:
+        """關閉所有 client（應用程式關閉時呼叫）"""
+        async_clients = list(self._async_clients.values())
+        self._async_clients.clear()
+        for client in async_clients:
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"[LLMGateway ERROR] 關閉 async client 失敗: {e}")
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                print(f"[LLMGateway ERROR] 關閉 client 失敗: {e}")
+
+llm_gateway = LLMGateway()
+
+def chat_completion(node: str, messages: List[Dict], model: str, timeout: float = LLM_TIMEOUT, **kwargs):
+    """以共用 client 呼叫 chat completions（同步），並記錄 token 用量"""
+    return llm_gateway.chat_completion(node, messages, model, timeout, **kwargs)
+
+def stream_chat_completion(node: str, messages: List[Dict], model: str, on_text: Callable[[str], None], timeout: float = LLM_TIMEOUT, **kwargs):
+    """以共用 client 串流呼叫 chat completions（同步），回傳組合後的 ChatCompletion 並記錄 token 用量"""
+    return llm_gateway.stream_chat_completion(node, messages, model, on_text, timeout, **kwargs)
+
+async def achat_completion(node: str, messages: List[Dict], model: str, timeout: float = LLM_TIMEOUT, **kwargs):
+    """以共用 async client 呼叫 chat completions，並記錄 token 用量"""
+    return await llm_gateway.achat_completion(node, messages, model, timeout, **kwargs)
+
+async def shutdown_llm_gateway() -> None:
+    """應用程式關閉時呼叫，關閉所有連線"""
+    await llm_gateway.aclose()
@@ -0,0 +1,126 @@
+"""
+新聞時間解析
+
+Serper 的 date 欄位、標題與摘要中的日期寫法很多：「3 小時前」「2 days ago」
+「Oct 10, 2024」「2024年1月1日」「113/01/01」（民國年）「今天」「9/30」…
+這裡把所有格式的正規表示式預先編譯，每筆結果只解析一次，
+結果以時間戳記快取在 result["published_at"]（無法解析時為 None），
+排序與近期新聞篩選都使用同一個值。
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 快取在搜尋結果上的欄位
+PUBLISHED_AT_KEY = "published_at"
+
+_RELATIVE_UNITS = {
+    "秒": timedelta(seconds=1), "second": timedelta(seconds=1),
+    "分鐘": timedelta(minutes=1), "分": timedelta(minutes=1), "minute": timedelta(minutes=1), "min": timedelta(minutes=1),
+    "小時": timedelta(hours=1), "hour": timedelta(hours=1), "hr": timedelta(hours=1),
+    "天": timedelta(days=1), "日": timedelta(days=1), "day": timedelta(days=1),
+    "週": timedelta(weeks=1), "周": timedelta(weeks=1), "星期": timedelta(weeks=1), "week": timedelta(weeks=1),
+    "個月": timedelta(days=30), "month": timedelta(days=30),
+    "年": timedelta(days=365), "year": timedelta(days=365),
+}
+_RELATIVE_WORDS = {
+    "剛剛": 0, "just now": 0,
+    "今天": 0, "today": 0,
+    "昨天": 1, "yesterday": 1,
+    "前天": 2,
+    "明天": -1,
+}
+_MONTHS = {name: i for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)}
+
+def _date(year: int, month: int, day: int) -> Optional[datetime]:
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+def _relative(match, now: datetime) -> Optional[datetime]:
+    return now - int(match.group(1)) * _RELATIVE_UNITS[match.group(2)]
+
+def _relative_word(match, now: datetime) -> Optional[datetime]:
+    return now - timedelta(days=_RELATIVE_WORDS[match.group(1)])
+
+def _absolute(match, now: datetime) -> Optional[datetime]:
+    return _date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+def _roc(match, now: datetime) -> Optional[datetime]:
+    return _date(int(match.group(1)) + 1911, int(match.group(2)), int(match.group(3)))
+
+def _english(match, now: datetime) -> Optional[datetime]:
+    return _date(int(match.group(3)), _MONTHS[match.group(1)[:3]], int(match.group(2)))
+
+def _month_day(match, now: datetime) -> Optional[datetime]:
+    # 沒有年份時取今年；若落在未來則視為去年
+    published = _date(now.year, int(match.group(1)), int(match.group(2)))
+    if published is not None and published > now + timedelta(days=1):
+        published = _date(now.year - 1, int(match.group(1)), int(match.group(2)))
+    return published
+
+# 依優先順序排列：越明確的格式越前面
+_PATTERNS: List[Tuple[re.Pattern, Callable]] = [
+    (re.compile(r"(?<![月\d])(\d+)\s*(秒|分鐘|分|小時|天|日|週|周|星期|個月|年|second|minute|min|hour|hr|day|week|month|year)s?\s*(?:前|ago)"), _relative),
+    (re.compile(r"(?<!\d)(\d{4})\s*[年/.-]\s*(\d{1,2})\s*[月/.-]\s*(\d{1,2})"), _absolute),
+    (re.compile(r"(?<!\d)(1\d{2})\s*[年/.-]\s*(\d{1,2})\s*[月/.-]\s*(\d{1,2})"), _roc),
+    (re.compile(r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+(\d{1,2}),?\s+(\d{4})"), _english),
+    (re.compile(r"(剛剛|just now|今天|today|昨天|yesterday|前天|明天)"), _relative_word),
+    (re.compile(r"(?<![\d/])(\d{1,2})\s*(?:/|月)\s*(\d{1,2})(?:日|(?![\d/]))"), _month_day),
+]
+
+def parse_date_text(text: str, now: datetime = None) -> Optional[datetime]:
+    """
+    從一段文字解析出日期時間
+
+    Args:
+        text: Serper date 欄位、標題或摘要
+        now: 相對時間的基準，預設為現在
+
+    Returns:
+        datetime，找不到日期時回傳 None
+    """
+    if not text:
+        return None
+    now = now or datetime.now()
+    text = text.lower()
+    for pattern, build in _PATTERNS:
+        match = pattern.search(text)
+        if match:
+            published = build(match, now)
+            if published is not None:
+                return published
+    return None
+
+def result_timestamp(result: Dict, now: datetime = None) -> Optional[float]:
+    """
+    搜尋結果的發布時間戳記，依序參考 date / publishedDate 欄位、摘要開頭與標題
+
+    第一次解析後快取在 result["published_at"]
+    """
+    if PUBLISHED_AT_KEY in result:
+        return result[PUBLISHED_AT_KEY]
+    published = None
+    for text in (result.get("date"), result.get("publishedDate"), (result.get("snippet") or "")[:40], result.get("title")):
+        published = parse_date_text(text, now)
+        if published is not None:
+            break
+    timestamp = published.timestamp() if published is not None else None
+    result[PUBLISHED_AT_KEY] = timestamp
+    return timestamp
+
+def result_age_days(result: Dict, now: datetime = None) -> Optional[float]:
+    """搜尋結果距今的天數，沒有時間資訊時回傳 None"""
+    timestamp = result_timestamp(result, now)
+    if timestamp is None:
+        return None
+    now = now or datetime.now()
+    return max(0.0, (now.timestamp() - timestamp) / 86400)
+
+def is_recent(result: Dict, days: float, now: datetime = None) -> bool:
+    """是否為 days 天內的新聞（沒有時間資訊時為 False）"""
+    age = result_age_days(result, now)
+    return age is not None and age <= days
@@ -0,0 +1,195 @@
+"""
+新聞搜尋結果去重
+
+原本只以 link 字串完全相同來去重，追蹤參數（utm_*、fbclid…）、AMP / 行動版網址，
+以及同一則通訊社新聞被鉅亨網、經濟日報、ETtoday 同時轉載，都會被當成不同的新聞，
+塞進 LLM prompt。
+
+NewsDeduplicator 以串流方式逐筆處理：
+- 先以正規化後的網址比對
+- 再以標題 + 摘要的 SimHash 找出近似重複（64 位元分成 4 段建索引，
+  漢明距離 ≤ 3 的兩筆至少有一段完全相同，每筆只需比對少數候選，整體為線性時間）
+同一群組只保留來源最好的一筆（依 source_priority 的順序，同來源時保留較早出現的）。
+"""
+
+import functools
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# 會被移除的追蹤參數
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "from", "fr", "share", "ocid", "_ga"}
+# 行動版 / AMP 主機前綴
+MOBILE_HOST_PREFIXES = ("www.", "m.", "amp.", "mobile.")
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+# 漢明距離在此以內視為同一則新聞
+NEAR_DUPLICATE_DISTANCE = 3
+# 特徵數（字元 bigram）太少的文字不做近似比對，避免短標題誤判
+MIN_FEATURES = 8
+
+_NON_WORD = re.compile(r"[\W_]+")
+# 標題結尾的網站名稱，例如「... - 鉅亨網」「...｜經濟日報」
+_TITLE_SITE_SUFFIX = re.compile(r"\s*[-|–—]\s*[^-|–—]{1,20}$")
+
+def canonicalize_url(url: str) -> str:
+    """
+    網址正規化：忽略 http/https、www / 行動版 / AMP 主機與路徑、追蹤參數、片段與結尾斜線
+
+    Returns:
+        正規化後的網址（只用於比較），無法解析時回傳原字串
+    """
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in MOBILE_HOST_PREFIXES:
+            if host.startswith(prefix) and host.count(".") > 1:
+                host = host[len(prefix):]
+                stripped = True
+
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if segments and segments[0].lower() == "amp":
+        segments = segments[1:]
+    if segments and segments[-1].lower() == "amp":
+        segments = segments[:-1]
+    path = "/" + "/".join(segments)
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_")
+        and key.lower() not in TRACKING_PARAMS
+        and key.lower() != "amp"
+        and not (key.lower() == "outputtype" and value.lower() == "amp")
+    ]
+    canonical = host + path
+    if query:
+        canonical += "?" + urlencode(sorted(query))
+    return canonical
+
+def _bigrams(text: str) -> List[str]:
+    text = _NON_WORD.sub("", unicodedata.normalize("NFKC", text or "").lower())
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+@functools.lru_cache(maxsize=65536)
+def _gram_hash(gram: str) -> int:
+    return int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(weighted_texts: Iterable[Tuple[str, int]]) -> Optional[int]:
+    """
+    以字元 bigram 計算 64 位元 SimHash
+
+    Args:
+        weighted_texts: [(文字, 權重)]
+
+    Returns:
+        SimHash 值；特徵數少於 MIN_FEATURES 時回傳 None
+    """
+    vector = [0] * SIMHASH_BITS
+    features = 0
+    for text, weight in weighted_texts:
+        for gram in _bigrams(text):
+            features += 1
+            value = _gram_hash(gram)
+            for bit in range(SIMHASH_BITS):
+                vector[bit] += weight if value >> bit & 1 else -weight
+    if features < MIN_FEATURES:
+        return None
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if vector[bit] > 0)
+
+def result_simhash(result: Dict) -> Optional[int]:
+    """標題（去除結尾網站名稱，權重 2）+ 摘要的 SimHash"""
+    title = _TITLE_SITE_SUFFIX.sub("", unicodedata.normalize("NFKC", result.get("title", "") or ""))
+    return simhash([(title, 2), (result.get("snippet", "") or "", 1)])
+
+def _bands(value: int) -> List[Tuple[int, int]]:
+    width = SIMHASH_BITS // SIMHASH_BANDS
+    mask = (1 << width) - 1
+    return [(band, value >> (band * width) & mask) for band in range(SIMHASH_BANDS)]
+
+class NewsDeduplicator:
+    """
+    串流式的新聞去重器
+
+    add() 逐筆加入結果，order 用來決定群組在輸出中的位置（取群組中最小的 order）；
+    results() 依 order 回傳每個群組的代表結果。
+    """
+
+    def __init__(self, source_priority: Iterable[str] = (), max_distance: int = NEAR_DUPLICATE_DISTANCE):
+        self.source_priority = [site.lower() for site in source_priority]
+        self.max_distance = max_distance
+        self._clusters: List[Dict] = []
+        self._by_url: Dict[str, int] = {}
+        self._by_band: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        self.stats = {"url_duplicates": 0, "near_duplicates": 0}
+
+    def source_rank(self, link: str) -> int:
+        """來源排序，越小越好；不在 source_priority 中的來源排在最後"""
+        host = (urlsplit(link or "").hostname or "").lower()
+        for rank, site in enumerate(self.source_priority):
+            if host == site or host.endswith("." + site):
+                return rank
+        return len(self.source_priority)
+
+    def add(self, result: Dict, order=0) -> bool:
+        """
+        加入一筆結果
+
+        Returns:
+            是否為新的群組（不是重複的新聞）
+        """
+        url = canonicalize_url(result.get("link", ""))
+        cluster_id = self._by_url.get(url) if url else None
+        if cluster_id is not None:
+            self.stats["url_duplicates"] += 1
+            self._merge(cluster_id, result, order)
+            return False
+
+        value = result_simhash(result)
+        if value is not None:
+            cluster_id = self._find_near(value)
+        is_new = cluster_id is None
+        if is_new:
+            cluster_id = len(self._clusters)
+            self._clusters.append({"order": order, "key": (self.source_rank(result.get("link", "")), order), "result": result})
+        else:
+            self.stats["near_duplicates"] += 1
+            self._merge(cluster_id, result, order)
+
+        if url:
+            self._by_url[url] = cluster_id
+        if value is not None:
+            for band in _bands(value):
+                self._by_band.setdefault(band, []).append((value, cluster_id))
+        return is_new
+
+    def _find_near(self, value: int) -> Optional[int]:
+        for band in _bands(value):
+            for other, cluster_id in self._by_band.get(band, []):
+                if bin(value ^ other).count("1") <= self.max_distance:
+                    return cluster_id
+        return None
+
+    def _merge(self, cluster_id: int, result: Dict, order) -> None:
+        cluster = self._clusters[cluster_id]
+        cluster["order"] = min(cluster["order"], order)
+        key = (self.source_rank(result.get("link", "")), order)
+        if key < cluster["key"]:
+            cluster["key"] = key
+            cluster["result"] = result
+
+    def results(self) -> List[Dict]:
+        """依 order 排序的各群組代表結果"""
+        return [cluster["result"] for cluster in sorted(self._clusters, key=lambda c: c["order"])]
+
+    def __len__(self) -> int:
+        return len(self._clusters)
@@ -0,0 +1,268 @@
+"""
+個股新聞索引
+
+每次分析都重新透過 Serper 找一次同一檔股票的同一批新聞。這裡把每次搜尋後
+去重的新聞存進 SQLite：正規化網址為主鍵，記錄發布時間、來源網站，並以股票別名
+字典標記新聞提到的股票（stock_id → 新聞的反向索引）。
+
+同一檔股票在時間窗內已有足夠的新聞、且上次同步不久時，搜尋規劃器直接以索引中的
+新聞作為基礎，Serper 只查詢上次同步之後的新聞（tbs=qdr:h / qdr:d / qdr:w）。
+
+與 search_cache 相同，每次操作開新的連線並使用 WAL 模式，多個 worker 可共用同一個檔案。
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.news_dates import result_timestamp
+from utils.news_dedup import canonicalize_url
+from utils.news_sites import classify_site
+
+# SQLite 檔案路徑，留空則停用索引
+NEWS_INDEX_DB = os.getenv("NEWS_INDEX_DB", "news_index.sqlite3")
+# 時間窗（天）內至少有這麼多則新聞時才以索引作答
+NEWS_INDEX_MIN_ARTICLES = int(os.getenv("NEWS_INDEX_MIN_ARTICLES", "20"))
+NEWS_INDEX_WINDOW_DAYS = int(os.getenv("NEWS_INDEX_WINDOW_DAYS", "14"))
+# 以索引作答時最多帶入的新聞數
+NEWS_INDEX_MAX_ARTICLES = int(os.getenv("NEWS_INDEX_MAX_ARTICLES", "60"))
+# 超過這段時間的新聞會在寫入時清除（天）
+NEWS_INDEX_RETENTION_DAYS = int(os.getenv("NEWS_INDEX_RETENTION_DAYS", "90"))
+
+# Serper tbs 參數能表示的增量時間窗：(秒數, tbs, 說明)
+DELTA_WINDOWS: List[Tuple[int, str, str]] = [
+    (3600, "qdr:h", "1 小時"),
+    (86400, "qdr:d", "1 天"),
+    (7 * 86400, "qdr:w", "1 週"),
+]
+
+_STOCK_CODE = re.compile(r"(?<!\d)\d{4}(?!\d)")
+
+class StockTagger:
+    """
+    以股票別名字典找出文字中提到的股票
+
+    別名依前兩個字元建索引，掃描文字時每個位置只比對同樣開頭的少數別名（長的優先），
+    不必對每則新聞逐一檢查數千個別名。
+    """
+
+    def __init__(self, stock_aliases: Dict[str, List[str]]):
+        self.stock_ids = set(stock_aliases)
+        self._by_prefix: Dict[str, List[Tuple[str, str]]] = {}
+        for stock_id, aliases in stock_aliases.items():
+            for alias in aliases:
+                # 數字代號另外以前後非數字的規則比對；單一字元的別名太容易誤判
+                if len(alias) >= 2 and not alias.isdigit():
+                    self._by_prefix.setdefault(alias[:2], []).append((alias, stock_id))
+        for candidates in self._by_prefix.values():
+            candidates.sort(key=lambda item: -len(item[0]))
+
+    def tag(self, text: str) -> List[str]:
+        """文字中提到的股票代號（依出現順序、不重複）"""
+        text = text or ""
+        found = {}
+        for match in _STOCK_CODE.finditer(text):
+            if match.group(0) in self.stock_ids:
+                found.setdefault(match.group(0), match.start())
+        for i in range(len(text) - 1):
+            for alias, stock_id in self._by_prefix.get(text[i:i + 2], ()):
+                if text.startswith(alias, i):
+                    found.setdefault(stock_id, i)
+                    break
+        return sorted(found, key=found.get)
+
+def delta_window(elapsed_seconds: float) -> Optional[Tuple[str, str]]:
+    """
+    涵蓋上次同步之後的最小 Serper 時間窗
+
+    Returns:
+        (tbs, 說明)，超過最大時間窗時回傳 None（需要完整搜尋）
+    """
+    for seconds, tbs, label in DELTA_WINDOWS:
+        if elapsed_seconds <= seconds:
+            return tbs, label
+    return None
+
+class NewsIndex:
+    """
+    個股新聞索引：articles（正規化網址為主鍵）、article_stocks（股票 → 新聞）、
+    stock_sync（每檔股票上次完整同步的時間）
+    """
+
+    def __init__(self, db_path: str = None, tagger: StockTagger = None):
+        self.db_path = NEWS_INDEX_DB if db_path is None else db_path
+        self._tagger = tagger
+        self._lock = threading.Lock()
+        self._db_ready = False
+        self._writes = 0
+        self.stats = {"lookups": 0, "index_answers": 0, "articles_written": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.db_path)
+
+    @property
+    def tagger(self) -> StockTagger:
+        # 別名字典很大，第一次用到時才建立
+        if self._tagger is None:
+            from langgraph_app.nodes.detect_stock import stock_dict
+            self._tagger = StockTagger(stock_dict)
+        return self._tagger
+
+    def fresh_articles(self, stock_id: str, now: float = None) -> Tuple[List[Dict], Optional[Tuple[str, str]]]:
+        """
+        取得可以直接使用的索引新聞
+
+        Args:
+            stock_id: 股票代號
+            now: 目前時間戳記，預設為現在
+
+        Returns:
+            (時間窗內的新聞（由新到舊）, 增量搜尋的 (tbs, 說明))；
+            新聞不足或上次同步太久時回傳 ([], None)，應進行完整搜尋
+        """
+        if not self.enabled or not stock_id:
+            return [], None
+        now = now or time.time()
+        self._count("lookups")
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT synced_at FROM stock_sync WHERE stock_id = ?", (stock_id,)).fetchone()
+                if row is None:
+                    return [], None
+                window = delta_window(now - row[0])
+                if window is None:
+                    return [], None
+                rows = conn.execute(
+                    "SELECT a.link, a.title, a.snippet, a.date, a.site, a.published_at FROM articles a "
+                    "JOIN article_stocks s ON s.url_key = a.url_key "
+                    "WHERE s.stock_id = ? AND a.published_at >= ? "
+                    "ORDER BY a.published_at DESC LIMIT ?",
+                    (stock_id, now - NEWS_INDEX_WINDOW_DAYS * 86400, NEWS_INDEX_MAX_ARTICLES)
+                ).fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[NewsIndex ERROR] 讀取新聞索引失敗: {e}")
+            return [], None
+
+        if len(rows) < NEWS_INDEX_MIN_ARTICLES:
+            return [], None
+        self._count("index_answers")
+        articles = [
+            {"title": title, "link": link, "snippet": snippet, "date": date, "site": site,
+             "published_at": published_at, "search_keyword": "新聞索引"}
+            for link, title, snippet, date, site, published_at in rows
+        ]
+        return articles, window
+
+    def record(self, results: Iterable[Dict], synced_stock_id: str = None, synced_at: float = None) -> int:
+        """
+        寫入去重後的新聞，並標記提到的股票
+
+        Args:
+            results: 搜尋結果
+            synced_stock_id: 這批結果是該股票的一次成功搜尋時傳入，更新其同步時間
+            synced_at: 同步時間（應為搜尋開始的時間），預設為現在
+
+        Returns:
+            寫入的新聞數
+        """
+        if not self.enabled:
+            return 0
+        now = time.time()
+        rows, tags = [], []
+        for result in results:
+            link = result.get("link", "")
+            url_key = canonicalize_url(link)
+            if not url_key:
+                continue
+            title = result.get("title", "") or ""
+            snippet = result.get("snippet", "") or ""
+            site = classify_site(link)
+            rows.append((
+                url_key, link, title, snippet, result.get("date", "") or "",
+                site.domain if site else "", result_timestamp(result), now
+            ))
+            tags.extend((url_key, stock_id) for stock_id in self.tagger.tag(title + " " + snippet))
+        if not rows and not synced_stock_id:
+            return 0
+
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % 50 == 0
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany(
+                    "INSERT INTO articles (url_key, link, title, snippet, date, site, published_at, indexed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(url_key) DO UPDATE SET "
+                    "title = excluded.title, snippet = excluded.snippet, "
+                    "published_at = COALESCE(articles.published_at, excluded.published_at)",
+                    rows
+                )
+                conn.executemany("INSERT OR IGNORE INTO article_stocks (url_key, stock_id) VALUES (?, ?)", tags)
+                if synced_stock_id:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO stock_sync (stock_id, synced_at) VALUES (?, ?)",
+                        (synced_stock_id, synced_at or now)
+                    )
+                if purge:
+                    self._purge(conn, now)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[NewsIndex ERROR] 寫入新聞索引失敗: {e}")
+            return 0
+        with self._lock:
+            self.stats["articles_written"] += len(rows)
+        return len(rows)
+
+    def get_stats(self) -> Dict:
+        """索引命中次數與新聞數"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["articles"] = 0
+        if self.enabled:
+            try:
+                conn = self._connect()
+                try:
+                    stats["articles"] = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"[NewsIndex ERROR] 讀取新聞索引統計失敗: {e}")
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _purge(self, conn: sqlite3.Connection, now: float) -> None:
+        cutoff = now - NEWS_INDEX_RETENTION_DAYS * 86400
+        conn.execute("DELETE FROM articles WHERE COALESCE(published_at, indexed_at) < ?", (cutoff,))
+        conn.execute("DELETE FROM article_stocks WHERE url_key NOT IN (SELECT url_key FROM articles)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        if not self._db_ready:
+            # WAL 模式讓多個 worker 可以同時讀取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                "url_key TEXT PRIMARY KEY, link TEXT NOT NULL, title TEXT, snippet TEXT, date TEXT, "
+                "site TEXT, published_at REAL, indexed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS article_stocks ("
+                "url_key TEXT NOT NULL, stock_id TEXT NOT NULL, PRIMARY KEY (stock_id, url_key))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS stock_sync (stock_id TEXT PRIMARY KEY, synced_at REAL NOT NULL)")
+            conn.commit()
+            self._db_ready = True
+        return conn
@@ -0,0 +1,91 @@
+"""
+新聞來源白名單
+
+允許的新聞網站只在這裡定義一次。每個網站記錄顯示名稱、可信度權重、語言與是否有付費牆，
+搜尋過濾、來源顯示與排序都從這裡取得。
+
+classify() 只解析一次主機名稱，由最長的後綴開始查雜湊索引，
+每筆結果的成本只與主機名稱的段數有關，與白名單長度無關。
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+class SiteRecord(NamedTuple):
+    """白名單中的一個新聞網站"""
+    domain: str
+    name: str
+    # 可信度權重（0~1），排序與去重時選擇代表來源使用
+    weight: float
+    language: str = "zh-TW"
+    paywall: bool = False
+
+# 白名單，順序即 Serper domains 參數的順序
+NEWS_SITES: List[SiteRecord] = [
+    SiteRecord("tw.finance.yahoo.com", "Yahoo奇摩股市", 0.8),
+    SiteRecord("cnyes.com", "鉅亨網", 0.9),
+    SiteRecord("moneydj.com", "MoneyDJ 理財網", 0.85),
+    SiteRecord("cmoney.tw", "CMoney", 0.75),
+    SiteRecord("money.udn.com", "經濟日報", 0.9),
+    SiteRecord("ctee.com.tw", "工商時報", 0.9),
+    SiteRecord("finance.ettoday.net", "ETtoday 財經", 0.75),
+    SiteRecord("goodinfo.tw", "Goodinfo", 0.8),
+    SiteRecord("macromicro.me", "財經M平方", 0.85, paywall=True),
+    SiteRecord("smart.businessweekly.com.tw", "Smart智富", 0.8, paywall=True),
+    SiteRecord("technews.tw", "科技新報", 0.8),
+    SiteRecord("nownews.com", "Nownews", 0.6),
+    SiteRecord("moneylink.com.tw", "MoneyLink 富聯網", 0.65),
+    SiteRecord("stockfeel.com.tw", "股感 StockFeel", 0.7),
+    SiteRecord("businessweekly.com.tw", "商業周刊", 0.85, paywall=True),
+    SiteRecord("businesstoday.com.tw", "今周刊", 0.8, paywall=True),
+    SiteRecord("pchome.com.tw", "PChome 股市頻道", 0.6),
+]
+
+def _hostname(url_or_host: str) -> str:
+    value = (url_or_host or "").strip()
+    if "//" not in value:
+        value = "//" + value
+    try:
+        return (urlsplit(value).hostname or "").lower()
+    except ValueError:
+        return ""
+
+class SiteRegistry:
+    """以網域後綴建立索引的白名單"""
+
+    def __init__(self, sites: List[SiteRecord]):
+        self.sites = list(sites)
+        self._by_domain: Dict[str, SiteRecord] = {site.domain: site for site in self.sites}
+
+    @property
+    def domains(self) -> List[str]:
+        """所有網域（依白名單順序）"""
+        return [site.domain for site in self.sites]
+
+    def priority(self) -> List[str]:
+        """依可信度由高到低排序的網域"""
+        return [site.domain for site in sorted(self.sites, key=lambda site: -site.weight)]
+
+    def classify(self, url_or_host: str) -> Optional[SiteRecord]:
+        """
+        判斷網址屬於白名單中的哪個網站
+
+        Args:
+            url_or_host: 網址或主機名稱
+
+        Returns:
+            SiteRecord，不在白名單中時回傳 None
+        """
+        labels = _hostname(url_or_host).split(".")
+        # 由最長的後綴開始，例如 smart.businessweekly.com.tw 優先於 businessweekly.com.tw
+        for i in range(len(labels) - 1):
+            site = self._by_domain.get(".".join(labels[i:]))
+            if site is not None:
+                return site
+        return None
+
+site_registry = SiteRegistry(NEWS_SITES)
+
+def classify_site(url_or_host: str) -> Optional[SiteRecord]:
+    """以預設白名單判斷網址所屬的網站"""
+    return site_registry.classify(url_or_host)
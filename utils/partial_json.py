@@ -0,0 +1,89 @@
+"""
+解析串流中尚未完成的 JSON
+
+LLM 以 stream=True 回傳時，內容是一段一段到達的 JSON 文字。
+parse_partial_json() 把目前收到的文字補成合法 JSON：
+- 正在輸出的字串值直接補上結尾引號（讓卡片文字逐字出現）
+- 其他未完成的部分（key、數字、true/false）退回到上一個完整的位置
+- 補上尚未關閉的 } 與 ]
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+def _strip_fence(text: str) -> str:
+    """去掉 ```json 開頭（模型偶爾會加上 markdown code block）"""
+    stripped = text.lstrip()
+    if stripped.startswith("```"):
+        newline = stripped.find("\n")
+        return stripped[newline + 1:] if newline != -1 else ""
+    return text
+
+def _closers(stack: List[str]) -> str:
+    return "".join(reversed(stack))
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """
+    把串流到一半的 JSON 文字解析成目前已知的內容
+
+    Args:
+        text: 目前累積的回應文字
+
+    Returns:
+        解析出的 dict / list；還沒有任何可用內容時為 None
+    """
+    text = _strip_fence(text or "")
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        return None
+    start = min(starts)
+
+    stack: List[str] = []
+    in_string = escape = is_key = expect_key = False
+    # 上一個可以截斷的位置與當時尚未關閉的括號
+    safe: Optional[Tuple[int, List[str]]] = None
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if not is_key:
+                    safe = (index + 1, list(stack))
+            continue
+        if char == '"':
+            in_string = True
+            is_key = expect_key and bool(stack) and stack[-1] == "}"
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            expect_key = char == "{"
+            safe = (index + 1, list(stack))
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            safe = (index + 1, list(stack))
+            if not stack:
+                break
+        elif char == ",":
+            safe = (index, list(stack))
+            expect_key = bool(stack) and stack[-1] == "}"
+        elif char == ":":
+            expect_key = False
+
+    candidates = []
+    if in_string and not is_key:
+        body = text[start:]
+        if escape:
+            body = body[:-1]
+        candidates.append(body + '"' + _closers(stack))
+    if safe is not None:
+        candidates.append(text[start:safe[0]] + _closers(safe[1]))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
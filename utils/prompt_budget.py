@@ -0,0 +1,200 @@
+"""
+Prompt token 預算
+
+prompt 原本以字串串接組成，新聞、搜尋結果放多少就送多少。這裡在送出前先在本機計算 token 數：
+- count_tokens() / count_message_tokens()：有安裝 tiktoken 且能載入編碼時使用 tiktoken，
+  否則以字元估算（中日韓字元 1 token、其他字元每 4 個 1 token）
+- PromptBuilder：依節點的輸入預算（PROMPT_TOKEN_BUDGETS），把依重要性排序的內容區塊
+  依序放進 prompt，放不下的區塊截斷或捨棄
+LLM 閘道對每次呼叫記錄送出前的估計值，TokenTracker 將估計值與實際用量記錄在同一筆。
+"""
+
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.tracing import span
+
+# 各節點 prompt（所有訊息）的輸入 token 上限，未列出的節點不限制
+PROMPT_TOKEN_BUDGETS = os.getenv("PROMPT_TOKEN_BUDGETS", "summarize_results=6000,extract_keywords_from_results=1500")
+# 放不下的區塊剩餘空間不少於此 token 數時截斷放入，否則捨棄
+PROMPT_MIN_BLOCK_TOKENS = int(os.getenv("PROMPT_MIN_BLOCK_TOKENS", "40"))
+# prompt 模板中放內容區塊的位置
+PROMPT_BLOCKS = "{{ blocks }}"
+
+# 每則訊息與回覆開頭的固定 token 數（OpenAI chat 格式）
+_MESSAGE_OVERHEAD = 3
+_REPLY_OVERHEAD = 3
+_CJK = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+def parse_node_budgets(value: str) -> Dict[str, int]:
+    """解析 "node=tokens,node=tokens" 格式的預算設定"""
+    budgets = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        node, tokens = item.split("=", 1)
+        try:
+            budgets[node.strip()] = int(tokens.strip())
+        except ValueError:
+            print(f"[PromptBudget WARNING] 無法解析的 token 預算設定: {item}")
+    return budgets
+
+_node_budgets = parse_node_budgets(PROMPT_TOKEN_BUDGETS)
+
+def node_budget(node: str) -> int:
+    """節點的輸入 token 預算；0 表示不限制"""
+    return _node_budgets.get(node, 0)
+
+_encoders: Dict[str, object] = {}
+_encoders_lock = threading.Lock()
+
+def _encoder(model: str):
+    """取得模型的 tiktoken 編碼；未安裝或無法載入（例如離線下載編碼檔失敗）時為 None"""
+    model = model or ""
+    if model in _encoders:
+        return _encoders[model]
+    with _encoders_lock:
+        if model not in _encoders:
+            try:
+                import tiktoken
+                try:
+                    encoder = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoder = tiktoken.get_encoding("cl100k_base")
+            except ImportError:
+                print("[PromptBudget WARNING] 未安裝 tiktoken 套件，改以字元估算 token 數（pip install tiktoken）")
+                encoder = None
+            except Exception as e:
+                print(f"[PromptBudget WARNING] 無法載入 {model} 的 tiktoken 編碼，改以字元估算 token 數: {e}")
+                encoder = None
+            _encoders[model] = encoder
+        return _encoders[model]
+
+def _approx_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """計算一段文字的 token 數"""
+    if not text:
+        return 0
+    encoder = _encoder(model)
+    if encoder is None:
+        return _approx_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages: List[Dict], model: str = "gpt-3.5-turbo") -> int:
+    """計算 chat 訊息的輸入 token 數（含每則訊息的固定 token）"""
+    total = _REPLY_OVERHEAD
+    for message in messages or []:
+        content = message.get("content")
+        total += _MESSAGE_OVERHEAD + count_tokens(content if isinstance(content, str) else str(content or ""), model)
+    return total
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """把文字截斷到不超過 max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoder = _encoder(model)
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    # 以二分搜尋找出可放入的最長前綴
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _approx_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+def fit_blocks(blocks: List[str], max_tokens: int, model: str = "gpt-3.5-turbo", separator: str = "\n") -> Tuple[List[str], int]:
+    """
+    依序放入區塊直到用完 max_tokens
+
+    Args:
+        blocks: 依重要性排序的內容區塊
+        max_tokens: 可用的 token 數
+        model: 計算 token 的模型
+        separator: 區塊之間的分隔字串
+
+    Returns:
+        (放入的區塊, 被截斷的區塊數)；最後一個放不下的區塊在剩餘空間足夠時截斷放入
+    """
+    kept = []
+    truncated = 0
+    remaining = max_tokens
+    separator_tokens = count_tokens(separator, model)
+    for block in blocks:
+        cost = count_tokens(block, model) + (separator_tokens if kept else 0)
+        if cost <= remaining:
+            kept.append(block)
+            remaining -= cost
+            continue
+        room = remaining - (separator_tokens if kept else 0)
+        if room >= PROMPT_MIN_BLOCK_TOKENS:
+            kept.append(truncate_to_tokens(block, room, model))
+            truncated += 1
+        break
+    return kept, truncated
+
+class PromptBuilder:
+    """
+    依節點的輸入 token 預算組出 prompt
+
+    用法：模板中以 PROMPT_BLOCKS 標出放內容區塊的位置，內容區塊依重要性排序後交給 fill()。
+    """
+
+    def __init__(self, node: str, model: str, budget: Optional[int] = None):
+        """
+        Args:
+            node: 節點名稱（決定預算，並記錄在 span）
+            model: 模型名稱（決定 token 計算方式）
+            budget: 輸入 token 預算；未指定時使用 PROMPT_TOKEN_BUDGETS 的設定，0 表示不限制
+        """
+        self.node = node
+        self.model = model
+        self.budget = node_budget(node) if budget is None else budget
+        self.stats: Dict = {}
+
+    def fill(self, template: str, blocks: List[str], separator: str = "\n", other_messages: List[Dict] = None) -> str:
+        """
+        把區塊依序放進模板的 PROMPT_BLOCKS 位置，整個請求的 token 數不超過預算
+
+        Args:
+            template: 含 PROMPT_BLOCKS 的 prompt 模板
+            blocks: 依重要性排序的內容區塊
+            separator: 區塊之間的分隔字串
+            other_messages: 同一個請求中的其他訊息（例如 system），一併計入預算
+
+        Returns:
+            組好的 prompt
+        """
+        blocks = [block for block in blocks if block]
+        with span("prompt.build", node=self.node, blocks=len(blocks)) as current:
+            # 模板本身與其他訊息，加上這則訊息的固定 token
+            fixed = count_message_tokens((other_messages or []) + [{"content": template.replace(PROMPT_BLOCKS, "")}], self.model)
+            if self.budget:
+                kept, truncated = fit_blocks(blocks, self.budget - fixed, self.model, separator)
+            else:
+                kept, truncated = blocks, 0
+            prompt = template.replace(PROMPT_BLOCKS, separator.join(kept))
+            self.stats = {
+                "budget": self.budget,
+                "blocks": len(blocks),
+                "kept": len(kept),
+                "truncated": truncated,
+                "dropped": len(blocks) - len(kept),
+                "estimated_tokens": fixed + count_tokens(separator.join(kept), self.model),
+            }
+            if current is not None:
+                for key in ("kept", "truncated", "dropped", "estimated_tokens"):
+                    current.set_attribute(key, self.stats[key])
+        if self.stats["dropped"] or truncated:
+            print(f"[PromptBudget] {self.node}: 預算 {self.budget} tokens，放入 {len(kept)}/{len(blocks)} 個區塊（截斷 {truncated} 個），估計 {self.stats['estimated_tokens']} tokens")
+        return prompt
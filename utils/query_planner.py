@@ -0,0 +1,105 @@
+"""
+搜尋關鍵字規劃
+
+四輪搜尋產生的關鍵字常常只是寫法不同：「台積電 2025 財報」與
+「台積電 2025 財報 site:tw.finance.yahoo.com」、全形與半形、詞序不同，
+或是重複的備用關鍵字。每一個重複的關鍵字仍是一次付費的 Serper 呼叫。
+
+canonicalize_query() 把關鍵字正規化成比較用的形式；QueryPlanner 記錄同一個
+請求中已送出的關鍵字，丟棄正規化後重複的關鍵字並統計省下的查詢數。
+規劃器存在 contextvars 中，run_blocking 複製 context 時會一併帶到執行緒。
+規劃器也記錄這個請求的搜尋時間範圍（Serper tbs，例如只查最近一天的增量新聞）。
+"""
+
+import contextvars
+import re
+import threading
+import unicodedata
+from typing import Iterable, List, Optional, Tuple
+
+_SITE_PATTERN = re.compile(r"(?<!\S)site:(\S+)")
+
+_current_planner: contextvars.ContextVar = contextvars.ContextVar("current_query_planner", default=None)
+
+def _site_covered(host: str, covered_sites: Iterable[str]) -> bool:
+    host = host.split("://", 1)[-1].split("/", 1)[0]
+    return any(host == site or host.endswith("." + site) for site in covered_sites)
+
+def canonicalize_query(query: str, covered_sites: Iterable[str] = ()) -> str:
+    """
+    關鍵字正規化：全形轉半形、轉小寫、去除已由 domains 涵蓋的 site: 條件、詞彙排序去重
+
+    Args:
+        query: 搜尋關鍵字
+        covered_sites: 搜尋時已限制的網站（例如 ALLOWED_SITES）
+
+    Returns:
+        正規化後的關鍵字，只用於比較與快取 key
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    covered_sites = [site.lower() for site in covered_sites]
+    text = _SITE_PATTERN.sub(
+        lambda match: "" if _site_covered(match.group(1), covered_sites) else match.group(0),
+        text
+    )
+    return " ".join(sorted(set(text.split())))
+
+class QueryPlanner:
+    """
+    記錄一個請求中已送出的關鍵字，丟棄正規化後重複的關鍵字
+
+    time_range 為 Serper 的 tbs 參數（例如 "qdr:d"），None 表示不限時間
+    """
+
+    def __init__(self, time_range: Optional[str] = None):
+        self._issued = {}
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.time_range = time_range
+
+    @property
+    def issued(self) -> int:
+        return len(self._issued)
+
+    def plan(self, queries: Iterable[str], covered_sites: Iterable[str] = ()) -> List[Tuple[str, str]]:
+        """
+        挑出這個請求中還沒送出過的關鍵字
+
+        Returns:
+            [(原始關鍵字, 正規化關鍵字)]，依原始順序；重複的關鍵字計入 saved
+        """
+        covered_sites = list(covered_sites)
+        planned = []
+        with self._lock:
+            for query in queries:
+                canonical = canonicalize_query(query, covered_sites)
+                if not canonical:
+                    continue
+                if canonical in self._issued:
+                    self.saved += 1
+                    continue
+                self._issued[canonical] = query
+                planned.append((query, canonical))
+        return planned
+
+def bind_query_planner(planner: QueryPlanner = None) -> Tuple[QueryPlanner, contextvars.Token]:
+    """
+    綁定目前 context 的關鍵字規劃器（每個請求一個）
+
+    Returns:
+        (規劃器, 用來還原的 token)
+    """
+    planner = planner or QueryPlanner()
+    return planner, _current_planner.set(planner)
+
+def reset_query_planner(token: contextvars.Token) -> None:
+    """還原 bind_query_planner 之前的規劃器"""
+    # async generator 在別的 context 中被關閉時無法 reset，直接略過
+    try:
+        _current_planner.reset(token)
+    except ValueError:
+        pass
+
+def current_query_planner() -> Optional[QueryPlanner]:
+    """取得目前 context 的規劃器，沒有則回傳 None"""
+    return _current_planner.get()
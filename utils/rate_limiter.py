@@ -0,0 +1,226 @@
+"""
+外部 API 的 token bucket 限流器
+
+尖峰時每個分析請求同時送出十幾個 Serper 查詢，彼此沒有協調，超過供應商的速率限制後
+整組關鍵字的搜尋都會失敗。TokenBucket 讓同一個程序的所有呼叫共用一個 bucket：
+- 每秒補充 rate 個 token，最多累積 burst 個
+- 等待中的呼叫依優先順序排隊：互動（第一輪等使用者正在等的查詢）優先於推測性的額外輪次，
+  再優先於快取的背景更新；同優先順序依到達順序
+- 設定 db_path 時以 SQLite 保存 bucket 狀態，多個 uvicorn worker 共用同一個速率
+- 收到 429 時以 penalize() 暫停整個 bucket，所有等待中的呼叫一起退讓
+
+目前呼叫的優先順序存在 contextvars 中，run_blocking 複製 context 時會一併帶到執行緒。
+"""
+
+import contextvars
+import heapq
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SPECULATIVE = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_SPECULATIVE: "speculative",
+    PRIORITY_BACKGROUND: "background",
+}
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+class RateLimitTimeout(Exception):
+    """在逾時前沒有取得 token"""
+
+@contextmanager
+def request_priority(priority: int):
+    """在這個區塊內（包含 run_blocking 的執行緒）以指定的優先順序呼叫外部 API"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        try:
+            _current_priority.reset(token)
+        except ValueError:
+            pass
+
+def current_priority() -> int:
+    """目前 context 的優先順序，預設為互動"""
+    return _current_priority.get()
+
+class TokenBucket:
+    """
+    具優先順序佇列的 token bucket
+
+    acquire() 阻塞直到取得 token，回傳等待的秒數；rate <= 0 時不限流。
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, db_path: str = None):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.db_path = db_path
+        self._tokens = float(self.burst)
+        self._updated_at = time.time()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = 0
+        self._db_ready = False
+        self._stats = {
+            PRIORITY_NAMES[priority]: {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0}
+            for priority in PRIORITY_NAMES
+        }
+        self._stats_lock = threading.Lock()
+
+    def acquire(self, priority: int = None, timeout: float = None) -> float:
+        """
+        取得一個 token
+
+        Args:
+            priority: 優先順序，預設為目前 context 的優先順序
+            timeout: 最多等待的秒數，None 表示一直等
+
+        Returns:
+            等待的秒數
+
+        Raises:
+            RateLimitTimeout: 逾時前沒有取得 token
+        """
+        priority = current_priority() if priority is None else priority
+        if self.rate <= 0:
+            self._record(priority, 0.0)
+            return 0.0
+
+        started = time.monotonic()
+        expires = started + timeout if timeout is not None else None
+        with self._cond:
+            self._seq += 1
+            entry = (priority, self._seq)
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    # 只有排在最前面的呼叫會去拿 token，其餘的等它拿到後被喚醒
+                    delay = None
+                    if self._waiters[0] == entry:
+                        delay = self._take()
+                        if delay <= 0:
+                            break
+                    now = time.monotonic()
+                    if expires is not None:
+                        if now >= expires:
+                            self._record(priority, now - started, timed_out=True)
+                            raise RateLimitTimeout(f"{self.name} 等待 {now - started:.1f} 秒仍未取得配額")
+                        delay = expires - now if delay is None else min(delay, expires - now)
+                    self._cond.wait(delay)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - started
+        self._record(priority, waited)
+        return waited
+
+    def penalize(self, seconds: float) -> None:
+        """供應商回應 429 時暫停整個 bucket"""
+        with self._cond:
+            until = time.time() + seconds
+            self._paused_until = max(self._paused_until, until)
+            self._tokens = 0.0
+            if self.db_path:
+                self._db_update("UPDATE token_buckets SET tokens = 0, paused_until = MAX(paused_until, ?) WHERE name = ?", (until, self.name))
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        """各優先順序的取得次數、等待次數與等待秒數"""
+        with self._stats_lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        for values in stats.values():
+            values["avg_wait_seconds"] = values["wait_seconds"] / values["acquired"] if values["acquired"] else 0.0
+        return {"rate": self.rate, "burst": self.burst, "shared": bool(self.db_path), "waiting": len(self._waiters), "priorities": stats}
+
+    def _record(self, priority: int, waited: float, timed_out: bool = False) -> None:
+        name = PRIORITY_NAMES.get(priority, PRIORITY_NAMES[PRIORITY_BACKGROUND])
+        with self._stats_lock:
+            values = self._stats[name]
+            if timed_out:
+                values["timeouts"] += 1
+                return
+            values["acquired"] += 1
+            if waited > 0.001:
+                values["waited"] += 1
+                values["wait_seconds"] += waited
+                values["max_wait_seconds"] = max(values["max_wait_seconds"], waited)
+
+    def _take(self) -> float:
+        """嘗試取走一個 token，成功回傳 0，否則回傳需要再等的秒數"""
+        if self.db_path:
+            delay = self._take_shared()
+            if delay is not None:
+                return delay
+        return self._take_local()
+
+    def _refill(self, tokens: float, updated_at: float, paused_until: float, now: float) -> Tuple[float, float]:
+        """回傳 (補充後的 token 數, 需要再等的秒數)"""
+        if now < paused_until:
+            return 0.0, paused_until - now
+        tokens = min(float(self.burst), tokens + max(0.0, now - max(updated_at, paused_until)) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+    def _take_local(self) -> float:
+        now = time.time()
+        self._tokens, delay = self._refill(self._tokens, self._updated_at, self._paused_until, now)
+        self._updated_at = now
+        return delay
+
+    def _take_shared(self) -> Optional[float]:
+        try:
+            conn = self._connect()
+            try:
+                # IMMEDIATE 交易讓多個 worker 依序讀寫同一列
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT tokens, updated_at, paused_until FROM token_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                if row is None:
+                    row = (float(self.burst), now, 0.0)
+                tokens, delay = self._refill(row[0], row[1], row[2], now)
+                conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (name, tokens, updated_at, paused_until) VALUES (?, ?, ?, ?)",
+                    (self.name, tokens, now, row[2])
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            return delay
+        except Exception as e:
+            print(f"[TokenBucket ERROR] 讀寫共用限流狀態失敗，改用本機限流: {e}")
+            return None
+
+    def _db_update(self, sql: str, params: Tuple) -> None:
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(sql, params)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[TokenBucket ERROR] 寫入共用限流狀態失敗: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        if not self._db_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, paused_until REAL NOT NULL)"
+            )
+            self._db_ready = True
+        return conn
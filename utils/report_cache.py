@@ -0,0 +1,202 @@
+"""
+完整報告快取
+
+同一支股票、同一分類與時間範圍的報告，在新的價格或新聞出現前內容不會改變。
+快取 key 為 (股票代號, 分類, 時間範圍, 交易日)，交易日換日後自然失效；
+記憶體層以 LRU 淘汰，並可選擇性地寫入磁碟，讓服務重啟後仍可使用。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Hashable, Optional, Tuple
+
+# 台灣時間（無夏令時間）
+TAIPEI_TZ = timezone(timedelta(hours=8))
+# 台股開盤時間，開盤前仍視為前一個交易日
+MARKET_OPEN_HOUR = 9
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "1800"))
+# 磁碟快取目錄，留空則只使用記憶體快取
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "")
+
+# 各分類的預設有效秒數，可用 REPORT_CACHE_CATEGORY_TTL="個股分析=900,盤勢分析=300" 覆寫
+DEFAULT_CATEGORY_TTL = {
+    "個股分析": 1800,
+    "盤勢分析": 600,
+    "選股建議": 1800,
+    "比較分析": 1800,
+    "金融知識詢問": 86400,
+}
+
+def parse_category_ttl(value: str) -> Dict[str, int]:
+    """
+    解析 "分類=秒數,分類=秒數" 格式的設定
+
+    Returns:
+        分類對應有效秒數的字典，格式錯誤的項目會被忽略
+    """
+    ttl = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        category, seconds = item.split("=", 1)
+        try:
+            ttl[category.strip()] = int(seconds.strip())
+        except ValueError:
+            print(f"[ReportCache WARNING] 無法解析的 TTL 設定: {item}")
+    return ttl
+
+def current_trading_date(now: Optional[datetime] = None) -> date:
+    """
+    取得目前報告所對應的交易日
+
+    週末對應到前一個週五；平日開盤前對應到前一個交易日。
+    （不處理國定假日，假日期間頂多多算一次快取失效）
+    """
+    now = now.astimezone(TAIPEI_TZ) if now else datetime.now(TAIPEI_TZ)
+    day = now.date()
+    if now.hour < MARKET_OPEN_HOUR:
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+class ReportCache:
+    """
+    報告快取：記憶體 LRU + 可選的磁碟層
+
+    儲存的內容為可直接重播的 SSE 資料（sections、report、report_complete），
+    不包含任何與單一請求相關的狀態。
+    """
+
+    def __init__(self, max_entries: int = None, default_ttl: int = None,
+                 category_ttl: Dict[str, int] = None, cache_dir: str = None):
+        self.max_entries = max_entries or REPORT_CACHE_SIZE
+        self.default_ttl = default_ttl if default_ttl is not None else REPORT_CACHE_TTL
+        self.category_ttl = dict(DEFAULT_CATEGORY_TTL)
+        self.category_ttl.update(category_ttl if category_ttl is not None
+                                 else parse_category_ttl(os.getenv("REPORT_CACHE_CATEGORY_TTL", "")))
+        self.cache_dir = REPORT_CACHE_DIR if cache_dir is None else cache_dir
+        self._entries: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except Exception as e:
+                print(f"[ReportCache ERROR] 無法建立快取目錄 {self.cache_dir}: {e}")
+                self.cache_dir = ""
+
+    def ttl_for(self, category: str) -> int:
+        """取得分類的有效秒數"""
+        return self.category_ttl.get(category, self.default_ttl)
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        """
+        取得快取的報告
+
+        Returns:
+            快取項目（包含 sections、report、report_complete、created_at），不存在或過期時回傳 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["expires_at"] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is not None and entry["expires_at"] > now:
+                self._remember(key, entry)
+                self.stats["disk_hits"] += 1
+                self.stats["hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: Tuple, category: str, payload: Dict) -> None:
+        """
+        儲存報告
+
+        Args:
+            key: 快取 key
+            category: 問題分類，用來決定有效時間
+            payload: 要重播的內容（sections、report、report_complete）
+        """
+        ttl = self.ttl_for(category)
+        if ttl <= 0:
+            return
+        now = time.time()
+        entry = dict(payload)
+        entry["created_at"] = now
+        entry["expires_at"] = now + ttl
+        with self._lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+        self._write_disk(key, entry)
+
+    def clear(self) -> None:
+        """清除記憶體快取（磁碟檔案保留，過期後自然失效）"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """取得命中率等統計資料"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["disk_enabled"] = bool(self.cache_dir)
+        return stats
+
+    def _remember(self, key: Tuple, entry: Dict) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _disk_path(self, key: Tuple) -> str:
+        digest = hashlib.sha1(json.dumps(list(key), ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"report_{digest}.json")
+
+    def _read_disk(self, key: Tuple) -> Optional[Dict]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry.get("expires_at", 0) <= time.time():
+                os.remove(path)
+                return None
+            return entry
+        except Exception as e:
+            print(f"[ReportCache ERROR] 讀取磁碟快取失敗: {e}")
+            return None
+
+    def _write_disk(self, key: Tuple, entry: Dict) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[ReportCache ERROR] 寫入磁碟快取失敗: {e}")
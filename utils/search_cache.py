@@ -0,0 +1,224 @@
+"""
+搜尋結果快取
+
+相同的搜尋關鍵字（例如「台積電 2330 財報」）幾乎每個同股票的問題都會再查一次，
+每次都是付費且緩慢的 Serper 呼叫。快取以 (query, num, domains) 為 key：
+- 記憶體 LRU：同一個 worker 內最快
+- SQLite：多個 uvicorn worker 共用，服務重啟後仍有效
+- stale-while-revalidate：超過新鮮期但仍在可用期內的結果直接回傳，
+  同時在背景重新查詢並更新快取
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+# 新鮮期：期間內直接使用快取
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "1800"))
+# 可用期：超過新鮮期但未超過可用期時先回傳舊結果，並在背景更新
+SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", "21600"))
+# SQLite 檔案路徑，留空則只使用記憶體快取
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB", "search_cache.sqlite3")
+
+def make_search_key(query: str, num: int, domains: Iterable[str], time_range: Optional[str] = None) -> str:
+    """以 (query, num, domains, 時間範圍) 產生快取 key"""
+    parts = [query.strip(), num, sorted(domains or [])]
+    if time_range:
+        parts.append(time_range)
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class SearchCache:
+    """
+    搜尋結果快取：記憶體 LRU + SQLite
+
+    lookup() 回傳 (結果, 狀態)，狀態為 "hit"、"stale"（已排入背景更新）或 "miss"。
+    """
+
+    def __init__(self, max_entries: int = None, ttl: int = None, stale_ttl: int = None, db_path: str = None):
+        self.max_entries = max_entries or SEARCH_CACHE_SIZE
+        self.ttl = SEARCH_CACHE_TTL if ttl is None else ttl
+        self.stale_ttl = max(self.ttl, SEARCH_CACHE_STALE_TTL if stale_ttl is None else stale_ttl)
+        self.db_path = SEARCH_CACHE_DB if db_path is None else db_path
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search-cache-refresh")
+        self._db_ready = False
+        self._puts = 0
+        self.stats = {"hits": 0, "stale_hits": 0, "db_hits": 0, "misses": 0, "refreshes": 0}
+
+    def lookup(self, key: str, fetch: Callable[[], Optional[Dict]]) -> Tuple[Optional[Dict], str]:
+        """
+        取得快取結果，必要時呼叫 fetch 取得新結果
+
+        Args:
+            key: make_search_key 產生的 key
+            fetch: 查詢函式，成功時回傳要快取的結果，失敗時回傳 None（不快取）
+
+        Returns:
+            (結果, 狀態)
+        """
+        value, state = self.peek(key, refresh=fetch)
+        if state != "miss":
+            return value, state
+
+        value = fetch()
+        if value is not None:
+            self.put(key, value)
+        return value, "miss"
+
+    def peek(self, key: str, refresh: Callable[[], Optional[Dict]] = None) -> Tuple[Optional[Dict], str]:
+        """
+        只查快取、不在未命中時查詢（批次搜尋先挑出未命中的關鍵字時使用）
+
+        Args:
+            key: make_search_key 產生的 key
+            refresh: 過期命中時在背景執行的查詢函式
+
+        Returns:
+            (結果, 狀態)，未命中時為 (None, "miss")
+        """
+        value, fetched_at = self._get(key)
+        if value is not None:
+            age = time.time() - fetched_at
+            if age <= self.ttl:
+                self._count("hits")
+                return value, "hit"
+            if age <= self.stale_ttl:
+                self._count("stale_hits")
+                if refresh is not None:
+                    self._refresh_in_background(key, refresh)
+                return value, "stale"
+
+        self._count("misses")
+        return None, "miss"
+
+    def put(self, key: str, value: Dict, fetched_at: float = None) -> None:
+        """寫入快取（記憶體與 SQLite）"""
+        fetched_at = fetched_at or time.time()
+        with self._lock:
+            self._remember(key, fetched_at, value)
+            self._puts += 1
+            purge = self._puts % 100 == 0
+        self._write_db(key, fetched_at, value, purge)
+
+    def get_stats(self) -> Dict:
+        """取得命中率等統計資料"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """清除記憶體快取"""
+        with self._lock:
+            self._entries.clear()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _get(self, key: str) -> Tuple[Optional[Dict], float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                fetched_at, value = entry
+                return value, fetched_at
+
+        row = self._read_db(key)
+        if row is None:
+            return None, 0
+        fetched_at, value = row
+        with self._lock:
+            self._remember(key, fetched_at, value)
+            self.stats["db_hits"] += 1
+        return value, fetched_at
+
+    def _remember(self, key: str, fetched_at: float, value: Dict) -> None:
+        self._entries[key] = (fetched_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Optional[Dict]]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.stats["refreshes"] += 1
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.put(key, value)
+            except Exception as e:
+                print(f"[SearchCache ERROR] 背景更新失敗: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_executor.submit(refresh)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        if not self._db_ready:
+            # WAL 模式讓多個 worker 可以同時讀取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def _read_db(self, key: str) -> Optional[Tuple[float, Dict]]:
+        try:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT fetched_at, value FROM search_cache WHERE key = ? AND fetched_at >= ?",
+                    (key, time.time() - self.stale_ttl)
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return None
+            return row[0], json.loads(row[1])
+        except Exception as e:
+            print(f"[SearchCache ERROR] 讀取 SQLite 快取失敗: {e}")
+            return None
+
+    def _write_db(self, key: str, fetched_at: float, value: Dict, purge: bool) -> None:
+        try:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, fetched_at, value) VALUES (?, ?, ?)",
+                    (key, fetched_at, json.dumps(value, ensure_ascii=False))
+                )
+                if purge:
+                    conn.execute("DELETE FROM search_cache WHERE fetched_at < ?", (time.time() - self.stale_ttl,))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[SearchCache ERROR] 寫入 SQLite 快取失敗: {e}")
@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import math
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from utils.deadline import Deadline, bind_deadline, current_deadline
+from utils.tracing import current_trace, trace_request
+
+class _Flight:
+    """一個進行中的分析：保存已送出的事件，讓後加入的訂閱者可以重播"""
+
+    def __init__(self, deadline: Optional[Deadline]):
+        self.events: List = []
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Condition()
+        # producer 自己的截止時間，延後到所有訂閱者中最晚的截止時間
+        self.deadline = deadline
+        self.trace_id = ""
+
+    def join(self, deadline: Optional[Deadline]) -> None:
+        """訂閱者加入時延後 producer 的截止時間；沒有截止時間的訂閱者不限制 producer"""
+        if self.deadline is not None:
+            self.deadline.extend(deadline.expires_at if deadline is not None else math.inf)
+
+class SingleFlight:
+    """
+    合併相同 key 的進行中請求
+
+    第一個請求會啟動 producer（async generator），之後相同 key 的請求
+    直接訂閱同一份事件流；後加入者會先收到已送出的事件重播，再接續即時事件。
+    producer 在獨立的 task 中執行，發起者斷線不會影響其他訂閱者；
+    所有訂閱者都離開時才取消 producer。
+
+    producer 不繼承發起者的 context：它有自己的 trace（名稱為 trace_name，
+    訂閱者的 trace 以 single_flight.trace_id 記錄對應的 trace），
+    截止時間則取所有訂閱者中最晚的一個。
+    """
+
+    def __init__(self, trace_name: str = "single_flight"):
+        self.trace_name = trace_name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.stats = {"leaders": 0, "joiners": 0}
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        """檢查 key 是否已有進行中的請求"""
+        return key in self._flights
+
+    async def subscribe(self, key: Hashable, producer_factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """
+        訂閱 key 對應的事件流，不存在時以 producer_factory 建立
+
+        Args:
+            key: 合併用的 key
+            producer_factory: 回傳 async generator 的函式，只有第一個請求會呼叫
+
+        Yields:
+            producer 產生的事件（後加入者會先收到重播）
+        """
+        deadline = current_deadline()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(Deadline(deadline.remaining()) if deadline is not None else None)
+            self._flights[key] = flight
+            # 在空的 context 中建立 task：發起者的 trace 不會隨它斷線而提早寫出，
+            # 後加入者也不會沿用發起者的截止時間
+            flight.task = contextvars.Context().run(asyncio.ensure_future, self._produce(key, flight, producer_factory))
+            self.stats["leaders"] += 1
+            role = "leader"
+        else:
+            flight.join(deadline)
+            self.stats["joiners"] += 1
+            role = "joiner"
+
+        trace = current_trace()
+        if trace is not None:
+            trace.root.set_attribute("single_flight.role", role)
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                async with flight.changed:
+                    while position >= len(flight.events) and not flight.done:
+                        await flight.changed.wait()
+                    pending = flight.events[position:]
+                    finished = flight.done
+                position += len(pending)
+                for event in pending:
+                    yield event
+                if finished and position >= len(flight.events):
+                    break
+        finally:
+            if trace is not None and flight.trace_id:
+                trace.root.set_attribute("single_flight.trace_id", flight.trace_id)
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 沒有人在等這個結果了，停止 producer
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    async def _produce(self, key: Hashable, flight: _Flight, producer_factory: Callable[[], AsyncIterator]):
+        bind_deadline(flight.deadline)
+        try:
+            with trace_request(self.trace_name, key=str(key)) as trace:
+                flight.trace_id = trace.trace_id
+                producer = producer_factory()
+                try:
+                    async for event in producer:
+                        async with flight.changed:
+                            flight.events.append(event)
+                            flight.changed.notify_all()
+                except asyncio.CancelledError:
+                    trace.root.error = "cancelled"
+                finally:
+                    await producer.aclose()
+        except Exception as e:
+            print(f"[SingleFlight ERROR] {key}: {e}")
+        finally:
+            # 完成後立即移除，之後的請求會重新執行（或由報告快取處理）
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
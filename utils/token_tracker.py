@@ -1,9 +1,12 @@
 import json
+import threading
 import time
 from typing import Dict, List, Optional
 from datetime import datetime
 import os
 
+from utils.prompt_budget import node_budget
+
 class TokenTracker:
     """
     OpenAI API Token 使用量追蹤器
@@ -13,6 +16,8 @@ class TokenTracker:
     def __init__(self, log_file: str = "token_usage.json"):
         self.log_file = log_file
         self.usage_log = []
+        # 報告 section 會並行呼叫 LLM，寫入記錄時需要加鎖
+        self._lock = threading.Lock()
         self.load_existing_log()
     
     def load_existing_log(self):
@@ -35,7 +40,12 @@ class TokenTracker:
                        user_input: str = "",
                        stock_id: str = "",
                        success: bool = True,
-                       error_message: str = ""):
+                       error_message: str = "",
+                       cached: bool = False,
+                       saved_tokens: int = 0,
+                       saved_cost: float = 0.0,
+                       estimated_prompt_tokens: int = 0,
+                       cacheable: bool = False):
         """
         記錄一次 API 調用
         
@@ -50,6 +60,11 @@ class TokenTracker:
             stock_id: 股票代號
             success: 是否成功
             error_message: 錯誤訊息
+            cached: 是否由 LLM 回應快取提供（此時 token 與成本為 0）
+            saved_tokens: 快取命中省下的 token 數量
+            saved_cost: 快取命中省下的成本 (美元)
+            estimated_prompt_tokens: 送出前在本機估計的輸入 token 數（0 表示沒有估計）
+            cacheable: 是否查過 LLM 回應快取（命中或未命中）
         """
         record = {
             "timestamp": datetime.now().isoformat(),
@@ -62,13 +77,25 @@ class TokenTracker:
             "user_input": user_input[:200],  # 限制長度
             "stock_id": stock_id,
             "success": success,
-            "error_message": error_message
+            "error_message": error_message,
+            "cached": cached,
+            "cacheable": cacheable or cached,
+            "saved_tokens": saved_tokens,
+            "saved_cost_usd": saved_cost,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "prompt_budget": node_budget(node_name)
         }
         
-        self.usage_log.append(record)
-        self.save_log()
+        with self._lock:
+            self.usage_log.append(record)
+            self.save_log()
         
         # 即時輸出
+        if cached:
+            print(f"🔢 Token 使用記錄: {node_name} | 快取命中 | 省下: {saved_tokens} tokens | ${saved_cost:.4f}")
+            return
+        if estimated_prompt_tokens:
+            print(f"🔢 Token 預估: {node_name} | 估計輸入: {estimated_prompt_tokens} | 實際輸入: {prompt_tokens}")
         print(f"🔢 Token 使用記錄: {node_name} | 輸入: {prompt_tokens} | 輸出: {completion_tokens} | 總計: {total_tokens} | 成本: ${cost:.4f}")
     
     def save_log(self):
@@ -114,6 +141,14 @@ class TokenTracker:
                 "total_tokens": 0,
                 "total_cost": 0.0,
                 "success_rate": 0.0,
+                "cache_hits": 0,
+                "cache_lookups": 0,
+                "cache_hit_rate": 0.0,
+                "saved_tokens": 0,
+                "saved_cost": 0.0,
+                "estimated_prompt_tokens": 0,
+                "estimated_actual_prompt_tokens": 0,
+                "over_budget_calls": 0,
                 "node_breakdown": {}
             }
         
@@ -125,6 +160,17 @@ class TokenTracker:
         total_cost = sum(r["cost_usd"] for r in filtered_log)
         success_calls = sum(1 for r in filtered_log if r["success"])
         success_rate = success_calls / total_calls if total_calls > 0 else 0
+        # 舊的記錄沒有快取欄位
+        cache_hits = sum(1 for r in filtered_log if r.get("cached"))
+        # 查過回應快取的呼叫（命中與未命中），命中率以此為分母
+        cache_lookups = sum(1 for r in filtered_log if _cacheable(r))
+        saved_tokens = sum(r.get("saved_tokens", 0) for r in filtered_log)
+        saved_cost = sum(r.get("saved_cost_usd", 0.0) for r in filtered_log)
+        # 有送出前估計的呼叫：估計值與同一批呼叫的實際輸入 token 數，可比較估計誤差
+        estimated_log = [r for r in filtered_log if r.get("estimated_prompt_tokens")]
+        estimated_prompt_tokens = sum(r["estimated_prompt_tokens"] for r in estimated_log)
+        estimated_actual_prompt_tokens = sum(r["prompt_tokens"] for r in estimated_log)
+        over_budget_calls = sum(1 for r in filtered_log if _over_budget(r))
         
         # 節點細分
         node_breakdown = {}
@@ -136,7 +182,13 @@ class TokenTracker:
                     "prompt_tokens": 0,
                     "completion_tokens": 0,
                     "total_tokens": 0,
-                    "cost": 0.0
+                    "cost": 0.0,
+                    "cache_hits": 0,
+                    "cache_lookups": 0,
+                    "saved_cost": 0.0,
+                    "estimated_prompt_tokens": 0,
+                    "max_prompt_tokens": 0,
+                    "over_budget": 0
                 }
             
             node_breakdown[node]["calls"] += 1
@@ -144,6 +196,12 @@ class TokenTracker:
             node_breakdown[node]["completion_tokens"] += record["completion_tokens"]
             node_breakdown[node]["total_tokens"] += record["total_tokens"]
             node_breakdown[node]["cost"] += record["cost_usd"]
+            node_breakdown[node]["cache_hits"] += 1 if record.get("cached") else 0
+            node_breakdown[node]["cache_lookups"] += 1 if _cacheable(record) else 0
+            node_breakdown[node]["saved_cost"] += record.get("saved_cost_usd", 0.0)
+            node_breakdown[node]["estimated_prompt_tokens"] += record.get("estimated_prompt_tokens", 0)
+            node_breakdown[node]["max_prompt_tokens"] = max(node_breakdown[node]["max_prompt_tokens"], record["prompt_tokens"])
+            node_breakdown[node]["over_budget"] += 1 if _over_budget(record) else 0
         
         return {
             "total_calls": total_calls,
@@ -152,6 +210,14 @@ class TokenTracker:
             "total_tokens": total_tokens,
             "total_cost": total_cost,
             "success_rate": success_rate,
+            "cache_hits": cache_hits,
+            "cache_lookups": cache_lookups,
+            "cache_hit_rate": cache_hits / cache_lookups if cache_lookups else 0.0,
+            "saved_tokens": saved_tokens,
+            "saved_cost": saved_cost,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "estimated_actual_prompt_tokens": estimated_actual_prompt_tokens,
+            "over_budget_calls": over_budget_calls,
             "node_breakdown": node_breakdown
         }
     
@@ -225,6 +291,15 @@ class TokenTracker:
         
         return filename
 
+def _over_budget(record: Dict) -> bool:
+    """實際輸入 token 數超過記錄當時的節點預算"""
+    budget = record.get("prompt_budget", 0)
+    return bool(budget) and record["prompt_tokens"] > budget
+
+def _cacheable(record: Dict) -> bool:
+    """查過回應快取的呼叫；舊的記錄沒有 cacheable 欄位，只有命中可以確定"""
+    return bool(record.get("cacheable", record.get("cached")))
+
 # 全域實例
 token_tracker = TokenTracker()
 
@@ -233,7 +308,8 @@ def track_openai_call(node_name: str,
                      user_input: str = "",
                      stock_id: str = "",
                      success: bool = True,
-                     error_message: str = ""):
+                     error_message: str = "",
+                     cacheable: bool = False):
     """
     追蹤 OpenAI API 調用的便捷函數
     
@@ -244,11 +320,17 @@ def track_openai_call(node_name: str,
         stock_id: 股票代號
         success: 是否成功
         error_message: 錯誤訊息
+        cacheable: 是否查過 LLM 回應快取（此時為未命中）
     """
     try:
+        if getattr(response, "cache_hit", False) or getattr(response, "usage_tracked", False):
+            # LLM 閘道已記錄這次呼叫（快取命中為零成本）
+            return
         if hasattr(response, 'usage'):
             usage = response.usage
             model = response.model if hasattr(response, 'model') else "gpt-3.5-turbo"
+            # LLM 閘道送出前的估計值
+            estimated = getattr(response, "estimated_prompt_tokens", 0)
             
             cost = token_tracker.calculate_cost(
                 model,
@@ -266,7 +348,9 @@ def track_openai_call(node_name: str,
                 user_input=user_input,
                 stock_id=stock_id,
                 success=success,
-                error_message=error_message
+                error_message=error_message,
+                estimated_prompt_tokens=estimated if isinstance(estimated, int) else 0,
+                cacheable=cacheable
             )
         else:
             print(f"⚠️ 無法追蹤 token 使用量: {node_name} - 回應物件缺少 usage 屬性")
@@ -274,6 +358,37 @@ def track_openai_call(node_name: str,
     except Exception as e:
         print(f"❌ Token 追蹤失敗: {e}")
 
+def track_cache_hit(node_name: str, response, user_input: str = "", stock_id: str = ""):
+    """
+    記錄一次 LLM 回應快取命中：token 與成本為 0，另記錄省下的 token 與成本
+
+    Args:
+        node_name: 節點名稱
+        response: 快取的 ChatCompletion（usage 為原始呼叫的用量）
+        user_input: 用戶輸入
+        stock_id: 股票代號
+    """
+    try:
+        usage = response.usage
+        model = response.model if hasattr(response, 'model') else "gpt-3.5-turbo"
+        saved_tokens = usage.total_tokens if usage else 0
+        saved_cost = token_tracker.calculate_cost(model, usage.prompt_tokens, usage.completion_tokens) if usage else 0.0
+        token_tracker.record_api_call(
+            node_name=node_name,
+            model=model,
+            prompt_tokens=0,
+            completion_tokens=0,
+            total_tokens=0,
+            cost=0.0,
+            user_input=user_input,
+            stock_id=stock_id,
+            cached=True,
+            saved_tokens=saved_tokens,
+            saved_cost=saved_cost
+        )
+    except Exception as e:
+        print(f"❌ Token 追蹤失敗: {e}")
+
 # 測試用
 if __name__ == "__main__":
     # 模擬測試
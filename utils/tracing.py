@@ -0,0 +1,194 @@
+"""
+輕量級的請求追蹤
+
+每個請求建立一個 Trace，以 span() 包住各個節點（問題分類、搜尋輪次、
+Serper 呼叫、OpenAI 呼叫、FinLab 資料讀取、報告 section…），記錄巢狀的耗時區段。
+目前的 trace 與 span 存在 contextvars 中，run_blocking / run_sections
+複製 context 時會一併帶到執行緒，沒有 trace 時 span() 不做任何事。
+
+請求結束時，所有 span 以 OpenTelemetry 的 span 欄位格式（JSON Lines）
+寫入輪替的本機檔案，另外提供精簡的時間軸放進最後的 report 事件。
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+# span 輸出檔案，留空則不寫檔
+TRACE_FILE = os.getenv("TRACE_FILE", "trace_spans.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+_trace_logger: Optional[logging.Logger] = None
+_trace_logger_lock = threading.Lock()
+
+class Span:
+    """一個耗時區段"""
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = dict(attributes)
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value) -> None:
+        """補充 span 屬性（例如結果筆數、token 數）"""
+        self.attributes[key] = value
+
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.time()
+        return round((end - self.start) * 1000, 1)
+
+    def to_otel(self) -> Dict:
+        """轉成 OpenTelemetry span 欄位格式"""
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent else "",
+            "name": self.name,
+            "startTimeUnixNano": int(self.start * 1e9),
+            "endTimeUnixNano": int((self.end if self.end is not None else time.time()) * 1e9),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"}
+        }
+
+class Trace:
+    """一個請求的所有 span"""
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.root = Span(self, name, None, attributes)
+        self.spans.append(self.root)
+
+    def start_span(self, name: str, parent: Optional[Span], attributes: Dict) -> Span:
+        span = Span(self, name, parent or self.root, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def timeline(self) -> List[Dict]:
+        """
+        精簡的時間軸，依開始時間排序
+
+        Returns:
+            [{"name", "start_ms"（相對請求開始）, "ms", "depth"}]，尚未結束的 span 以目前時間計算
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [
+            {
+                "name": span.name,
+                "start_ms": round((span.start - self.root.start) * 1000, 1),
+                "ms": span.duration_ms(),
+                "depth": span.depth,
+                **({"error": span.error} if span.error else {})
+            }
+            for span in spans
+        ]
+
+    def finish(self) -> None:
+        """結束根 span 並寫入 trace 檔案"""
+        if self.root.end is None:
+            self.root.end = time.time()
+        export_spans(self)
+
+def _get_trace_logger() -> Optional[logging.Logger]:
+    global _trace_logger
+    if not TRACE_FILE:
+        return None
+    with _trace_logger_lock:
+        if _trace_logger is None:
+            logger = logging.getLogger("stock_analysis.trace")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES,
+                                          backupCount=TRACE_FILE_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            _trace_logger = logger
+    return _trace_logger
+
+def export_spans(trace: Trace) -> None:
+    """把 trace 的所有 span 以 JSON Lines 寫入輪替檔案"""
+    try:
+        logger = _get_trace_logger()
+        if logger is None:
+            return
+        with trace._lock:
+            spans = list(trace.spans)
+        for span in spans:
+            logger.info(json.dumps(span.to_otel(), ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"[tracing ERROR] 寫入 trace 檔案失敗: {e}")
+
+def _reset(var: contextvars.ContextVar, token: contextvars.Token) -> None:
+    # async generator 在別的 context 中被關閉時（例如被 GC 回收）無法 reset，直接略過
+    try:
+        var.reset(token)
+    except ValueError:
+        pass
+
+def current_trace() -> Optional[Trace]:
+    """取得目前 context 的 trace，沒有則回傳 None"""
+    return _current_trace.get()
+
+@contextmanager
+def trace_request(name: str, **attributes):
+    """
+    建立一個請求的 trace 並綁定到目前 context，離開時寫入 trace 檔案
+
+    Yields:
+        Trace 物件
+    """
+    trace = Trace(name, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = trace.root.error or type(e).__name__
+        raise
+    finally:
+        trace.finish()
+        _reset(_current_span, span_token)
+        _reset(_current_trace, trace_token)
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    記錄一個巢狀的耗時區段；沒有 trace 時不做任何事
+
+    Yields:
+        Span 物件（沒有 trace 時為 None）
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = trace.start_span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = str(e) or type(e).__name__
+        raise
+    finally:
+        current.end = time.time()
+        _reset(_current_span, token)